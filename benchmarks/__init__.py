@@ -0,0 +1,7 @@
+# -*- coding: utf-8 -*-
+# benchmarks/__init__.py
+
+"""
+Benchmarks for the rprename package. Run them from the project root,
+eg: `python -m benchmarks.bench_pool_scaling`.
+"""
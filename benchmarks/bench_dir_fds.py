@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_dir_fds.py
+
+"""
+Compares renaming by full path with renaming relative to cached
+directory fds (`RenameEngine(..., dir_fds = True)`), for files at
+several depths below the base directory.
+
+Besides the time taken, reports an estimate of the number of path
+components the kernel has to resolve (`estimated_lookups`), computed
+from the paths, not measured: every component of both paths per rename
+by full path, versus both bare names per rename plus one full path per
+directory opened with directory fds. To measure the system calls made,
+run the benchmark under `strace -c -f` or `perf stat`.
+
+    python -m benchmarks.bench_dir_fds --files 20000 --depths 1 8 32
+"""
+
+import argparse
+import os
+import time
+from pathlib import Path
+
+from .common import bench_dir, make_files, report
+
+
+def make_tree(base_dir: Path, depth: int, dirs_count: int, files_count: int) -> list[Path]:
+    """
+    Creates `dirs_count` directories, `depth` levels below `base_dir`,
+    and spreads `files_count` files across them.
+    """
+    files = []
+    per_dir = files_count // dirs_count
+    for i in range(dirs_count):
+        dir_path = base_dir.joinpath(f'd{i}', *(f'level{level}' for level in range(1, depth)))
+        files.extend(make_files(dir_path, per_dir))
+    return files
+#:
+
+def path_lookups(path: Path) -> int:
+    """Estimated number of components the kernel resolves in `path`."""
+    return len(Path(os.path.abspath(path)).parts)
+#:
+
+def run(
+        files_count: int,
+        dirs_count: int,
+        depth: int,
+        dir_fds: bool,
+        base_dir: str | None,
+) -> tuple[float, int]:
+    from rprename.engine import RenameEngine
+
+    with bench_dir(base_dir) as dir_path:
+        files = make_tree(dir_path, depth, dirs_count, files_count)
+        engine = RenameEngine('renamed', dir_fds = dir_fds)
+        plan = engine.plan(files)
+        steps = list(plan.steps)
+        if dir_fds:
+            lookups = 2 * len(steps) + sum(
+                path_lookups(dir_path) for dir_path in {step.src.parent for step in steps}
+            )
+        else:
+            lookups = sum(path_lookups(step.src) + path_lookups(step.dst) for step in steps)
+        start = time.perf_counter()
+        engine.run(steps)
+        elapsed = time.perf_counter() - start
+        engine.close()
+    return elapsed, lookups
+#:
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('--files', type = int, default = 10_000)
+    parser.add_argument('--dirs', type = int, default = 16)
+    parser.add_argument('--depths', type = int, nargs = '+', default = [1, 8, 32])
+    parser.add_argument('--dir', default = None, help = 'base directory (default: system temp dir)')
+    args = parser.parse_args()
+
+    for depth in args.depths:
+        for dir_fds in (False, True):
+            elapsed, lookups = run(args.files, args.dirs, depth, dir_fds, args.dir)
+            report(
+                bench = 'dir_fds',
+                files = args.files,
+                dirs = args.dirs,
+                depth = depth,
+                dir_fds = dir_fds,
+                seconds = round(elapsed, 4),
+                files_per_sec = round(args.files / elapsed, 1),
+                estimated_lookups = lookups,
+            )
+#:
+
+if __name__ == '__main__':
+    main()
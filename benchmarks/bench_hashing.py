@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_hashing.py
+
+"""
+Measures content hashing (see `rprename/hashing.py`) on a folder of
+files of random sizes, a fraction of them duplicates:
+
+    hash_all        digests of every file (what `{hash}` needs), with
+                    an empty cache
+    hash_all_again  the same, with the digests in the on-disk cache
+    duplicates      `find_duplicates` with an empty cache (only the
+                    files whose sizes collide are hashed)
+
+The cache is a scratch database, not the user's one.
+
+    python -m benchmarks.bench_hashing
+    python -m benchmarks.bench_hashing --files 20000 --max-size 8000000 --dir /var/tmp
+"""
+
+import argparse
+import os
+import random
+import time
+from pathlib import Path
+
+from .common import bench_dir, report
+
+
+def make_contents(dir_path: Path, count: int, max_size: int, duplicates: float) -> list[Path]:
+    rng = random.Random(42)
+    dir_path.mkdir(parents = True, exist_ok = True)
+    files = []
+    for i in range(count):
+        file = dir_path / f'file{i:07}.bin'
+        if files and rng.random() < duplicates:
+            file.write_bytes(rng.choice(files).read_bytes())
+        else:
+            file.write_bytes(os.urandom(rng.randint(1, max_size)))
+        files.append(file)
+    return files
+#:
+
+def main():
+    from rprename.hashing import FileHasher, HashCache
+
+    parser = argparse.ArgumentParser(
+        description = __doc__,
+        formatter_class = argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--files', type = int, default = 10_000)
+    parser.add_argument('--max-size', type = int, default = 1_000_000, help = 'bytes')
+    parser.add_argument('--duplicates', type = float, default = 0.05, help = 'fraction')
+    parser.add_argument('--dir', default = None, help = 'base directory')
+    args = parser.parse_args()
+
+    with bench_dir(args.dir) as dir_path:
+        files = make_contents(dir_path / 'files', args.files, args.max_size, args.duplicates)
+        total_bytes = sum(file.stat().st_size for file in files)
+
+        def run_hash_all(cache_name: str) -> float:
+            hasher = FileHasher(HashCache(dir_path / cache_name))
+            start = time.perf_counter()
+            hasher.digests(files)
+            elapsed = time.perf_counter() - start
+            hasher.cache.close()
+            return elapsed
+        #:
+        def run_duplicates() -> float:
+            hasher = FileHasher(HashCache(dir_path / 'duplicates.sqlite3'))
+            start = time.perf_counter()
+            hasher.find_duplicates(files)
+            elapsed = time.perf_counter() - start
+            hasher.cache.close()
+            return elapsed
+        #:
+        for run_name, run in (
+                ('hash_all', lambda: run_hash_all('all.sqlite3')),
+                ('hash_all_again', lambda: run_hash_all('all.sqlite3')),
+                ('duplicates', run_duplicates),
+        ):
+            elapsed = run()
+            report(
+                bench = 'hashing',
+                files = args.files,
+                mb = round(total_bytes / 2**20, 1),
+                run = run_name,
+                seconds = round(elapsed, 4),
+                files_per_sec = round(args.files / elapsed, 1),
+            )
+#:
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_journal.py
+
+"""
+Measures the cost of the rename journal: renames without a journal,
+with a journal committing every rename (one fsync per file), and with
+group commits of several sizes.
+
+    python -m benchmarks.bench_journal --files 20000 --groups 1 100 1000
+    python -m benchmarks.bench_journal --dir /mnt/disk/tmp
+"""
+
+import argparse
+import time
+
+from .common import bench_dir, make_files, report
+
+
+def run(files_count: int, group_size: int | None, base_dir: str | None) -> float:
+    """
+    Renames `files_count` files with `RenameEngine.run` and returns the
+    time taken. With `group_size` None, no journal is written.
+    """
+    from rprename.engine import RenameEngine
+    from rprename.journal import RenameJournal
+
+    with bench_dir(base_dir) as dir_path:
+        files = make_files(dir_path / 'files', files_count)
+        engine = RenameEngine('renamed')
+        start = time.perf_counter()
+        plan = engine.plan(files)
+        if group_size is None:
+            engine.run(plan.steps)
+        else:
+            journal = RenameJournal.create(
+                plan.steps,
+                dir_path / 'journals',
+                group_size = group_size,
+                group_interval = float('inf'),
+            )
+            engine.run(plan.steps, lambda _, new_file: journal.record_done(new_file))
+            journal.close(completed = True)
+        return time.perf_counter() - start
+#:
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('--files', type = int, default = 10_000)
+    parser.add_argument('--groups', type = int, nargs = '+', default = [1, 100, 1000])
+    parser.add_argument('--dir', default = None, help = 'base directory (default: system temp dir)')
+    args = parser.parse_args()
+
+    baseline = run(args.files, None, args.dir)
+    report(
+        bench = 'journal',
+        files = args.files,
+        group_size = None,
+        seconds = round(baseline, 4),
+        files_per_sec = round(args.files / baseline, 1),
+    )
+    for group_size in args.groups:
+        elapsed = run(args.files, group_size, args.dir)
+        report(
+            bench = 'journal',
+            files = args.files,
+            group_size = group_size,
+            seconds = round(elapsed, 4),
+            files_per_sec = round(args.files / elapsed, 1),
+            overhead_percent = round(100 * (elapsed - baseline) / baseline, 1),
+        )
+#:
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_metadata.py
+
+"""
+Measures how fast the `{taken}` and `{camera}` template fields read the
+EXIF data of a folder of photos: the first planning (`cold`, which
+reads the headers of the files) and a second one (`warm`, served by the
+metadata cache), against reading every whole file (`whole_file`, what
+an EXIF library handed the file contents would need).
+
+The photos are synthetic JPEGs (an EXIF block followed by `--size`
+bytes of filler). Drop the page cache between runs (as root: `echo 3 >
+/proc/sys/vm/drop_caches`) to measure cold reads from the disk.
+
+    python -m benchmarks.bench_metadata
+    python -m benchmarks.bench_metadata --files 50000 --size 4000000 --dir /var/tmp
+"""
+
+import argparse
+import struct
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from .common import bench_dir, report
+
+
+TEMPLATE = '{taken:%Y%m%d_%H%M%S}_{camera|lower}_{n:auto}{ext|lower}'
+CAMERAS = ('Canon EOS R6', 'NIKON D850', 'iPhone 15 Pro', 'ILCE-7M4')
+
+
+def exif_block(taken: datetime, camera: str) -> bytes:
+    """
+    A big-endian APP1 EXIF segment with the camera model (in IFD0) and
+    the capture time (in the EXIF IFD).
+    """
+    model = camera.encode('ascii') + b'\x00'
+    date_time = taken.strftime('%Y:%m:%d %H:%M:%S').encode('ascii') + b'\x00'
+    ifd0_offset = 8
+    exif_ifd_offset = ifd0_offset + 2 + 2 * 12 + 4
+    data_offset = exif_ifd_offset + 2 + 12 + 4
+    ifd0 = struct.pack('>H', 2) + struct.pack(
+        '>HHII', 0x0110, 2, len(model), data_offset,
+    ) + struct.pack('>HHII', 0x8769, 4, 1, exif_ifd_offset) + struct.pack('>I', 0)
+    exif_ifd = struct.pack('>H', 1) + struct.pack(
+        '>HHII', 0x9003, 2, len(date_time), data_offset + len(model),
+    ) + struct.pack('>I', 0)
+    tiff = b'MM' + struct.pack('>HI', 42, ifd0_offset) + ifd0 + exif_ifd + model + date_time
+    payload = b'Exif\x00\x00' + tiff
+    return b'\xff\xe1' + struct.pack('>H', len(payload) + 2) + payload
+#:
+
+def make_photos(dir_path: Path, count: int, size: int) -> list[Path]:
+    start = datetime(2024, 7, 1, 9, 0, 0)
+    filler = b'\xff\xda' + bytes(max(size - 2, 0))
+    files = []
+    for i in range(count):
+        file = dir_path / f'IMG_{i:07}.JPG'
+        block = exif_block(start + timedelta(seconds = 7 * i), CAMERAS[i % len(CAMERAS)])
+        file.write_bytes(b'\xff\xd8' + block + filler + b'\xff\xd9')
+        files.append(file)
+    return files
+#:
+
+def run_whole_file(files: list[Path]) -> float:
+    start = time.perf_counter()
+    for file in files:
+        file.read_bytes()
+    return time.perf_counter() - start
+#:
+
+def run_template(files: list[Path]) -> float:
+    from rprename.naming import NameTemplate
+
+    start = time.perf_counter()
+    NameTemplate(TEMPLATE).names(files)
+    return time.perf_counter() - start
+#:
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = __doc__,
+        formatter_class = argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--files', type = int, default = 50_000)
+    parser.add_argument('--size', type = int, default = 100_000, help = 'bytes per photo')
+    parser.add_argument('--dir', default = None, help = 'base directory')
+    args = parser.parse_args()
+
+    with bench_dir(args.dir) as dir_path:
+        files = make_photos(dir_path, args.files, args.size)
+        for run_name, run in (
+                ('cold', run_template),
+                ('warm', run_template),
+                ('whole_file', run_whole_file),
+        ):
+            elapsed = run(files)
+            report(
+                bench = 'metadata',
+                files = args.files,
+                size = args.size,
+                run = run_name,
+                seconds = round(elapsed, 4),
+                files_per_sec = round(args.files / elapsed, 1),
+            )
+#:
+
+if __name__ == '__main__':
+    main()
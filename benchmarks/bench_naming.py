@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_naming.py
+
+"""
+Measures how fast `NameTemplate.names` generates the names of a batch,
+for several templates, against the per-file f-string that the engine
+used before templates (`baseline`). Paths are only built in memory, so
+templates with `{mtime}` (which stat the files) aren't measured.
+
+`pathlib` only parses a path (into its parts, for `name`, `suffix`,
+...) the first time they are needed, and that costs more than naming
+the file. So paths are parsed before each run, and that time is
+reported apart (`parse_seconds`): `seconds` only measures generating
+the names.
+
+    python -m benchmarks.bench_naming
+    python -m benchmarks.bench_naming --files 1000000 --templates 'img_{n:auto}{ext}'
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from .common import report
+
+
+DEFAULT_TEMPLATES = (
+    'photo_{n}{ext}',
+    'photo_{n:auto}{ext|lower}',
+    '{date:%Y-%m-%d}_{n:auto}{ext}',
+    '{stem|lower}_{n:4}{ext}',
+    '{stem}_{dn:auto}{ext}',
+)
+
+
+def make_paths(files_count: int, dirs_count: int) -> list[Path]:
+    return [
+        Path(f'/photos/dir{i % dirs_count}/IMG_{i:07}.JPG')
+        for i in range(files_count)
+    ]
+#:
+
+def parse_paths(files: list[Path]) -> float:
+    start = time.perf_counter()
+    for file in files:
+        # Parses the path and caches its string and parts
+        file.name
+        str(file)
+    return time.perf_counter() - start
+#:
+
+def run_baseline(files: list[Path]) -> float:
+    start = time.perf_counter()
+    [f'photo_{file_number}{file.suffix}' for file_number, file in enumerate(files, 1)]
+    return time.perf_counter() - start
+#:
+
+def run_template(files: list[Path], template: str) -> float:
+    from rprename.naming import NameTemplate
+
+    start = time.perf_counter()
+    NameTemplate(template).names(files)
+    return time.perf_counter() - start
+#:
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = __doc__,
+        formatter_class = argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--files', type = int, default = 1_000_000)
+    parser.add_argument('--dirs', type = int, default = 100)
+    parser.add_argument('--templates', nargs = '+', default = list(DEFAULT_TEMPLATES))
+    args = parser.parse_args()
+
+    runs = [('baseline', run_baseline)] + [
+        (template, lambda files, template = template: run_template(files, template))
+        for template in args.templates
+    ]
+    for template, run in runs:
+        # Fresh paths for each run, so that no run profits from the
+        # values cached by pathlib in a previous one
+        files = make_paths(args.files, args.dirs)
+        parse_elapsed = parse_paths(files)
+        elapsed = run(files)
+        report(
+            bench = 'naming',
+            files = args.files,
+            dirs = args.dirs,
+            template = template,
+            parse_seconds = round(parse_elapsed, 4),
+            seconds = round(elapsed, 4),
+            names_per_sec = round(args.files / elapsed, 1),
+        )
+#:
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_pool_scaling.py
+
+"""
+Measures how PooledRenamer scales with the number of pool threads.
+
+    python -m benchmarks.bench_pool_scaling --files 100000 --threads 1 2 4 8
+"""
+
+import argparse
+import os
+import time
+
+from .common import bench_dir, make_files, report, use_offscreen_qpa
+
+
+def run(files_count: int, threads: int, base_dir: str | None) -> float:
+    from PySide6.QtCore import QCoreApplication, QThreadPool
+    from rprename.rename import PooledRenamer
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    with bench_dir(base_dir) as dir_path:
+        files = make_files(dir_path, files_count)
+        pool = QThreadPool()
+        pool.setMaxThreadCount(threads)
+        renamer = PooledRenamer(files, 'renamed', pool = pool, onFinished = app.quit)
+        start = time.perf_counter()
+        renamer.start()
+        app.exec()
+        elapsed = time.perf_counter() - start
+        pool.waitForDone()
+    return elapsed
+#:
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('--files', type = int, default = 10_000)
+    parser.add_argument('--threads', type = int, nargs = '+', default = [1, 2, 4, 8])
+    parser.add_argument('--dir', default = None, help = 'base directory (default: system temp dir)')
+    args = parser.parse_args()
+
+    use_offscreen_qpa()
+    for threads in args.threads:
+        elapsed = run(args.files, threads, args.dir)
+        report(
+            bench = 'pool_scaling',
+            files = args.files,
+            threads = threads,
+            cpus = os.cpu_count(),
+            seconds = round(elapsed, 4),
+            files_per_sec = round(args.files / elapsed, 1),
+        )
+#:
+
+if __name__ == '__main__':
+    main()
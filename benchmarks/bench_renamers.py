@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_renamers.py
+
+"""
+Compares SyncRenamer, ThreadedRenamer and AsyncRenamer (unthrottled),
+offscreen, on a tmpfs and on a disk-backed directory.
+
+Each run happens in a fresh interpreter, so that peak RSS is measured
+per run, and reports (as a JSON line):
+
+    files_per_sec       files renamed per second (file creation excluded)
+    latency_p50_us      per-file rename latency (time spent inside the
+    latency_p99_us        engine rename call), percentiles
+    gui_busy_s          CPU time of the GUI thread (where the Qt event
+                        loop, and the asyncio loop for AsyncRenamer, run)
+    loop_lag_max_ms     how late a 5 ms timer in the GUI thread fired,
+    loop_lag_p99_ms       ie, how long the GUI would freeze
+    peak_rss_mb         peak resident memory of the run
+
+    python -m benchmarks.bench_renamers
+    python -m benchmarks.bench_renamers --files 1000 100000 --renamers async
+    python -m benchmarks.bench_renamers --files 1000000 --dirs /mnt/ssd/tmp
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from array import array
+
+from .common import bench_dir, make_files, report, use_offscreen_qpa
+
+
+RENAMERS = ('sync', 'threaded', 'async')
+DEFAULT_DIRS = ('/dev/shm', '/var/tmp')
+
+# Interval of the timer that measures the event loop lag
+HEARTBEAT_INTERVAL_MS = 5
+
+
+def run(renamer_name: str, files_count: int, base_dir: str, concurrency: int) -> dict:
+    """
+    Runs one benchmark in this process and returns the measures.
+    """
+    use_offscreen_qpa()
+    from PySide6.QtCore import QMetaObject, Qt, QTimer
+    from PySide6.QtWidgets import QApplication
+    from rprename.engine import RenameEngine
+    from rprename.rename import AsyncRenamer, SyncRenamer, ThreadedRenamer
+
+    app = QApplication.instance() or QApplication([])
+
+    # Per-file latencies, from every thread that renames
+    latencies = array('d')
+    unthrottled_rename = RenameEngine.unthrottled_rename
+    def timed_rename(engine, file, new_file):
+        start = time.perf_counter()
+        unthrottled_rename(engine, file, new_file)
+        latencies.append(time.perf_counter() - start)
+    RenameEngine.unthrottled_rename = timed_rename
+
+    lags = array('d')
+    last_beat = time.perf_counter()
+    def heartbeat():
+        nonlocal last_beat
+        now = time.perf_counter()
+        lags.append(max(now - last_beat - HEARTBEAT_INTERVAL_MS / 1000, 0))
+        last_beat = now
+    timer = QTimer()
+    timer.setInterval(HEARTBEAT_INTERVAL_MS)
+    timer.timeout.connect(heartbeat)
+
+    with bench_dir(base_dir) as dir_path:
+        files = make_files(dir_path, files_count)
+        # `finished` may be emitted from a worker thread, and PySide may
+        # call a plain app.quit right there. QGuiApplication.quit then
+        # waits for the GUI thread while holding the GIL, which
+        # deadlocks if the GUI thread is waiting for the GIL (eg, to run
+        # the heartbeat). So the quit is posted to the GUI thread.
+        quit_app = lambda: QMetaObject.invokeMethod(app, 'quit', Qt.QueuedConnection)
+        kargs = dict(files = files, prefix = 'renamed', onFinished = quit_app)
+
+        busy_start = time.thread_time()
+        start = last_beat = time.perf_counter()
+        timer.start()
+        if renamer_name == 'sync':
+            renamer = SyncRenamer(**kargs)
+            # Like the GUI, rename from a slot, blocking the event loop
+            QTimer.singleShot(0, renamer.rename_files)
+            app.exec()
+        elif renamer_name == 'threaded':
+            renamer = ThreadedRenamer(**kargs)
+            renamer.start()
+            app.exec()
+        elif renamer_name == 'async':
+            import asyncio
+            import qasync
+            kargs.pop('onFinished')
+            renamer = AsyncRenamer(**kargs, concurrency = concurrency)
+            loop = qasync.QEventLoop(app)
+            asyncio.set_event_loop(loop)
+            with loop:
+                loop.run_until_complete(renamer.rename_files())
+        else:
+            raise ValueError(f'Unknown renamer: {renamer_name}')
+        elapsed = time.perf_counter() - start
+        busy = time.thread_time() - busy_start
+        timer.stop()
+        heartbeat()
+
+    sorted_latencies = sorted(latencies)
+    sorted_lags = sorted(lags)
+    return dict(
+        seconds = round(elapsed, 4),
+        files_per_sec = round(files_count / elapsed, 1),
+        latency_p50_us = round(_percentile(sorted_latencies, 50) * 1e6, 1),
+        latency_p99_us = round(_percentile(sorted_latencies, 99) * 1e6, 1),
+        gui_busy_s = round(busy, 4),
+        loop_lag_max_ms = round(sorted_lags[-1] * 1000, 2),
+        loop_lag_p99_ms = round(_percentile(sorted_lags, 99) * 1000, 2),
+        peak_rss_mb = round(_peak_rss_bytes() / 2**20, 1),
+    )
+#:
+
+def _percentile(sorted_values, percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(round(percent / 100 * (len(sorted_values) - 1)), len(sorted_values) - 1)
+    return sorted_values[index]
+#:
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+#:
+
+def _filesystem_type(path: str) -> str:
+    """The type of the filesystem of `path` (Linux only)."""
+    try:
+        with open('/proc/mounts') as mounts:
+            entries = [line.split() for line in mounts]
+    except OSError:
+        return 'unknown'
+    real_path = os.path.realpath(path)
+    best = ('', 'unknown')
+    for entry in entries:
+        mount_point, fs_type = entry[1], entry[2]
+        if (
+                os.path.commonpath([real_path, mount_point]) == mount_point
+                and len(mount_point) > len(best[0])
+        ):
+            best = (mount_point, fs_type)
+    return best[1]
+#:
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = __doc__,
+        formatter_class = argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--files', type = int, nargs = '+', default = [1_000, 100_000, 1_000_000])
+    parser.add_argument('--renamers', nargs = '+', choices = RENAMERS, default = list(RENAMERS))
+    parser.add_argument(
+        '--dirs', nargs = '+', default = None,
+        help = f'base directories, eg, a tmpfs and a disk (default: {" ".join(DEFAULT_DIRS)})',
+    )
+    parser.add_argument('--concurrency', type = int, default = 8, help = 'for AsyncRenamer')
+    parser.add_argument('--timeout', type = float, default = None, help = 'seconds per run')
+    parser.add_argument('--worker', action = 'store_true', help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        # Single run, in a child process
+        result = run(args.renamers[0], args.files[0], args.dirs[0], args.concurrency)
+        print(json.dumps(result), flush = True)
+        # Skip the interpreter teardown, which may crash with qasync
+        os._exit(0)
+
+    from rprename import __version__
+    dirs = args.dirs or [path for path in DEFAULT_DIRS if os.path.isdir(path)]
+    for base_dir in dirs:
+        for files_count in args.files:
+            for renamer_name in args.renamers:
+                fields = dict(
+                    bench = 'renamers',
+                    version = __version__,
+                    python = platform.python_version(),
+                    renamer = renamer_name,
+                    files = files_count,
+                    dir = base_dir,
+                    fs = _filesystem_type(base_dir),
+                )
+                try:
+                    completed = subprocess.run(
+                        [
+                            sys.executable, '-m', 'benchmarks.bench_renamers', '--worker',
+                            '--renamers', renamer_name,
+                            '--files', str(files_count),
+                            '--dirs', base_dir,
+                            '--concurrency', str(args.concurrency),
+                        ],
+                        capture_output = True,
+                        text = True,
+                        timeout = args.timeout,
+                    )
+                except subprocess.TimeoutExpired:
+                    report(**fields, error = 'timeout')
+                    continue
+                if completed.returncode != 0:
+                    error_lines = completed.stderr.strip().splitlines()
+                    report(**fields, error = error_lines[-1] if error_lines else completed.returncode)
+                    continue
+                report(**fields, **json.loads(completed.stdout.strip().splitlines()[-1]))
+#:
+
+if __name__ == '__main__':
+    main()
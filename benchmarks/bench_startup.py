@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_startup.py
+
+"""
+Measures the cost of importing `rprename.views` (which loads the UI
+module) in a fresh interpreter, with a cold UI cache (first launch),
+a warm one, and after touching the '.ui' file (eg, after a git 
+checkout). On Linux the cache goes to a scratch XDG_CACHE_HOME.
+
+    python -m benchmarks.bench_startup --runs 10
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .common import report, use_offscreen_qpa
+
+
+UI_FILE_PATH = Path(__file__).parent.parent / 'rprename' / 'ui' / 'window.ui'
+
+
+def time_import(env: dict, runs: int) -> list[float]:
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(
+            [sys.executable, '-c', 'import rprename.views'],
+            env = env,
+            check = True,
+            capture_output = True,
+        )
+        times.append(time.perf_counter() - start)
+    return times
+#:
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__)
+    parser.add_argument('--runs', type = int, default = 10)
+    args = parser.parse_args()
+
+    use_offscreen_qpa()
+    cache_home = tempfile.mkdtemp(prefix = 'rprename-bench-cache-')
+    env = dict(os.environ, XDG_CACHE_HOME = cache_home)
+    try:
+        results = {
+            'interpreter': None,
+            'cold': time_import(env, 1),
+            'warm': time_import(env, args.runs),
+        }
+        os.utime(UI_FILE_PATH)
+        results['touched'] = time_import(env, 1)
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'pass'], check = True)
+        results['interpreter'] = [time.perf_counter() - start]
+        for case, times in results.items():
+            report(
+                bench = 'startup',
+                case = case,
+                runs = len(times),
+                min_ms = round(min(times) * 1000, 1),
+                median_ms = round(sorted(times)[len(times) // 2] * 1000, 1),
+            )
+    finally:
+        shutil.rmtree(cache_home, ignore_errors = True)
+#:
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# benchmarks/bench_validation.py
+
+"""
+Measures how fast the planned targets of a batch are validated (see
+`PathValidator` in `rprename/fsutils.py`), half of them existing files
+and half new names, spread over `--dirs` directories:
+
+    per_file    the checks `utils.valid_path_for_file` used to make for
+                each path (one `stat` per predicate, and a temporary
+                file for each writability check)
+    batch       `fsutils.validate_paths` (one `lstat` per path, each
+                directory looked at once)
+
+Both check that the paths are writable.
+
+    python -m benchmarks.bench_validation
+    python -m benchmarks.bench_validation --files 100000 --dirs 10 --dir /var/tmp
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+from .common import bench_dir, make_files, report
+
+
+def make_targets(dir_path: Path, count: int, dirs: int) -> list[Path]:
+    targets = []
+    per_dir = count // dirs
+    for d in range(dirs):
+        sub_dir = dir_path / f'dir{d}'
+        targets.extend(make_files(sub_dir, per_dir // 2))
+        targets.extend(sub_dir / f'new{i}.txt' for i in range(per_dir - per_dir // 2))
+    return targets
+#:
+
+def run_per_file(targets: list[Path]) -> float:
+    from rprename.utils import is_special_entry, is_writable
+
+    start = time.perf_counter()
+    for path in targets:
+        (
+                not is_special_entry(path)
+            and not path.is_dir()
+            and path.parent.exists()
+            and is_writable(path)
+        )
+    return time.perf_counter() - start
+#:
+
+def run_batch(targets: list[Path]) -> float:
+    from rprename.fsutils import validate_paths
+
+    start = time.perf_counter()
+    validate_paths(targets, check_w = True)
+    return time.perf_counter() - start
+#:
+
+def main():
+    parser = argparse.ArgumentParser(
+        description = __doc__,
+        formatter_class = argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('--files', type = int, default = 20_000)
+    parser.add_argument('--dirs', type = int, default = 10)
+    parser.add_argument('--dir', default = None, help = 'base directory')
+    args = parser.parse_args()
+
+    with bench_dir(args.dir) as dir_path:
+        targets = make_targets(dir_path, args.files, args.dirs)
+        for run_name, run in (
+                ('per_file', run_per_file),
+                ('batch', run_batch),
+        ):
+            elapsed = run(targets)
+            report(
+                bench = 'validation',
+                files = len(targets),
+                dirs = args.dirs,
+                run = run_name,
+                seconds = round(elapsed, 4),
+                files_per_sec = round(len(targets) / elapsed, 1),
+            )
+#:
+
+if __name__ == '__main__':
+    main()
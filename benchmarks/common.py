@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# benchmarks/common.py
+
+"""
+Helpers shared by the benchmarks.
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+
+
+def make_files(dir_path: Path, count: int, suffix = '.txt') -> list[Path]:
+    dir_path.mkdir(parents = True, exist_ok = True)
+    files = [dir_path / f'file{i}{suffix}' for i in range(count)]
+    for file in files:
+        file.touch()
+    return files
+#:
+
+@contextmanager
+def bench_dir(base_dir: str | None = None):
+    """
+    Creates (and removes at the end) a scratch directory inside
+    `base_dir` (eg, a tmpfs mount or a disk-backed directory).
+    """
+    path = Path(tempfile.mkdtemp(prefix = 'rprename-bench-', dir = base_dir))
+    try:
+        yield path
+    finally:
+        shutil.rmtree(path, ignore_errors = True)
+#:
+
+def report(**fields):
+    """
+    Writes one benchmark result as a JSON line to stdout.
+    """
+    print(json.dumps(fields), file = sys.stdout, flush = True)
+#:
+
+def use_offscreen_qpa():
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+#:
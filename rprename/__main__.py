@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+# rprename/__main__.py
+
+"""This module runs the RP Renamer command-line interface."""
+
+from .cli import main
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,420 @@
+# -*- coding: utf-8 -*-
+# rprename/cli.py
+
+"""
+This module provides the RP Renamer command-line interface. It only
+uses the Qt-free rename engine, so it never imports PySide6 and can run
+in cron jobs or containers:
+
+    python -m rprename rename -p vacation_ photos/*.jpg
+    python -m rprename rename -p img_ --glob 'photos/**/*.png'
+    python -m rprename rename -p img_ -t /mnt/backup/photos photos/*.jpg
+    python -m rprename rename -T '{date}_{n:auto}{ext|lower}' photos/*.JPG
+    python -m rprename rename -T 'img_{hash:12}{ext}' --duplicates abort photos/*
+    python -m rprename rename -T '{n:auto}_{stem}{ext}' --sort taken photos/*
+    python -m rprename rename -T '{taken:%Y%m%d}{ext}' --unique photos/*
+    find photos -name '*.jpg' -print0 | python -m rprename rename -p img_ -0
+    python -m rprename resume
+"""
+
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Iterable
+
+from . import __version__
+from .engine import OnRenamed, ProcessPoolRun, RenameEngine
+from .fsutils import DirectoryIndex
+from .journal import JournalError, RenameJournal, default_journal_dir, list_journals
+from .naming import NameTemplate, TemplateError
+from .ordering import ORDERINGS, FileOrdering
+from .planner import PlanError, RenamePlan
+from .throttle import FixedDelay, Throttle, TokenBucket, Unthrottled
+
+
+__all__ = [
+    'main',
+]
+
+
+# Exit codes
+PLAN_ERROR_CODE = 1
+JOURNAL_ERROR_CODE = 2
+RENAME_ERROR_CODE = 4
+DUPLICATES_CODE = 8
+
+# Seconds between checks of the progress of a process pool
+PROCESS_POOL_POLL_INTERVAL = 0.1
+
+
+def main(args: list[str] | None = None):
+    parser = _build_parser()
+    parsed_args = parser.parse_args(args)
+    sys.exit(parsed_args.func(parsed_args))
+#:
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog = 'rprename',
+        description = 'Rename multiple files (headless version of RP Renamer).',
+    )
+    parser.add_argument('--version', action = 'version', version = __version__)
+    subparsers = parser.add_subparsers(required = True, metavar = 'command')
+
+    rename_parser = subparsers.add_parser(
+        'rename',
+        help = 'rename files to PREFIX followed by a sequential number, or with a TEMPLATE',
+    )
+    rename_parser.add_argument('files', nargs = '*', type = Path, help = 'files to rename')
+    naming_group = rename_parser.add_mutually_exclusive_group(required = True)
+    naming_group.add_argument(
+        '-p', '--prefix', type = _prefix, help = 'new file name prefix',
+    )
+    naming_group.add_argument(
+        '-T', '--template', type = _name_template,
+        help = (
+            "new file name template, eg, '{date}_{stem|lower}_{n:auto}{ext}' "
+            "(fields: n, dn, stem, ext, date, mtime, taken, camera, hash; "
+            "see rprename/naming.py)"
+        ),
+    )
+    rename_parser.add_argument(
+        '-g', '--glob', action = 'append', default = [], metavar = 'PATTERN',
+        help = "add the files matching PATTERN ('**' matches subdirectories)",
+    )
+    rename_parser.add_argument(
+        '-0', '--null', action = 'store_true',
+        help = 'also read NUL-separated file paths from stdin (eg, from find -print0)',
+    )
+    rename_parser.add_argument(
+        '-s', '--sort', choices = ORDERINGS, default = 'loaded',
+        help = (
+            'number the files in this order: as given (default), by name '
+            '(natural order), by modification time, by size, or by EXIF date'
+        ),
+    )
+    rename_parser.add_argument(
+        '-t', '--target-dir', type = Path, default = None, metavar = 'DIR',
+        help = 'also move the files to DIR (which may be on another filesystem)',
+    )
+    rename_parser.add_argument(
+        '-u', '--unique', action = 'store_true',
+        help = (
+            'give files whose new name is taken a numbered variant '
+            '(eg, img_1_2.jpg) instead of renaming nothing'
+        ),
+    )
+    rename_parser.add_argument(
+        '-n', '--dry-run', action = 'store_true',
+        help = "only show what would be renamed",
+    )
+    rename_parser.add_argument(
+        '--duplicates', choices = ('warn', 'abort'), default = None,
+        help = (
+            'look for files with the same contents first, and list them '
+            '(warn) or also rename nothing (abort)'
+        ),
+    )
+    rename_parser.add_argument(
+        '-j', '--processes', type = int, default = 0, metavar = 'N',
+        help = 'rename with a pool of N processes (default: rename in this process)',
+    )
+    pace_group = rename_parser.add_mutually_exclusive_group()
+    pace_group.add_argument(
+        '--rate', type = float, metavar = 'OPS',
+        help = 'rename at most OPS files per second (in all, with -j)',
+    )
+    pace_group.add_argument(
+        '--delay', type = float, metavar = 'SECS',
+        help = 'wait SECS seconds after each rename (in each process, with -j)',
+    )
+    rename_parser.add_argument(
+        '--dir-fds', action = 'store_true',
+        help = 'rename relative to cached directory descriptors (faster for deep trees)',
+    )
+    _add_journal_dir_argument(rename_parser)
+    rename_parser.add_argument(
+        '--no-journal', action = 'store_true',
+        help = "don't journal the batch (it can't be resumed if interrupted)",
+    )
+    rename_parser.add_argument(
+        '-v', '--verbose', action = 'store_true', help = 'print each rename',
+    )
+    rename_parser.set_defaults(func = _rename_cmd)
+
+    resume_parser = subparsers.add_parser(
+        'resume',
+        help = 'finish the batches that were interrupted midway',
+    )
+    resume_parser.add_argument(
+        'journals', nargs = '*', type = Path, metavar = 'journal',
+        help = 'journals of the batches to resume (default: all unfinished batches)',
+    )
+    _add_journal_dir_argument(resume_parser)
+    resume_parser.add_argument(
+        '-n', '--dry-run', action = 'store_true',
+        help = "only show what would be renamed",
+    )
+    resume_parser.add_argument(
+        '-v', '--verbose', action = 'store_true', help = 'print each rename',
+    )
+    resume_parser.set_defaults(func = _resume_cmd)
+
+    return parser
+#:
+
+def _prefix(text: str) -> str:
+    if not text:
+        raise argparse.ArgumentTypeError(
+            "the prefix can't be empty (to number files with no prefix, use -T '{n}{ext}')"
+        )
+    try:
+        NameTemplate.for_prefix(text)
+    except TemplateError as ex:
+        raise argparse.ArgumentTypeError(str(ex)) from ex
+    return text
+#:
+
+def _name_template(text: str) -> NameTemplate:
+    try:
+        return NameTemplate(text)
+    except TemplateError as ex:
+        raise argparse.ArgumentTypeError(str(ex)) from ex
+#:
+
+def _add_journal_dir_argument(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        '--journal-dir', type = Path, default = None, metavar = 'DIR',
+        help = f'directory of the rename journals (default: {default_journal_dir()})',
+    )
+#:
+
+def _rename_cmd(args: argparse.Namespace) -> int:
+    if args.target_dir is not None and not args.target_dir.is_dir():
+        print(f"ERROR: '{args.target_dir}' isn't a directory", file = sys.stderr)
+        return PLAN_ERROR_CODE
+    files = _collect_files(args.files, args.glob, sys.stdin.buffer if args.null else None)
+    if args.sort != 'loaded':
+        try:
+            files = [
+                Path(file) for file in FileOrdering().sort(list(map(str, files)), args.sort)
+            ]
+        except OSError as ex:
+            print(f"ERROR: Can't sort the files: {ex}", file = sys.stderr)
+            return PLAN_ERROR_CODE
+    if args.duplicates:
+        from .hashing import find_duplicates
+        try:
+            duplicates = find_duplicates(files)
+        except OSError as ex:
+            print(f"ERROR: Can't look for duplicates: {ex}", file = sys.stderr)
+            return PLAN_ERROR_CODE
+        for group in duplicates:
+            print(f"WARNING: Same contents: {', '.join(map(str, group))}", file = sys.stderr)
+        if duplicates and args.duplicates == 'abort':
+            print(
+                f"ERROR: {len(duplicates)} group(s) of duplicates; nothing renamed",
+                file = sys.stderr,
+            )
+            return DUPLICATES_CODE
+
+    try:
+        engine = RenameEngine(
+            args.template or args.prefix, _throttle_from(args), args.dir_fds, args.target_dir,
+            unique_names = args.unique,
+        )
+    except TemplateError as ex:
+        print(f"ERROR: {ex}", file = sys.stderr)
+        return PLAN_ERROR_CODE
+    index = DirectoryIndex()
+    if (plan := _plan_or_report(engine, files, index)) is None:
+        return PLAN_ERROR_CODE
+
+    if args.dry_run:
+        _print_plan(plan)
+        return 0
+
+    # Planning a big batch takes a while: if a target directory changed
+    # meanwhile, plan again with fresh listings
+    if index.stale_dirs():
+        if (plan := _plan_or_report(engine, files, DirectoryIndex())) is None:
+            return PLAN_ERROR_CODE
+
+    journal = None
+    if not args.no_journal:
+        try:
+            journal = RenameJournal.create(plan.steps, args.journal_dir)
+        except OSError as ex:
+            print(f"ERROR: Can't write the rename journal: {ex}", file = sys.stderr)
+            return JOURNAL_ERROR_CODE
+    on_renamed = _renamed_reporter(journal, args.verbose)
+
+    completed = False
+    try:
+        if args.processes > 0:
+            count = _run_in_processes(engine, plan, args.processes, on_renamed)
+        else:
+            count = engine.run(plan.steps, on_renamed)
+        completed = True
+    except OSError as ex:
+        print(f"ERROR: {ex}", file = sys.stderr)
+        if journal is not None:
+            print(f"Resume with: rprename resume '{journal.path}'", file = sys.stderr)
+        return RENAME_ERROR_CODE
+    finally:
+        engine.close()
+        if journal is not None:
+            journal.close(completed)
+    print(f"[+] Renamed {count} file(s).", file = sys.stderr)
+    return 0
+#:
+
+def _resume_cmd(args: argparse.Namespace) -> int:
+    paths = args.journals or list_journals(args.journal_dir)
+    if not paths:
+        print("[+] No batches to resume.", file = sys.stderr)
+        return 0
+    engine = RenameEngine('')
+    for path in paths:
+        try:
+            journal = RenameJournal.open(path)
+        except JournalError as ex:
+            print(f"ERROR: {ex}", file = sys.stderr)
+            return JOURNAL_ERROR_CODE
+
+        if args.dry_run:
+            try:
+                print(f"# {path}")
+                # Steps are checked against the filesystem as they are
+                # generated, so this only shows what wasn't started
+                for src, dst, final in journal.pending_steps():
+                    print(f"{src} -> {dst}" + ('' if final else '  (temporary)'))
+            finally:
+                journal.close(completed = False)
+            continue
+
+        completed = False
+        try:
+            count = engine.run(
+                journal.pending_steps(), 
+                _renamed_reporter(journal, args.verbose),
+            )
+            completed = True
+        except OSError as ex:
+            print(f"ERROR: {ex}", file = sys.stderr)
+            return RENAME_ERROR_CODE
+        finally:
+            journal.close(completed)
+        print(f"[+] Resumed '{path}': renamed {count} file(s).", file = sys.stderr)
+    return 0
+#:
+
+def _collect_files(
+        files: Iterable[Path],
+        patterns: list[str],
+        null_separated_input = None,
+) -> list[Path]:
+    """
+    Files given as arguments come first, then the ones matching each
+    glob pattern (sorted) and, at last, the ones read from
+    `null_separated_input` (a binary stream).
+    """
+    all_files = list(files)
+    if patterns:
+        import glob
+        for pattern in patterns:
+            all_files.extend(Path(path) for path in sorted(glob.iglob(pattern, recursive = True)))
+    if null_separated_input is not None:
+        data = null_separated_input.read()
+        all_files.extend(
+            Path(os.fsdecode(path)) for path in data.split(b'\0') if path
+        )
+    return all_files
+#:
+
+def _throttle_from(args: argparse.Namespace) -> Throttle:
+    if args.rate is not None:
+        # Each process throttles its own renames, so they share the rate
+        return TokenBucket(args.rate / max(args.processes, 1))
+    if args.delay is not None:
+        return FixedDelay(args.delay)
+    return Unthrottled()
+#:
+
+def _renamed_reporter(
+        journal: RenameJournal | None, 
+        verbose: bool,
+) -> OnRenamed | None:
+    if journal is None:
+        return (lambda _, new_file: print(new_file)) if verbose else None
+    if not verbose:
+        return lambda _, new_file: journal.record_done(new_file)
+    def on_renamed(_: int, new_file: Path):
+        journal.record_done(new_file)
+        print(new_file)
+    return on_renamed
+#:
+
+def _plan_or_report(
+        engine: RenameEngine, 
+        files: list[Path], 
+        index: DirectoryIndex,
+) -> RenamePlan | None:
+    """
+    Plans the renames of `files`, or reports why it can't be done (eg,
+    files that don't exist, which would otherwise leave a journal that
+    can't be resumed) and returns `None`.
+    """
+    if missing := _missing_files(files, index):
+        for file in missing:
+            print(f"ERROR: '{file}' doesn't exist", file = sys.stderr)
+        return None
+    try:
+        return engine.plan(files, index)
+    except PlanError as ex:
+        for conflict in ex.conflicts:
+            print(f"ERROR: {conflict}", file = sys.stderr)
+    except (TemplateError, OSError) as ex:
+        print(f"ERROR: Can't plan the renames: {ex}", file = sys.stderr)
+    return None
+#:
+
+def _missing_files(files: list[Path], index: DirectoryIndex) -> list[Path]:
+    # The directories listed here are mostly the ones the planner needs
+    missing = []
+    for file in files:
+        try:
+            if not index.exists(file):
+                missing.append(file)
+        except OSError:
+            missing.append(file)
+    return missing
+#:
+
+def _print_plan(plan: RenamePlan):
+    for src, dst, final in plan.steps:
+        print(f"{src} -> {dst}" + ('' if final else '  (temporary)'))
+#:
+
+def _run_in_processes(
+        engine: RenameEngine,
+        plan: RenamePlan,
+        processes: int,
+        on_renamed: OnRenamed | None,
+) -> int:
+    run = ProcessPoolRun(engine, plan.steps, max_workers = processes)
+    run.start()
+    count = 0
+    while True:
+        done = run.done()
+        if on_renamed:
+            for new_file in run.collect_renamed():
+                count += 1
+                on_renamed(count, new_file)
+        if done:
+            break
+        time.sleep(PROCESS_POOL_POLL_INTERVAL)
+    return run.result()
+#:
@@ -0,0 +1,472 @@
+# -*- coding: utf-8 -*-
+# rprename/engine.py
+
+"""
+This module provides the rename core: a plain-Python engine, with no Qt
+dependencies, that computes new file names, plans the batch (see 
+`planner.py`) and renames files (optionally moving them to a target
+directory). Engines can be pickled, so they can be shipped to other
+processes.
+
+With `dir_fds`, the engine renames relative to directory file 
+descriptors (`renameat`), kept open in a bounded cache (see 
+`fsutils.DirFdCache`), so the kernel doesn't resolve the full paths of
+both files on every rename. This matters for deep trees and network
+mounts.
+
+Runs can be paused, resumed and cancelled from other threads (or, for
+a `ProcessPoolRun`, from the parent process) with a `RunControl`,
+which is checked before each rename and cuts throttle waits short when
+the run is cancelled.
+
+It also provides `ProcessPoolRun`, a backend that shards the renames
+across a pool of processes. `multiprocessing` and `concurrent.futures`
+are only imported when a `ProcessPoolRun` is created, to keep them out 
+of the startup path of the command-line interface.
+"""
+
+import errno
+import heapq
+import os
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Iterable, Iterator
+
+from .fsutils import DirectoryIndex, DirFdCache, move_across_devices
+from .metrics import RenameMetrics
+from .naming import NameTemplate
+from .planner import PlanStep, RenamePlan, plan_renames
+from .throttle import Throttle, Unthrottled
+
+
+__all__ = [
+    'Rename',
+    'OnRenamed',
+    'RenameEngine',
+    'RenameCancelled',
+    'RunControl',
+    'shard_steps',
+    'ProcessPoolRun',
+]
+
+
+type Rename = tuple[Path, Path]
+type OnRenamed = Callable[[int, Path], None]
+
+
+# How often (in seconds) a paused run checks whether it was resumed or
+# cancelled, and a throttle wait whether the run was cancelled. Bounds
+# the time taken to respond to `RunControl` requests.
+CONTROL_POLL_INTERVAL = 0.01
+
+
+class RenameCancelled(Exception):
+    """The run was cancelled with `RunControl.cancel`."""
+#:
+
+class RunControl:
+    """
+    Pauses, resumes and cancels engine runs from another thread. Runs
+    call `checkpoint` before each rename: it waits while the run is 
+    paused and raises `RenameCancelled` once it's cancelled. Renames 
+    already started are always completed (and reported), so callers 
+    know exactly which files were renamed.
+
+    The `state` is anything with a `value` attribute. A
+    `multiprocessing` shared value lets the parent process control
+    the runs of its worker processes (see `ProcessPoolRun`).
+    """
+    RUNNING, PAUSED, CANCELLED = 0, 1, 2
+
+    def __init__(self, state = None):
+        self._state = state if state is not None else SimpleNamespace(value = self.RUNNING)
+    #:
+
+    @property
+    def paused(self) -> bool:
+        return self._state.value == self.PAUSED
+    #:
+
+    @property
+    def cancelled(self) -> bool:
+        return self._state.value == self.CANCELLED
+    #:
+
+    def pause(self):
+        if self._state.value == self.RUNNING:
+            self._state.value = self.PAUSED
+    #:
+
+    def resume(self):
+        if self._state.value == self.PAUSED:
+            self._state.value = self.RUNNING
+    #:
+
+    def cancel(self):
+        self._state.value = self.CANCELLED
+    #:
+
+    def checkpoint(self):
+        while (state := self._state.value) != self.RUNNING:
+            if state == self.CANCELLED:
+                raise RenameCancelled()
+            time.sleep(CONTROL_POLL_INTERVAL)
+    #:
+
+    async def async_checkpoint(self):
+        import asyncio
+        while (state := self._state.value) != self.RUNNING:
+            if state == self.CANCELLED:
+                raise RenameCancelled()
+            await asyncio.sleep(CONTROL_POLL_INTERVAL)
+    #:
+
+    def sleep(self, seconds: float):
+        """
+        Sleeps for `seconds`, or until the run is cancelled. To be 
+        passed to the throttle methods.
+        """
+        deadline = time.monotonic() + seconds
+        while self._state.value != self.CANCELLED:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(remaining, CONTROL_POLL_INTERVAL))
+    #:
+
+    async def async_sleep(self, seconds: float):
+        import asyncio
+        deadline = time.monotonic() + seconds
+        while self._state.value != self.CANCELLED:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            await asyncio.sleep(min(remaining, CONTROL_POLL_INTERVAL))
+    #:
+#:
+
+
+class RenameEngine:
+    """
+    Renames files to `prefix` followed by the file number (starting at
+    1) and the original suffix or, given a `naming.NameTemplate` 
+    instead of a prefix, to the names generated by the template. Files
+    stay in their directories or, with a `target_dir`, are all moved 
+    there. Moves within a filesystem are plain renames. Across
+    filesystems, the data is copied inside the kernel and the original
+    removed (see `fsutils.move_across_devices`).
+    The rename loop lives here; Qt renamers (see `rename.py`) wrap an
+    engine and translate its callbacks into signals.
+    `dir_fds` is ignored where `os.rename` doesn't support `dir_fd` 
+    arguments (eg, on Windows). Call `close` when done with the engine.
+    With `metrics`, the latency of each rename and the failed renames
+    are recorded there. With `unique_names`, files whose new names are
+    taken get numbered variants (see `planner.plan_renames`) instead of
+    failing the plan. Files are numbered from `first_number` (eg, to go
+    on numbering from an earlier batch).
+    """
+    def __init__(
+            self, 
+            prefix: str | NameTemplate, 
+            throttle: Throttle | None = None,
+            dir_fds = False,
+            target_dir: Path | None = None,
+            metrics: RenameMetrics | None = None,
+            unique_names = False,
+            first_number = 1,
+    ):
+        self.template = (
+            prefix if isinstance(prefix, NameTemplate)
+            else NameTemplate.for_prefix(prefix)
+        )
+        self.target_dir = target_dir
+        self.metrics = metrics
+        self.unique_names = unique_names
+        self.first_number = first_number
+        self.throttle = throttle if throttle is not None else Unthrottled()
+        self.dir_fds = (
+            DirFdCache() if dir_fds and os.rename in os.supports_dir_fd
+            else None
+        )
+    #:
+
+    def renames_for(self, files: Iterable[Path]) -> list[Rename]:
+        """
+        Returns the list of `(file, new_file)` pairs for `files`. The
+        names of the whole batch are generated in one go.
+        """
+        files = list(files)
+        names = self.template.names(files, first = self.first_number)
+        if self.target_dir is not None:
+            join = self.target_dir.joinpath
+            return [(file, join(name)) for file, name in zip(files, names)]
+        return [(file, file.parent.joinpath(name)) for file, name in zip(files, names)]
+    #:
+
+    def plan(
+            self, 
+            files: Iterable[Path], 
+            index: DirectoryIndex | None = None,
+    ) -> RenamePlan:
+        """
+        Plans the renames of `files`. Raises `planner.PlanError` if the
+        batch would overwrite files.
+        """
+        return plan_renames(self.renames_for(files), index, self.unique_names)
+    #:
+
+    def rename(self, file: Path, new_file: Path, control: RunControl | None = None):
+        """
+        Renames `file` to `new_file`, honouring the throttle. With a
+        `control`, throttle waits end as soon as the run is cancelled.
+        """
+        sleep = control.sleep if control is not None else time.sleep
+        self.throttle.acquire(sleep)
+        try:
+            self.unthrottled_rename(file, new_file)
+        finally:
+            self.throttle.release(sleep)
+    #:
+
+    def unthrottled_rename(self, file: Path, new_file: Path):
+        """
+        Renames right away, ignoring the throttle (eg, for callers that
+        use the async side of the throttle).
+        """
+        metrics = self.metrics
+        if metrics is None:
+            self._rename_or_move(file, new_file)
+            return
+        start = time.perf_counter()
+        try:
+            self._rename_or_move(file, new_file)
+        except BaseException:
+            metrics.record_error()
+            raise
+        metrics.record_latency(time.perf_counter() - start)
+    #:
+
+    def _rename_or_move(self, file: Path, new_file: Path):
+        try:
+            self._rename(file, new_file)
+        except OSError as ex:
+            if ex.errno != errno.EXDEV:
+                raise
+            move_across_devices(file, new_file)
+    #:
+
+    def _rename(self, file: Path, new_file: Path):
+        if self.dir_fds is None:
+            os.rename(file, new_file)
+            return
+        # dir_fds is only used on POSIX, so paths are split on '/'
+        # (keeping the root), which is cheaper than os.path.split
+        src, dst = os.fspath(file), os.fspath(new_file)
+        i, j = src.rfind('/'), dst.rfind('/')
+        src_dir = src[:i] if i > 0 else src[:i + 1]
+        dst_dir = dst[:j] if j > 0 else dst[:j + 1]
+        src_fd = self.dir_fds.get(src_dir)
+        dst_fd = src_fd if dst_dir == src_dir else self.dir_fds.get(dst_dir)
+        os.rename(src[i + 1:], dst[j + 1:], src_dir_fd = src_fd, dst_dir_fd = dst_fd)
+    #:
+
+    def close(self):
+        """Releases the resources held by the engine (eg, open fds)."""
+        if self.dir_fds is not None:
+            self.dir_fds.close()
+    #:
+
+    def run(
+            self,
+            steps: Iterable[PlanStep],
+            on_renamed: OnRenamed | None = None,
+            control: RunControl | None = None,
+    ) -> int:
+        """
+        Performs the plan `steps` in order. After each file gets its
+        final name, calls `on_renamed` (if given) with the number of 
+        files renamed so far and the new path. Returns the number of 
+        renamed files. With a `control`, the run can be paused and
+        cancelled between renames (raising `RenameCancelled`).
+        """
+        count = 0
+        for file, new_file, final in steps:
+            if control is not None:
+                control.checkpoint()
+            self.rename(file, new_file, control)
+            if final:
+                count += 1
+                if on_renamed:
+                    on_renamed(count, new_file)
+        return count
+    #:
+#:
+
+def shard_steps(steps: Iterable[PlanStep], shards: int) -> list[list[PlanStep]]:
+    """
+    Splits the plan `steps` into at most `shards` lists. All the steps
+    from a directory go to the same shard (keeping their relative 
+    order), so two processes never race for names in the same 
+    directory. A step that must wait for another one (its target is the
+    source of the other step) goes to the shard of the other step, even
+    if it moves the file from a different directory, so dependencies 
+    are respected.
+    Groups are spread so that shards have similar sizes.
+    """
+    if shards < 1:
+        raise ValueError(f'Invalid number of shards: {shards}')
+
+    steps = list(steps)
+    sources = {step.src for step in steps}
+    # Union-find of source directories, joined by dependencies
+    group_of: dict[Path, Path] = {}
+    def find(dir_path: Path) -> Path:
+        root = group_of.setdefault(dir_path, dir_path)
+        while root != group_of[root]:
+            root = group_of[root]
+        group_of[dir_path] = root
+        return root
+    for step in steps:
+        src_dir = find(step.src.parent)
+        if step.dst in sources:
+            group_of[src_dir] = find(step.dst.parent)
+
+    groups: dict[Path, list[PlanStep]] = {}
+    for step in steps:
+        groups.setdefault(find(step.src.parent), []).append(step)
+
+    # Largest directories first, each into the smallest shard so far
+    bins: list[list[PlanStep]] = [[] for _ in range(min(shards, len(groups)))]
+    heap = [(0, index) for index in range(len(bins))]
+    for group in sorted(groups.values(), key = len, reverse = True):
+        size, index = heapq.heappop(heap)
+        bins[index].extend(group)
+        heapq.heappush(heap, (size + len(group), index))
+    return bins
+#:
+
+# Set by `_init_worker` in each worker process: one slot per shard with
+# the number of files of the shard renamed so far. Every shard has a
+# single writer, so the array doesn't need a lock.
+_shard_counters = None
+# And the `RunControl` of the run, backed by shared memory
+_run_control: RunControl | None = None
+
+def _init_worker(shard_counters, run_control: RunControl):
+    global _shard_counters, _run_control
+    _shard_counters = shard_counters
+    _run_control = run_control
+#:
+
+def _rename_shard(engine: RenameEngine, shard_index: int, steps: list[PlanStep]) -> int:
+    def on_renamed(count: int, _: Path):
+        _shard_counters[shard_index] = count    # type: ignore
+    try:
+        return engine.run(steps, on_renamed, _run_control)
+    finally:
+        engine.close()
+#:
+
+class ProcessPoolRun:
+    """
+    Runs the steps of a plan (eg, `engine.plan(files).steps`) in a pool 
+    of `max_workers` processes. Steps are sharded with `shard_steps`.
+
+    Progress is reported through a shared-memory array with a counter
+    per shard, instead of one message per file. Since each shard
+    renames its files in order, the counters are enough to know which
+    files were renamed: see `collect_renamed`.
+
+    The workers share `control` (a `RunControl` backed by a shared 
+    value, created here if not given) with the parent, so the run can
+    be paused, resumed and cancelled from here. A cancelled
+    run raises `RenameCancelled` from `result`.
+
+    Usage:
+        run = ProcessPoolRun(engine, plan.steps)
+        run.start()
+        while not run.done():
+            ... run.renamed_count ...
+        run.result()
+    """
+    def __init__(
+            self,
+            engine: RenameEngine,
+            steps: Iterable[PlanStep],
+            max_workers: int | None = None,
+            mp_context = None,
+            control: RunControl | None = None,
+    ):
+        import multiprocessing
+        self._engine = engine
+        self._mp_context = (
+            # spawn is safe even if the parent runs threads (eg, Qt's)
+            mp_context if mp_context is not None
+            else multiprocessing.get_context('spawn')
+        )
+        self._max_workers = max_workers or self._mp_context.cpu_count()
+        self._shards = shard_steps(steps, self._max_workers)
+        # New paths of each shard, in the order they're renamed
+        self._renamed_paths = [
+            [step.dst for step in shard if step.final] for shard in self._shards
+        ]
+        self._counters = self._mp_context.Array('Q', len(self._shards) or 1, lock = False)
+        self._collected = [0] * len(self._shards)
+        self.control = (
+            control if control is not None
+            else RunControl(self._mp_context.RawValue('b', RunControl.RUNNING))
+        )
+        self._futures = []      # list[concurrent.futures.Future]
+    #:
+
+    @property
+    def total(self) -> int:
+        return sum(len(paths) for paths in self._renamed_paths)
+    #:
+
+    @property
+    def renamed_count(self) -> int:
+        return sum(self._counters)
+    #:
+
+    def start(self):
+        from concurrent.futures import ProcessPoolExecutor
+        if not self._shards:
+            return
+        executor = ProcessPoolExecutor(
+            max_workers = len(self._shards),
+            mp_context = self._mp_context,
+            initializer = _init_worker,
+            initargs = (self._counters, self.control),
+        )
+        self._futures = [
+            executor.submit(_rename_shard, self._engine, index, shard)
+            for index, shard in enumerate(self._shards)
+        ]
+        executor.shutdown(wait = False)
+    #:
+
+    def done(self) -> bool:
+        return all(future.done() for future in self._futures)
+    #:
+
+    def collect_renamed(self) -> Iterator[Path]:
+        """
+        Yields the new paths of the files renamed since the previous
+        call.
+        """
+        for index, paths in enumerate(self._renamed_paths):
+            count = self._counters[index]
+            yield from paths[self._collected[index] : count]
+            self._collected[index] = count
+    #:
+
+    def result(self, timeout: float | None = None) -> int:
+        """
+        Waits for all shards and returns the number of renamed files.
+        Re-raises the first error raised by a worker.
+        """
+        return sum(future.result(timeout) for future in self._futures)
+    #:
+#:
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+# rprename/filequeue.py
+
+"""
+This module provides `FileQueue`, the queue of files loaded for renaming.
+It doesn't depend on Qt.
+"""
+
+import os
+from collections import deque
+from pathlib import Path
+from typing import Iterable, Iterator
+
+
+__all__ = [
+    'FileQueue',
+]
+
+
+class FileQueue:
+    """
+    An insertion-ordered queue of file paths without duplicates.
+
+    Paths are stored as strings in a `deque`, plus a `set` used as a
+    hash index, so membership checks, adding files and removing them
+    from the front are all O(1). `Path` objects are only created when
+    iterating over the queue or popping from it.
+
+    Paths are compared as given, without normalizing them, so callers
+    should use absolute, normalized paths (which is what `QFileDialog`
+    and `os.scandir` return).
+    """
+    def __init__(self, files: Iterable[str | os.PathLike] = ()):
+        self._queue: deque[str] = deque()
+        self._index: set[str] = set()
+        self.extend(files)
+    #:
+
+    def __len__(self) -> int:
+        return len(self._queue)
+    #:
+
+    def __contains__(self, file: str | os.PathLike) -> bool:
+        return os.fspath(file) in self._index
+    #:
+
+    def __iter__(self) -> Iterator[Path]:
+        return (Path(file) for file in self._queue)
+    #:
+
+    def extend(self, files: Iterable[str | os.PathLike]) -> list[str]:
+        """
+        Appends the `files` that aren't in the queue yet (duplicates
+        within `files` are also skipped). Returns the list with the
+        files actually added.
+        """
+        index = self._index
+        added = []
+        for file in map(os.fspath, files):
+            if file not in index:
+                index.add(file)
+                added.append(file)
+        self._queue.extend(added)
+        return added
+    #:
+
+    def popleft(self) -> Path:
+        file = self._queue.popleft()
+        self._index.discard(file)
+        return Path(file)
+    #:
+
+    def pop_front(self, count: int):
+        """Removes (up to) `count` files from the front of the queue."""
+        queue, index = self._queue, self._index
+        for _ in range(min(count, len(queue))):
+            index.discard(queue.popleft())
+    #:
+
+    def clear(self):
+        self._queue.clear()
+        self._index.clear()
+    #:
+#:
@@ -0,0 +1,529 @@
+# -*- coding: utf-8 -*-
+# rprename/fsutils.py
+
+"""
+Filesystem utilities with no Qt dependencies (unlike `utils.py`), so
+that they can be used by the rename engine from any process.
+"""
+
+import contextlib
+import errno
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterable, NamedTuple
+
+
+__all__ = [
+    'DirectoryIndex',
+    'PathCheck',
+    'PathValidator',
+    'validate_paths',
+    'DirFdCache',
+    'move_across_devices',
+    'user_state_dir',
+    'fsync_dir',
+]
+
+
+APP_DIR_NAME = 'rprename'
+
+#######################################################################
+##
+##   DIRECTORY INDEX
+##
+#######################################################################
+
+class DirectoryIndex:
+    """
+    In-memory snapshots of directory listings. Each directory is
+    listed once, with a single `os.scandir`, the first time one of its
+    entries is queried. After that, queries don't touch the disk.
+
+    Names can be claimed in a snapshot (eg, by `unique_path`) before
+    the files are created, so that a whole batch gets unique names
+    without looking at the disk again. The identity and modification
+    time of each directory are recorded just before it is listed, and
+    `is_stale` (one `os.stat`) tells if the directory changed since
+    then. Filesystems with coarse timestamps (eg, FAT) may miss changes
+    made within the same tick as the listing.
+    """
+    def __init__(self):
+        self._names: dict[Path, set[str]] = {}
+        self._stamps: dict[Path, tuple[int, int]] = {}
+        # Next `_N` suffix to try for each (stem, suffix), by directory
+        self._counters: dict[Path, dict[tuple[str, str], int]] = {}
+    #:
+
+    def names(self, dir_path: Path) -> set[str]:
+        """
+        The names of the entries of `dir_path`. The returned set is
+        the snapshot itself, so callers can update it (eg, to claim
+        names they are about to create).
+        """
+        if (names := self._names.get(dir_path)) is None:
+            # Stamped before listing: a change made while listing makes
+            # the snapshot stale, rather than going unnoticed
+            stamp = _dir_stamp(dir_path)
+            with os.scandir(dir_path) as entries:
+                names = {entry.name for entry in entries}
+            self._names[dir_path] = names
+            self._stamps[dir_path] = stamp
+        return names
+    #:
+
+    def exists(self, path: Path) -> bool:
+        return path.name in self.names(path.parent)
+    #:
+
+    def unique_path(self, path: Path) -> Path:
+        """
+        Claims and returns `path` if its name is free in the snapshot,
+        or else the first free `<stem>_2<suffix>`, `<stem>_3<suffix>`,
+        ... Claiming many variants of the same name tries each number
+        only once.
+        """
+        names = self.names(path.parent)
+        name = path.name
+        if name in names:
+            stem, suffix = path.stem, path.suffix
+            counters = self._counters.setdefault(path.parent, {})
+            n = counters.get((stem, suffix), 2)
+            while (name := f'{stem}_{n}{suffix}') in names:
+                n += 1
+            counters[stem, suffix] = n + 1
+        names.add(name)
+        return path.parent / name
+    #:
+
+    def is_stale(self, dir_path: Path) -> bool:
+        """
+        Whether `dir_path` changed (or is gone) since it was listed.
+        Directories not listed yet are never stale.
+        """
+        if (stamp := self._stamps.get(dir_path)) is None:
+            return False
+        try:
+            return _dir_stamp(dir_path) != stamp
+        except OSError:
+            return True
+    #:
+
+    def stale_dirs(self) -> list[Path]:
+        return [dir_path for dir_path in self._stamps if self.is_stale(dir_path)]
+    #:
+
+    def forget(self, dir_path: Path):
+        """
+        Drops the snapshot of `dir_path` (and the names claimed in it),
+        so that the directory is listed again when next queried.
+        """
+        self._names.pop(dir_path, None)
+        self._stamps.pop(dir_path, None)
+        self._counters.pop(dir_path, None)
+    #:
+#:
+
+def _dir_stamp(dir_path: Path) -> tuple[int, int]:
+    dir_stat = os.stat(dir_path)
+    return dir_stat.st_ino, dir_stat.st_mtime_ns
+#:
+
+#######################################################################
+##
+##   PATH VALIDATION
+##
+#######################################################################
+
+class PathCheck(NamedTuple):
+    path: Path
+    valid: bool
+    problem: str | None     # why the path isn't valid
+    mode: int | None        # `st_mode` of the entry at the path, if any
+
+    @property
+    def exists(self) -> bool:
+        return self.mode is not None
+    #:
+#:
+
+class PathValidator:
+    """
+    Checks if paths can be used for files (eg, as rename targets), in
+    batches. A path is valid if:
+        - it isn't a directory, a device, a FIFO, a socket, a junction
+          or a mount point;
+        - its parent directory exists;
+        - it doesn't exist, with `unique`;
+        - it can be written to, with `check_w`, and read from, with
+          `check_r` (paths that don't exist can't be read from).
+
+    Each path is `os.lstat`'ed once, and everything else is derived
+    from the result. Directories are looked at once per validator: a
+    `stat`, and, for the writability of paths that don't exist yet, an
+    attempt to create a temporary file in them (the only sure test).
+    The permissions of existing entries are read from their mode bits,
+    so ACLs and read-only mounts aren't considered. Symbolic links are
+    checked as the links themselves (renaming to a link replaces the
+    link, not its target).
+    """
+    def __init__(self, unique = False, check_w = False, check_r = False):
+        self.unique = unique
+        self.check_w = check_w
+        self.check_r = check_r
+        self._dirs: dict[Path, os.stat_result | None] = {}
+        self._writable_dirs: dict[Path, bool] = {}
+        if hasattr(os, 'geteuid'):
+            self._euid: int | None = os.geteuid()
+            self._groups = {os.getegid(), *os.getgroups()}
+        else:
+            # Eg, Windows, where only the owner bits mean something
+            self._euid = None
+    #:
+
+    def check_many(self, paths: Iterable[Path]) -> list[PathCheck]:
+        return [self.check(path) for path in paths]
+    #:
+
+    def check(self, path: Path) -> PathCheck:
+        try:
+            entry = os.lstat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            entry = None
+        except (OSError, ValueError) as ex:
+            return PathCheck(path, False, _problem_of(ex), None)
+        mode = entry.st_mode if entry is not None else None
+
+        if (parent := self._dir_stat(path.parent)) is None:
+            problem = "parent directory doesn't exist"
+        elif entry is None:
+            problem = (
+                'not readable' if self.check_r
+                else 'not writable' if self.check_w and not self._dir_writable(path.parent)
+                else None
+            )
+        elif stat.S_ISDIR(mode):
+            problem = 'is a directory'
+        elif _is_special(entry) or entry.st_dev != parent.st_dev:
+            problem = 'is a special file'
+        elif self.unique:
+            problem = 'already exists'
+        elif self.check_w and not self._permits(entry, stat.S_IWUSR, stat.S_IWGRP, stat.S_IWOTH):
+            problem = 'not writable'
+        elif self.check_r and not self._permits(entry, stat.S_IRUSR, stat.S_IRGRP, stat.S_IROTH):
+            problem = 'not readable'
+        else:
+            problem = None
+        return PathCheck(path, problem is None, problem, mode)
+    #:
+
+    def _dir_stat(self, dir_path: Path) -> os.stat_result | None:
+        """The `stat` of `dir_path`, or `None` if it isn't a directory."""
+        try:
+            return self._dirs[dir_path]
+        except KeyError:
+            pass
+        try:
+            dir_stat = os.stat(dir_path)
+            if not stat.S_ISDIR(dir_stat.st_mode):
+                dir_stat = None
+        except (OSError, ValueError):
+            dir_stat = None
+        self._dirs[dir_path] = dir_stat
+        return dir_stat
+    #:
+
+    def _dir_writable(self, dir_path: Path) -> bool:
+        if (writable := self._writable_dirs.get(dir_path)) is None:
+            try:
+                with tempfile.TemporaryFile(dir = dir_path):
+                    pass
+                writable = True
+            except OSError:
+                writable = False
+            self._writable_dirs[dir_path] = writable
+        return writable
+    #:
+
+    def _permits(self, entry: os.stat_result, user_bit: int, group_bit: int, other_bit: int) -> bool:
+        if self._euid is None:
+            return bool(entry.st_mode & user_bit)
+        if self._euid == 0:
+            return True
+        if entry.st_uid == self._euid:
+            return bool(entry.st_mode & user_bit)
+        if entry.st_gid in self._groups:
+            return bool(entry.st_mode & group_bit)
+        return bool(entry.st_mode & other_bit)
+    #:
+#:
+
+def validate_paths(
+        paths: Iterable[Path],
+        unique = False,
+        check_w = False,
+        check_r = False,
+) -> list[PathCheck]:
+    """`PathValidator.check_many` with a new validator."""
+    return PathValidator(unique, check_w, check_r).check_many(paths)
+#:
+
+_JUNCTION_REPARSE_TAG = getattr(stat, 'IO_REPARSE_TAG_MOUNT_POINT', None)
+
+def _is_special(entry: os.stat_result) -> bool:
+    mode = entry.st_mode
+    return (
+        stat.S_ISBLK(mode) or stat.S_ISCHR(mode) or stat.S_ISFIFO(mode)
+        or stat.S_ISSOCK(mode)
+        or getattr(entry, 'st_reparse_tag', 0) == _JUNCTION_REPARSE_TAG
+    )
+#:
+
+def _problem_of(ex: Exception) -> str:
+    return ex.strerror.lower() if isinstance(ex, OSError) and ex.strerror else str(ex)
+#:
+
+#######################################################################
+##
+##   DIRECTORY FILE DESCRIPTORS
+##
+#######################################################################
+
+# Default number of directory fds kept open by a DirFdCache
+DIR_FD_CACHE_SIZE = 64
+
+class DirFdCache:
+    """
+    Bounded LRU caches of open directory file descriptors, for the
+    `dir_fd` arguments of `os` functions (eg, `os.rename`). With a
+    directory fd, the kernel resolves only the bare file name instead
+    of every component of the full path.
+
+    Each thread gets its own cache (of up to `max_size` descriptors),
+    so lookups need no locks, and a descriptor can only be closed by
+    the thread that uses it. A descriptor returned by `get` stays open
+    until the same thread calls `get` `max_size` more times (for other
+    directories) or the cache is closed. Pickled caches come back empty.
+    """
+    def __init__(self, max_size = DIR_FD_CACHE_SIZE):
+        if max_size < 2:
+            # A rename between two directories needs both fds open
+            raise ValueError(f'Invalid cache size: {max_size}')
+        self.max_size = max_size
+        self._local = threading.local()
+        # The caches of all threads, so that `close` can reach them
+        self._caches: list[OrderedDict[str, int]] = []
+        self._lock = threading.Lock()
+    #:
+
+    def __getstate__(self) -> dict:
+        return {'max_size': self.max_size}
+    #:
+
+    def __setstate__(self, state: dict):
+        self.__init__(state['max_size'])
+    #:
+
+    def get(self, dir_path: str) -> int:
+        """
+        Returns an open fd for `dir_path` (a `str`, `''` meaning the
+        current directory), opening it if it's not in the cache of the
+        current thread.
+        """
+        try:
+            cache = self._local.cache
+        except AttributeError:
+            cache = self._local.cache = OrderedDict()
+            with self._lock:
+                self._caches.append(cache)
+        fd = cache.get(dir_path)
+        if fd is None:
+            fd = cache[dir_path] = os.open(
+                dir_path or os.curdir,
+                os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0) | getattr(os, 'O_CLOEXEC', 0),
+            )
+            if len(cache) > self.max_size:
+                os.close(cache.popitem(last = False)[1])
+        else:
+            cache.move_to_end(dir_path)
+        return fd
+    #:
+
+    def close(self):
+        """
+        Closes all the descriptors, of all threads. They must not be
+        in use.
+        """
+        with self._lock:
+            for cache in self._caches:
+                for fd in cache.values():
+                    os.close(fd)
+                cache.clear()
+    #:
+#:
+
+#######################################################################
+##
+##   CROSS-DEVICE MOVES
+##
+#######################################################################
+
+# Prefix of the partial copies made by `move_across_devices`
+COPY_TEMP_PREFIX = '.rprename-copy-'
+
+# Maximum number of bytes per copy_file_range/sendfile call
+KERNEL_COPY_CHUNK = 1 << 30
+
+def move_across_devices(src: str | os.PathLike, dst: str | os.PathLike):
+    """
+    Moves the file `src` to `dst` on another filesystem (where 
+    `os.rename` fails with `EXDEV`), then removes `src`. The data is
+    copied by the system, never through Python buffers: with
+    `os.copy_file_range`, or `os.sendfile` where that isn't supported,
+    on Linux, with `CopyFile2` on Windows and with `shutil.copyfile`
+    (which uses `fcopyfile`) on macOS. Elsewhere (eg, on the BSDs),
+    `shutil.copyfile` copies in user space, a block at a time.
+
+    The copy goes to a temporary name next to `dst`, is flushed to disk
+    and only then linked as `dst`, so `dst` never holds a partial file.
+    An existing `dst` is never overwritten (`FileExistsError`).
+    """
+    src, dst = os.fspath(src), os.fspath(dst)
+    dst_dir, dst_name = os.path.split(dst)
+    temp = os.path.join(dst_dir, f'{COPY_TEMP_PREFIX}{os.getpid()}-{dst_name}')
+    try:
+        if _KERNEL_COPY_FUNCTIONS:
+            with open(src, 'rb') as src_file, open(temp, 'xb') as dst_file:
+                _kernel_copy(
+                    src_file.fileno(), 
+                    dst_file.fileno(), 
+                    os.fstat(src_file.fileno()).st_size,
+                )
+                os.fsync(dst_file.fileno())
+        elif _WIN_COPY_FILE is not None:
+            _WIN_COPY_FILE(src, temp, _WIN_COPY_FILE_FAIL_IF_EXISTS)
+            # os.fsync needs write access on Windows
+            with open(temp, 'r+b') as dst_file:
+                os.fsync(dst_file.fileno())
+        else:
+            shutil.copyfile(src, temp)
+            with open(temp, 'rb') as dst_file:
+                os.fsync(dst_file.fileno())
+        shutil.copystat(src, temp)
+        _link_or_rename(temp, dst)
+    finally:
+        with contextlib.suppress(OSError):
+            os.unlink(temp)
+    os.unlink(src)
+#:
+
+def _link_or_rename(temp: str, dst: str):
+    try:
+        # Unlike os.rename, os.link fails if dst exists
+        os.link(temp, dst)
+    except FileExistsError:
+        raise
+    except OSError:
+        # No hard links in this filesystem (eg, FAT)
+        if os.path.lexists(dst):
+            raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), dst)
+        os.rename(temp, dst)
+#:
+
+def _kernel_copy(src_fd: int, dst_fd: int, size: int):
+    copied = 0
+    for i, copy in enumerate(_KERNEL_COPY_FUNCTIONS):
+        try:
+            while copied < size:
+                count = copy(src_fd, dst_fd, copied, min(size - copied, KERNEL_COPY_CHUNK))
+                if count == 0:
+                    break
+                copied += count
+            return
+        except OSError as ex:
+            # Not supported for this pair of files (eg, copy_file_range
+            # across filesystems on Linux < 5.3): go on with the next
+            # function from where this one stopped
+            if (
+                    ex.errno not in _UNSUPPORTED_COPY_ERRORS 
+                    or i == len(_KERNEL_COPY_FUNCTIONS) - 1
+            ):
+                raise
+#:
+
+_UNSUPPORTED_COPY_ERRORS = {
+    errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP,
+    errno.EBADF,
+}
+
+def _copy_file_range(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+#:
+
+def _sendfile(src_fd: int, dst_fd: int, offset: int, count: int) -> int:
+    # sendfile writes at the current offset of dst_fd
+    os.lseek(dst_fd, offset, os.SEEK_SET)
+    return os.sendfile(dst_fd, src_fd, offset, count)
+#:
+
+# Only on Linux: elsewhere, sendfile only writes to sockets and
+# copy_file_range doesn't exist
+_KERNEL_COPY_FUNCTIONS = [
+    function for function, available in (
+        (_copy_file_range, hasattr(os, 'copy_file_range')),
+        (_sendfile, hasattr(os, 'sendfile')),
+    )
+    if available and sys.platform.startswith('linux')
+]
+
+# On Windows, files are copied with CopyFile2 (CopyFileExW's successor,
+# in `_winapi` since Python 3.12), which `shutil.copyfile` doesn't use
+if sys.platform == 'win32':
+    import _winapi
+    _WIN_COPY_FILE = getattr(_winapi, 'CopyFile2', None)
+else:
+    _WIN_COPY_FILE = None
+_WIN_COPY_FILE_FAIL_IF_EXISTS = 0x1
+
+#######################################################################
+##
+##   USER DIRECTORIES AND DURABILITY
+##
+#######################################################################
+
+def user_state_dir() -> Path:
+    """
+    The directory for state that must survive restarts (eg, rename
+    journals), shared by the GUI and the command-line interface:
+    `$XDG_STATE_HOME/rprename` (`~/.local/state/rprename` by default)
+    on Linux, and the usual application data directory on Windows and
+    macOS. The directory isn't created.
+    """
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or Path.home() / 'AppData' / 'Local'
+    elif sys.platform == 'darwin':
+        base = Path.home() / 'Library' / 'Application Support'
+    else:
+        base = os.environ.get('XDG_STATE_HOME') or Path.home() / '.local' / 'state'
+    return Path(base) / APP_DIR_NAME
+#:
+
+def fsync_dir(dir_path: str | os.PathLike):
+    """
+    Flushes the entries of `dir_path` (eg, after renames or after
+    creating a file) to disk. Does nothing where directories can't be
+    opened for syncing (eg, on Windows).
+    """
+    if os.name != 'posix':
+        return
+    fd = os.open(dir_path, os.O_RDONLY | getattr(os, 'O_DIRECTORY', 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+#:
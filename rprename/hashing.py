@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+# rprename/hashing.py
+
+"""
+This module hashes file contents (BLAKE2b), for the `{hash}` field of
+naming templates (see `naming.py`) and to find byte-identical
+duplicates before renaming.
+
+Files are memory-mapped and fed to the hash in blocks by a pool of
+threads (`hashlib` releases the GIL while hashing, so the threads
+really run in parallel). Digests are kept in an on-disk cache (a
+SQLite database in the user state directory) keyed by
+`(st_dev, st_ino, st_size, st_mtime_ns)`: renaming a file changes none
+of these, so hashing the same folder again, before or after renaming,
+hashes nothing. `find_duplicates` only hashes the files whose sizes
+collide.
+It doesn't depend on Qt.
+"""
+
+import hashlib
+import mmap
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable
+
+from .fsutils import user_state_dir
+
+
+__all__ = [
+    'HashCache',
+    'FileHasher',
+    'hash_file',
+    'find_duplicates',
+    'default_hasher',
+    'default_hash_cache_path',
+]
+
+
+HASH_DIGEST_SIZE = 32
+# Bytes fed to the hash at a time
+HASH_BLOCK_SIZE = 1 << 20
+HASH_MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+# Bump when the digests change (eg, another algorithm or size), so
+# that old caches are dropped
+HASH_CACHE_VERSION = 1
+HASH_CACHE_FILE_NAME = 'hashes.sqlite3'
+# Keys are looked up in batches of HASH_CACHE_BATCH_SIZE (each key
+# takes 4 SQL parameters)
+HASH_CACHE_BATCH_SIZE = 500
+
+type CacheKey = tuple[int, int, int, int]
+
+
+def default_hash_cache_path() -> Path:
+    return user_state_dir() / HASH_CACHE_FILE_NAME
+#:
+
+def hash_file(path: str | os.PathLike) -> bytes:
+    """The BLAKE2b digest of the contents of the file at `path`."""
+    digest = hashlib.blake2b(digest_size = HASH_DIGEST_SIZE)
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        if os.fstat(fd).st_size > 0:
+            with mmap.mmap(fd, 0, access = mmap.ACCESS_READ) as data:
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    data.madvise(mmap.MADV_SEQUENTIAL)
+                with memoryview(data) as view:
+                    for start in range(0, len(view), HASH_BLOCK_SIZE):
+                        digest.update(view[start : start + HASH_BLOCK_SIZE])
+    finally:
+        os.close(fd)
+    return digest.digest()
+#:
+
+class HashCache:
+    """
+    Digests of files, persisted in a SQLite database at `path`
+    (default: `default_hash_cache_path()`), keyed by `cache_key`.
+    Thread-safe; several processes can share the database.
+    """
+    def __init__(self, path: Path | None = None):
+        self.path = path if path is not None else default_hash_cache_path()
+        self.path.parent.mkdir(parents = True, exist_ok = True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, timeout = 10, check_same_thread = False)
+        with self._lock, self._db:
+            self._db.execute('PRAGMA journal_mode = WAL')
+            if self._db.execute('PRAGMA user_version').fetchone()[0] != HASH_CACHE_VERSION:
+                self._db.execute('DROP TABLE IF EXISTS hashes')
+                self._db.execute(f'PRAGMA user_version = {HASH_CACHE_VERSION}')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS hashes ('
+                '    dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER,'
+                '    digest BLOB NOT NULL,'
+                '    PRIMARY KEY (dev, ino, size, mtime_ns)'
+                ') WITHOUT ROWID'
+            )
+    #:
+
+    @staticmethod
+    def cache_key(stat: os.stat_result) -> CacheKey:
+        # SQLite integers are signed 64-bit
+        return tuple(
+            _int64(value)
+            for value in (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+        )
+    #:
+
+    def get_many(self, keys: Iterable[CacheKey]) -> dict[CacheKey, bytes]:
+        """The digests of the `keys` in the cache."""
+        keys = list(keys)
+        found: dict[CacheKey, bytes] = {}
+        with self._lock:
+            for i in range(0, len(keys), HASH_CACHE_BATCH_SIZE):
+                batch = keys[i : i + HASH_CACHE_BATCH_SIZE]
+                rows = self._db.execute(
+                    'SELECT dev, ino, size, mtime_ns, digest FROM hashes '
+                    'WHERE (dev, ino, size, mtime_ns) IN '
+                    f'(VALUES {", ".join(["(?, ?, ?, ?)"] * len(batch))})',
+                    [value for key in batch for value in key],
+                )
+                for *key, digest in rows:
+                    found[tuple(key)] = digest
+        return found
+    #:
+
+    def put_many(self, digests: dict[CacheKey, bytes]):
+        with self._lock, self._db:
+            self._db.executemany(
+                'INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?)',
+                [(*key, digest) for key, digest in digests.items()],
+            )
+    #:
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute('DELETE FROM hashes')
+    #:
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+    #:
+#:
+
+class FileHasher:
+    """
+    Hashes many files at once with a pool of `max_workers` threads,
+    looking up and storing the digests in `cache` (if any).
+    """
+    def __init__(self, cache: HashCache | None = None, max_workers = HASH_MAX_WORKERS):
+        self.cache = cache
+        self._max_workers = max_workers
+    #:
+
+    def digests(
+            self,
+            files: list[Path],
+            stats: list[os.stat_result] | None = None,
+            skip_unreadable = False,
+    ) -> list[bytes | None]:
+        """
+        The digests of `files`, in order. `stats` are the results of
+        `os.stat` for the files, if known. Raises `OSError` if a file
+        can't be read or, with `skip_unreadable`, gives `None` for it.
+        """
+        stats = stats if stats is not None else [os.stat(file) for file in files]
+        keys = [HashCache.cache_key(stat) for stat in stats]
+        known = self.cache.get_many(set(keys)) if self.cache else {}
+        # Each file once, even if listed (or hard linked) more than once
+        missing = {key: file for key, file in zip(keys, files) if key not in known}
+        if missing:
+            hash_one = _hash_or_none if skip_unreadable else hash_file
+            if len(missing) == 1:
+                hashed = [hash_one(file) for file in missing.values()]
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor(min(self._max_workers, len(missing))) as executor:
+                    hashed = list(executor.map(hash_one, missing.values()))
+            new_digests = dict(zip(missing, hashed))
+            if self.cache:
+                self.cache.put_many(
+                    {key: digest for key, digest in new_digests.items() if digest is not None}
+                )
+            known.update(new_digests)
+        return [known[key] for key in keys]
+    #:
+
+    def find_duplicates(self, files: list[Path]) -> list[list[Path]]:
+        """
+        Groups of files (of two or more, in the order of `files`) with
+        the same contents. Only files with the same size as some other
+        file are hashed, and empty files are never duplicates. Files
+        that are gone or can't be read are skipped (renaming them will
+        report them anyway), so that one of them doesn't stop the check.
+        """
+        stats = [_stat_or_none(file) for file in files]
+        by_size: dict[int, list[int]] = {}
+        for i, stat in enumerate(stats):
+            if stat is not None and stat.st_size > 0:
+                by_size.setdefault(stat.st_size, []).append(i)
+        candidates = [i for group in by_size.values() if len(group) > 1 for i in group]
+        candidates.sort()
+        digests = self.digests(
+            [files[i] for i in candidates],
+            [stats[i] for i in candidates],
+            skip_unreadable = True,
+        )
+        by_digest: dict[tuple[int, bytes], list[Path]] = {}
+        for i, digest in zip(candidates, digests):
+            if digest is None:
+                continue
+            by_digest.setdefault((stats[i].st_size, digest), []).append(files[i])
+        return [group for group in by_digest.values() if len(group) > 1]
+    #:
+#:
+
+_default_hasher: FileHasher | None = None
+
+def default_hasher() -> FileHasher:
+    """
+    The hasher shared by the naming templates and the duplicate checks,
+    with the default on-disk cache (or none, if it can't be opened).
+    """
+    global _default_hasher
+    if _default_hasher is None:
+        try:
+            cache = HashCache()
+        except (OSError, sqlite3.Error):
+            cache = None
+        _default_hasher = FileHasher(cache)
+    return _default_hasher
+#:
+
+def find_duplicates(files: list[Path]) -> list[list[Path]]:
+    """`FileHasher.find_duplicates` with the default hasher."""
+    return default_hasher().find_duplicates(files)
+#:
+
+def _stat_or_none(path: Path) -> os.stat_result | None:
+    try:
+        return os.stat(path)
+    except OSError:
+        return None
+#:
+
+def _hash_or_none(path: Path) -> bytes | None:
+    try:
+        return hash_file(path)
+    except OSError:
+        return None
+#:
+
+def _int64(value: int) -> int:
+    return (value + (1 << 63)) % (1 << 64) - (1 << 63)
+#:
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+# rprename/journal.py
+
+"""
+This module provides a write-ahead journal for rename batches, so that
+a batch interrupted midway (eg, the process was killed or the machine
+crashed) can be resumed later, without renaming the wrong files.
+
+A journal is a JSON Lines file, written in the journal directory
+before the first rename:
+
+    {"version": 2, "created": "...", "steps": 3}      header
+    ["/photos/a.jpg", "/photos/img_1.jpg", true]      one intent per
+    ["/photos/b.jpg", "/photos/img_2.jpg", true]      plan step, in
+    ["/photos/c.jpg", "/photos/img_3.jpg", true]      plan order
+    {"done": [0, 1]}                                  completion records
+
+Intents of moves to a temporary name (to break a cycle, see
+`planner.py`) also record the `[st_dev, st_ino]` of their source.
+
+Intent records are written (and fsync'ed) in one go, before anything
+is renamed. Completions are committed in groups, every `group_size`
+renames or `group_interval` seconds: the directories of the renamed
+files are fsync'ed first, then the completion record is appended and
+the journal is fsync'ed. So a few syscalls are paid per group, instead
+of per file. The journal is removed when the batch completes.
+
+Completion records are only a shortcut. When resuming, the steps that
+aren't recorded as done are checked against the filesystem, in plan
+order: a final step whose target exists was already done (the planner
+made sure that targets don't exist, or are moved away by earlier
+steps). That doesn't hold for moves to a temporary name: the temporary
+file is moved away by a later step, the last one of the cycle. Once
+the cycle is complete, the same names exist as before it started, but
+the source of the temporary move is now another file (with another
+inode): then the move was done.
+
+It doesn't depend on Qt.
+"""
+
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, Iterator
+
+from .fsutils import fsync_dir, user_state_dir
+from .planner import PlanStep
+
+
+__all__ = [
+    'JournalError',
+    'RenameJournal',
+    'default_journal_dir',
+    'list_journals',
+]
+
+
+JOURNAL_VERSION = 2
+# Journals written before temporary moves recorded their sources can
+# still be resumed
+JOURNAL_READ_VERSIONS = {1, JOURNAL_VERSION}
+JOURNAL_SUFFIX = '.jsonl'
+
+# Completion records are committed every JOURNAL_GROUP_SIZE renames or
+# every JOURNAL_GROUP_INTERVAL seconds, whichever comes first
+JOURNAL_GROUP_SIZE = 1000
+JOURNAL_GROUP_INTERVAL = 0.5
+
+
+class JournalError(Exception):
+    """The journal file is missing or can't be parsed."""
+#:
+
+def default_journal_dir() -> Path:
+    return user_state_dir() / 'journals'
+#:
+
+def list_journals(journal_dir: Path | None = None) -> list[Path]:
+    """
+    The journals of unfinished batches in `journal_dir`, oldest first.
+    """
+    journal_dir = journal_dir if journal_dir is not None else default_journal_dir()
+    try:
+        return sorted(journal_dir.glob(f'*{JOURNAL_SUFFIX}'))
+    except FileNotFoundError:
+        return []
+#:
+
+class RenameJournal:
+    """
+    The journal of one rename batch. Use `create` for a new batch or
+    `open` to resume an unfinished one, call `record_done` after each
+    rename and `close` at the end:
+
+        journal = RenameJournal.create(plan.steps)
+        engine.run(plan.steps, lambda _, new_file: journal.record_done(new_file))
+        journal.close(completed = True)
+
+    Renames not recorded with `record_done` (eg, moves to temporary
+    names) are detected when resuming, so recording them is optional.
+    """
+    def __init__(
+            self,
+            path: Path,
+            steps: list[PlanStep],
+            done: set[int],
+            sources: dict[int, tuple[int, int]] | None = None,
+            group_size = JOURNAL_GROUP_SIZE,
+            group_interval = JOURNAL_GROUP_INTERVAL,
+    ):
+        # Use `create` or `open` instead
+        self.path = path
+        self.steps = steps
+        self._done = done
+        # `(st_dev, st_ino)` of the sources of the temporary moves, by
+        # step number
+        self._sources = sources if sources is not None else {}
+        self._step_index = {os.fspath(step.dst): i for i, step in enumerate(steps)}
+        self._group_size = max(group_size, 1)
+        self._group_interval = group_interval
+        self._pending: list[int] = []
+        self._last_commit = time.monotonic()
+        self._file = open(path, 'a', encoding = 'utf-8')
+    #:
+
+    @classmethod
+    def create(
+            cls,
+            steps: Iterable[PlanStep],
+            journal_dir: Path | None = None,
+            **kargs,
+    ) -> 'RenameJournal':
+        """
+        Writes the journal for a new batch with the plan `steps` and
+        makes it durable. Returns only when it's safe to start renaming.
+        """
+        journal_dir = journal_dir if journal_dir is not None else default_journal_dir()
+        journal_dir.mkdir(parents = True, exist_ok = True)
+        # Paths are stored absolute, so the batch can be resumed from
+        # any directory
+        steps = [
+            PlanStep(src.absolute(), dst.absolute(), final)
+            for src, dst, final in steps
+        ]
+        # Only cycles have temporary moves, so this stats few files
+        sources = {
+            i: _identity(os.lstat(step.src))
+            for i, step in enumerate(steps) if not step.final
+        }
+        now = datetime.now()
+        name = f'{now:%Y%m%d-%H%M%S-%f}-{os.getpid()}{JOURNAL_SUFFIX}'
+        path = journal_dir / name
+        # The journal only shows up under its final name when all the
+        # intents are on disk
+        temp_path = journal_dir / f'.{name}.tmp'
+        with open(temp_path, 'w', encoding = 'utf-8') as file:
+            header = {
+                'version': JOURNAL_VERSION,
+                'created': now.isoformat(),
+                'steps': len(steps),
+            }
+            lines = [json.dumps(header)]
+            for i, (src, dst, final) in enumerate(steps):
+                intent = [os.fspath(src), os.fspath(dst), final]
+                if i in sources:
+                    intent.append(list(sources[i]))
+                lines.append(json.dumps(intent))
+            lines.append('')
+            file.write('\n'.join(lines))
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, path)
+        fsync_dir(journal_dir)
+        return cls(path, steps, set(), sources, **kargs)
+    #:
+
+    @classmethod
+    def open(cls, path: Path, **kargs) -> 'RenameJournal':
+        """
+        Opens the journal of an unfinished batch, to resume it (see
+        `pending_steps`).
+        """
+        try:
+            with open(path, encoding = 'utf-8') as file:
+                lines = file.read().split('\n')
+        except OSError as ex:
+            raise JournalError(f"Can't read journal '{path}': {ex}") from ex
+        try:
+            header = json.loads(lines[0])
+            if header.get('version') not in JOURNAL_READ_VERSIONS:
+                raise JournalError(f"Unsupported journal version in '{path}'")
+            step_count = header['steps']
+            steps = []
+            sources = {}
+            for i, (src, dst, final, *source) in enumerate(
+                    map(json.loads, lines[1 : step_count + 1])
+            ):
+                steps.append(PlanStep(Path(src), Path(dst), final))
+                if source:
+                    dev, ino = source[0]
+                    sources[i] = (dev, ino)
+        except (ValueError, KeyError, TypeError, AttributeError) as ex:
+            raise JournalError(f"Invalid journal '{path}': {ex}") from ex
+        if len(steps) != step_count:
+            raise JournalError(f"Invalid journal '{path}': missing intent records")
+        done = set()
+        for line in lines[step_count + 1:]:
+            try:
+                done.update(json.loads(line)['done'])
+            except (ValueError, KeyError, TypeError):
+                # The last record may be incomplete if we crashed while
+                # writing it: that's fine, those steps are checked
+                # against the filesystem
+                break
+        return cls(path, steps, done, sources, **kargs)
+    #:
+
+    def pending_steps(self) -> Iterator[PlanStep]:
+        """
+        Yields the steps that still have to run, in plan order. Each
+        step is checked when it's about to be yielded, so the renames
+        of the previous steps must be done by then (eg, by passing
+        this iterator straight to `RenameEngine.run`).
+        """
+        for i, step in enumerate(self.steps):
+            if i in self._done:
+                continue
+            if os.path.lexists(step.dst) or self._temp_move_done(i):
+                self._done.add(i)
+                continue
+            yield step
+    #:
+
+    def _temp_move_done(self, i: int) -> bool:
+        """
+        Whether step `i`, a move to a temporary name that isn't there
+        any more, was done: its source is now another file (moved there
+        by the next step of the cycle).
+        """
+        if (source := self._sources.get(i)) is None:
+            return False
+        try:
+            return _identity(os.lstat(self.steps[i].src)) != source
+        except FileNotFoundError:
+            return False
+    #:
+
+    def temp_files_left(self) -> bool:
+        """
+        Whether any file of the batch is still under a temporary name
+        (see `planner.py`), ie, the batch was interrupted in the middle
+        of a cycle.
+        """
+        return any(not step.final and os.path.lexists(step.dst) for step in self.steps)
+    #:
+
+    def record_done(self, new_file: Path):
+        """
+        Records that the step renaming to `new_file` is done. The
+        record is committed with the next group.
+        """
+        i = self._step_index.get(os.fspath(new_file.absolute()))
+        if i is None:
+            raise ValueError(f"'{new_file}' isn't a target of this batch")
+        self._pending.append(i)
+        if (
+                len(self._pending) >= self._group_size
+                or time.monotonic() - self._last_commit >= self._group_interval
+        ):
+            self.commit()
+    #:
+
+    def commit(self):
+        """
+        Makes the pending renames and their completion records durable.
+        """
+        if self._pending:
+            self._sync_pending_dirs()
+            self._file.write(json.dumps({'done': self._pending}) + '\n')
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._done.update(self._pending)
+            self._pending = []
+        self._last_commit = time.monotonic()
+    #:
+
+    def close(self, completed: bool):
+        """
+        Commits the pending records and closes the journal. If the
+        batch was `completed`, the journal is removed instead (once the
+        last renames are durable).
+        """
+        if self._file.closed:
+            return
+        try:
+            if not completed:
+                self.commit()
+        finally:
+            self._file.close()
+        if completed:
+            self._sync_pending_dirs()
+            self._pending = []
+            self.path.unlink(missing_ok = True)
+            fsync_dir(self.path.parent)
+    #:
+
+    def _sync_pending_dirs(self):
+        # os.path.dirname is much faster than Path.parent here
+        dirname = os.path.dirname
+        dirs = set()
+        for i in self._pending:
+            src, dst, _ = self.steps[i]
+            dirs.add(dirname(src))
+            dirs.add(dirname(dst))
+        for dir_path in dirs:
+            fsync_dir(dir_path)
+    #:
+#:
+#:
+
+def _identity(file_stat: os.stat_result) -> tuple[int, int]:
+    return file_stat.st_dev, file_stat.st_ino
+#:
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+# rprename/loader.py
+
+"""
+This module provides a streaming directory loader. Directories are
+walked with `os.scandir` and matching files are yielded in chunks, so a
+caller (eg, a view running the loader in an executor) can show the
+first files right away, even for directories with millions of entries.
+It doesn't depend on Qt.
+"""
+
+import os
+import re
+from typing import Callable, Iterable, Iterator
+
+
+__all__ = [
+    'extension_matcher',
+    'scan_directory',
+]
+
+
+# Chunk sizes start small, so that the first files show up quickly, and
+# double up to the maximum, so that big directories aren't delivered in
+# too many pieces
+FIRST_CHUNK_SIZE = 256
+MAX_CHUNK_SIZE = 16384
+
+
+def extension_matcher(extensions: Iterable[str]) -> Callable[[str], bool]:
+    """
+    Returns a function that tells whether a file name ends with one of
+    `extensions` (eg, `['.jpg', '.png']`), ignoring case. The check is
+    done by a single precompiled regular expression.
+    """
+    alternatives = '|'.join(re.escape(ext.lstrip('.')) for ext in extensions)
+    regex = re.compile(rf'.*\.(?:{alternatives})\Z', re.IGNORECASE | re.DOTALL)
+    return lambda name: regex.match(name) is not None
+#:
+
+def scan_directory(
+        dir_path: str | os.PathLike,
+        matcher: Callable[[str], bool] | None = None,
+        recursive = False,
+        first_chunk_size = FIRST_CHUNK_SIZE,
+        max_chunk_size = MAX_CHUNK_SIZE,
+) -> Iterator[list[str]]:
+    """
+    Walks `dir_path` (and its subdirectories if `recursive`) and yields
+    lists with the paths (as `str`) of the regular files whose names are
+    accepted by `matcher` (all files if no `matcher` is given).
+    Symbolic links to directories aren't followed. Subdirectories that
+    can't be read are skipped.
+    """
+    chunk: list[str] = []
+    chunk_size = first_chunk_size
+    pending_dirs = [os.fspath(dir_path)]
+    while pending_dirs:
+        current_dir = pending_dirs.pop()
+        try:
+            entries = os.scandir(current_dir)
+        except OSError:
+            if current_dir == os.fspath(dir_path):
+                raise
+            continue
+        with entries:
+            for entry in entries:
+                # is_file/is_dir use the type returned by the directory
+                # listing, without an extra stat in most filesystems
+                if entry.is_file():
+                    if matcher is None or matcher(entry.name):
+                        chunk.append(entry.path)
+                        if len(chunk) >= chunk_size:
+                            yield chunk
+                            chunk = []
+                            chunk_size = min(2 * chunk_size, max_chunk_size)
+                elif recursive and entry.is_dir(follow_symlinks = False):
+                    pending_dirs.append(entry.path)
+    if chunk:
+        yield chunk
+#:
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+# rprename/metadata.py
+
+"""
+This module reads photo metadata (capture time and camera model) from
+the EXIF data of JPEG and PNG files, for the `{taken}` and `{camera}`
+fields of naming templates (see `naming.py`).
+
+Files are memory-mapped and only the bytes of the segment headers and
+of the EXIF block are touched, so only the first few KB of each file
+are actually read from disk, however large the photo. Files are read
+in chunks by a pool of threads, and the results are cached by
+`(st_dev, st_ino, st_size, st_mtime_ns)`, so planning the same folder
+again only stats the files.
+It doesn't depend on Qt.
+"""
+
+import mmap
+import os
+import struct
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import NamedTuple
+
+
+__all__ = [
+    'PhotoMetadata',
+    'MetadataReader',
+    'read_metadata',
+    'default_reader',
+]
+
+
+# Files are read by the pool in chunks of METADATA_CHUNK_SIZE files,
+# so that small files don't pay one task each
+METADATA_CHUNK_SIZE = 256
+METADATA_MAX_WORKERS = 8
+
+# Entries kept by the cache of a MetadataReader (oldest dropped first)
+METADATA_CACHE_SIZE = 1_000_000
+
+# JPEG segments are only looked for in the first JPEG_SCAN_LIMIT bytes
+JPEG_SCAN_LIMIT = 1 << 20
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+EXIF_HEADER = b'Exif\x00\x00'
+
+# TIFF tags
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+TAG_DATE_TIME = 0x0132
+TAG_EXIF_IFD = 0x8769
+TAG_DATE_TIME_ORIGINAL = 0x9003
+TAG_DATE_TIME_DIGITIZED = 0x9004
+TIFF_ASCII = 2
+
+
+class PhotoMetadata(NamedTuple):
+    taken: datetime | None      # when the photo was taken (from EXIF)
+    camera: str | None          # camera model (from EXIF)
+    mtime: float                # modification time of the file
+#:
+
+def read_metadata(path: str | os.PathLike, stat: os.stat_result | None = None) -> PhotoMetadata:
+    """
+    Reads the metadata of the photo at `path`. Files that aren't JPEG
+    or PNG photos, or have no (valid) EXIF data, get None values.
+    """
+    fd = os.open(path, os.O_RDONLY | getattr(os, 'O_BINARY', 0))
+    try:
+        stat = stat if stat is not None else os.fstat(fd)
+        taken = camera = None
+        if stat.st_size > 0:
+            with mmap.mmap(fd, 0, access = mmap.ACCESS_READ) as data:
+                if hasattr(mmap, 'MADV_RANDOM'):
+                    # Only the pages touched are needed: no readahead
+                    data.madvise(mmap.MADV_RANDOM)
+                try:
+                    tiff = _find_exif(data)
+                    if tiff is not None:
+                        taken, camera = _parse_tiff(data, tiff)
+                except (struct.error, ValueError, IndexError):
+                    # Truncated or corrupted metadata
+                    pass
+    finally:
+        os.close(fd)
+    return PhotoMetadata(taken, camera, stat.st_mtime)
+#:
+
+class MetadataReader:
+    """
+    Reads the metadata of many files at once with a pool of
+    `max_workers` threads, caching the results. Thread-safe.
+    """
+    def __init__(
+            self,
+            max_workers = METADATA_MAX_WORKERS,
+            cache_size = METADATA_CACHE_SIZE,
+    ):
+        self._max_workers = max_workers
+        self._cache_size = cache_size
+        self._cache: dict[tuple[int, int, int, int], PhotoMetadata] = {}
+        self._lock = threading.Lock()
+    #:
+
+    def read_many(self, files: list[Path]) -> list[PhotoMetadata]:
+        """
+        The metadata of `files`, in order. Raises `OSError` if a file
+        can't be read.
+        """
+        chunks = [
+            files[i : i + METADATA_CHUNK_SIZE]
+            for i in range(0, len(files), METADATA_CHUNK_SIZE)
+        ]
+        if len(chunks) <= 1:
+            results = [self._read_chunk(chunk) for chunk in chunks]
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(min(self._max_workers, len(chunks))) as executor:
+                results = list(executor.map(self._read_chunk, chunks))
+        return [metadata for chunk in results for metadata in chunk]
+    #:
+
+    def _read_chunk(self, files: list[Path]) -> list[PhotoMetadata]:
+        cache = self._cache
+        results = []
+        missing = []
+        for file in files:
+            stat = os.stat(file)
+            key = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+            if (metadata := cache.get(key)) is None:
+                metadata = read_metadata(file, stat)
+                missing.append((key, metadata))
+            results.append(metadata)
+        if missing:
+            with self._lock:
+                cache.update(missing)
+                while len(cache) > self._cache_size:
+                    del cache[next(iter(cache))]
+        return results
+    #:
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+    #:
+#:
+
+_default_reader: MetadataReader | None = None
+
+def default_reader() -> MetadataReader:
+    """The reader (and cache) shared by the naming templates."""
+    global _default_reader
+    if _default_reader is None:
+        _default_reader = MetadataReader()
+    return _default_reader
+#:
+
+def _find_exif(data: mmap.mmap) -> int | None:
+    """
+    The offset of the TIFF header of the EXIF data in `data` (a JPEG or
+    PNG file), or None.
+    """
+    if data[:2] == b'\xff\xd8':
+        # JPEG: walk the segments until the image data starts
+        pos = 2
+        limit = min(len(data), JPEG_SCAN_LIMIT)
+        while pos + 4 <= limit:
+            if data[pos] != 0xFF:
+                return None
+            marker = data[pos + 1]
+            if marker == 0xFF:          # fill byte
+                pos += 1
+                continue
+            if marker == 0xDA or marker == 0xD9:   # start of scan, end of image
+                return None
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:   # no length
+                pos += 2
+                continue
+            (length,) = struct.unpack_from('>H', data, pos + 2)
+            if marker == 0xE1 and data[pos + 4 : pos + 10] == EXIF_HEADER:
+                return pos + 10
+            pos += 2 + length
+        return None
+    if data[:8] == PNG_SIGNATURE:
+        # PNG: the eXIf chunk (if any) comes before the image data
+        pos = 8
+        while pos + 8 <= len(data):
+            length, chunk_type = struct.unpack_from('>I4s', data, pos)
+            if chunk_type == b'eXIf':
+                return pos + 8
+            if chunk_type == b'IDAT' or chunk_type == b'IEND':
+                return None
+            pos += 12 + length
+        return None
+    return None
+#:
+
+def _parse_tiff(data: mmap.mmap, tiff: int) -> tuple[datetime | None, str | None]:
+    byte_order = data[tiff : tiff + 2]
+    if byte_order == b'II':
+        order = '<'
+    elif byte_order == b'MM':
+        order = '>'
+    else:
+        return None, None
+    (magic, ifd0) = struct.unpack_from(f'{order}HI', data, tiff + 2)
+    if magic != 42:
+        return None, None
+    tags = _read_ifd(data, tiff, ifd0, order)
+    if (exif_ifd := tags.get(TAG_EXIF_IFD)) is not None:
+        tags.update(_read_ifd(data, tiff, exif_ifd, order))
+    taken = None
+    for tag in (TAG_DATE_TIME_ORIGINAL, TAG_DATE_TIME_DIGITIZED, TAG_DATE_TIME):
+        if isinstance(value := tags.get(tag), str):
+            try:
+                taken = _parse_exif_date(value)
+                break
+            except ValueError:
+                # Eg, '    :  :     :  :  ' (unknown date)
+                continue
+    camera = tags.get(TAG_MODEL)
+    camera = _clean_camera_name(camera) if isinstance(camera, str) else None
+    return taken, camera or None
+#:
+
+def _read_ifd(data: mmap.mmap, tiff: int, offset: int, order: str) -> dict[int, str | int]:
+    """
+    The ASCII values (and the EXIF IFD pointer) of the IFD at `offset`
+    (from the TIFF header).
+    """
+    wanted = {
+        TAG_MAKE, TAG_MODEL, TAG_DATE_TIME, TAG_EXIF_IFD,
+        TAG_DATE_TIME_ORIGINAL, TAG_DATE_TIME_DIGITIZED,
+    }
+    values: dict[int, str | int] = {}
+    (count,) = struct.unpack_from(f'{order}H', data, tiff + offset)
+    entry = tiff + offset + 2
+    for _ in range(count):
+        tag, type_, value_count, value = struct.unpack_from(f'{order}HHII', data, entry)
+        entry += 12
+        if tag not in wanted:
+            continue
+        if tag == TAG_EXIF_IFD:
+            values[tag] = value
+        elif type_ == TIFF_ASCII:
+            # Values of up to 4 bytes are stored in the entry itself
+            start = entry - 4 if value_count <= 4 else tiff + value
+            raw = data[start : start + value_count]
+            values[tag] = raw.split(b'\x00', 1)[0].decode('ascii', 'replace').strip()
+    return values
+#:
+
+def _parse_exif_date(text: str) -> datetime:
+    # 'YYYY:MM:DD HH:MM:SS' (`strptime` is much slower)
+    return datetime(
+        int(text[0:4]), int(text[5:7]), int(text[8:10]),
+        int(text[11:13]), int(text[14:16]), int(text[17:19]),
+    )
+#:
+
+def _clean_camera_name(name: str) -> str:
+    # Camera names end up in file names
+    return ' '.join(name.replace('/', '-').replace('\\', '-').split())
+#:
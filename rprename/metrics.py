@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+# rprename/metrics.py
+
+"""
+This module provides `RenameMetrics`, live measures of a rename batch:
+throughput over a sliding window, a per-file rename latency histogram,
+error counts and an ETA. Renames are recorded by the engine (from any
+thread) and completions by the renamer; anyone can take a `snapshot`
+at any time. It doesn't depend on Qt.
+"""
+
+import threading
+import time
+from typing import NamedTuple
+
+
+__all__ = [
+    'MetricsSnapshot',
+    'RenameMetrics',
+]
+
+
+# The rate is measured over the last RATE_WINDOW seconds, in
+# RATE_SLOTS slots (so the oldest slot is dropped as a whole)
+RATE_WINDOW = 5.0
+RATE_SLOTS = 20
+
+# Latency histogram bucket i counts the renames that took less than
+# 2**i microseconds (and at least 2**(i - 1)); the last bucket counts
+# all the slower ones
+LATENCY_BUCKETS = 32
+
+
+class MetricsSnapshot(NamedTuple):
+    completed: int              # files renamed so far
+    total: int                  # files in the batch
+    errors: int                 # renames that failed
+    elapsed: float              # seconds since the batch started
+    rate: float                 # files/s over the last RATE_WINDOW seconds
+    eta: float | None           # seconds left at `rate` (None if unknown)
+    latency_p50: float | None   # upper bounds (in seconds) of the latency
+    latency_p99: float | None   #   histogram buckets with the percentiles
+    latency_histogram: tuple[int, ...]
+
+    @property
+    def stalled(self) -> bool:
+        """Started, not done, but no files renamed in the last window."""
+        return self.completed < self.total and self.elapsed >= RATE_WINDOW and self.rate == 0
+    #:
+#:
+
+class RenameMetrics:
+    """
+    Thread-safe counters for one batch. Call `start` with the number of
+    files when the batch starts, `record_latency`/`record_error` for
+    each rename (`RenameEngine` does it when given `metrics`) and
+    `record_completed` as files are reported as renamed.
+
+    Pickled metrics come back empty (eg, in the worker processes of a
+    `ProcessPoolRun`, whose latencies are therefore not recorded).
+    """
+    def __init__(self, window = RATE_WINDOW, slots = RATE_SLOTS):
+        self._window = window
+        self._slot_width = window / slots
+        self._lock = threading.Lock()
+        self.start(0)
+    #:
+
+    def __getstate__(self) -> dict:
+        return {'window': self._window, 'slots': round(self._window / self._slot_width)}
+    #:
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
+    #:
+
+    def start(self, total: int):
+        with self._lock:
+            self._total = total
+            self._completed = 0
+            self._errors = 0
+            self._start_time = time.monotonic()
+            # [slot index, files completed in the slot], oldest first
+            self._slots: list[list[int]] = []
+            self._histogram = [0] * LATENCY_BUCKETS
+    #:
+
+    def record_latency(self, seconds: float):
+        bucket = min(int(seconds * 1e6).bit_length(), LATENCY_BUCKETS - 1)
+        with self._lock:
+            self._histogram[bucket] += 1
+    #:
+
+    def record_error(self):
+        with self._lock:
+            self._errors += 1
+    #:
+
+    def record_completed(self, count = 1):
+        with self._lock:
+            self._completed += count
+            slot = int((time.monotonic() - self._start_time) / self._slot_width)
+            if self._slots and self._slots[-1][0] == slot:
+                self._slots[-1][1] += count
+            else:
+                self._slots.append([slot, count])
+    #:
+
+    def snapshot(self) -> MetricsSnapshot:
+        with self._lock:
+            now = time.monotonic()
+            elapsed = now - self._start_time
+            current_slot = int(elapsed / self._slot_width)
+            first_slot = current_slot - round(self._window / self._slot_width) + 1
+            while self._slots and self._slots[0][0] < first_slot:
+                del self._slots[0]
+            in_window = sum(count for _, count in self._slots)
+            span = min(elapsed, self._window)
+            rate = in_window / span if span > 0 else 0.0
+            remaining = self._total - self._completed
+            histogram = tuple(self._histogram)
+            return MetricsSnapshot(
+                completed = self._completed,
+                total = self._total,
+                errors = self._errors,
+                elapsed = elapsed,
+                rate = rate,
+                eta = remaining / rate if rate > 0 else (0.0 if remaining <= 0 else None),
+                latency_p50 = _histogram_percentile(histogram, 50),
+                latency_p99 = _histogram_percentile(histogram, 99),
+                latency_histogram = histogram,
+            )
+    #:
+#:
+
+def _histogram_percentile(histogram: tuple[int, ...], percent: float) -> float | None:
+    total = sum(histogram)
+    if total == 0:
+        return None
+    threshold = total * percent / 100
+    seen = 0
+    for bucket, count in enumerate(histogram):
+        seen += count
+        if seen >= threshold:
+            return (1 << bucket) / 1e6
+    return (1 << (len(histogram) - 1)) / 1e6
+#:
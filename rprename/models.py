@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+# rprename/models.py
+
+"""
+This module provides the Qt item models used by the RP Renamer views.
+"""
+
+from typing import Callable, Iterable, Sequence
+
+from PySide6.QtCore import (
+    QAbstractListModel, QIdentityProxyModel, QModelIndex, QObject, QRunnable, Qt,
+    QThreadPool, Signal,
+)
+
+from .naming import NameTemplate
+
+
+# Items removed from the front of a FileListModel are only dropped from
+# memory once there are at least this many of them (and they make up
+# more than half of the list)
+COMPACT_THRESHOLD = 4096
+
+# NamePreviewModel computes the names of PREVIEW_BLOCK_SIZE rows at a
+# time, starting PREVIEW_PREFETCH rows before the first row asked for
+# (so, with a view showing some 30 rows, a block covers the visible rows
+# and a margin around them, and scrolling by a few rows needs no work)
+PREVIEW_BLOCK_SIZE = 128
+PREVIEW_PREFETCH = 32
+# Names cached by a NamePreviewModel (all dropped when there are more)
+PREVIEW_CACHE_SIZE = 100_000
+# Shown for the names still being computed in the background
+PREVIEW_PLACEHOLDER = '…'
+
+class FileListModel(QAbstractListModel):
+    """
+    A read-only list model with file paths, meant to be shown in a
+    `QListView` (with uniform item sizes, so that the view only asks
+    for the visible rows).
+
+    Paths are kept as plain strings in a list. Removing rows from the
+    front only moves a head offset, and the removed strings are dropped
+    in bulk from time to time, so `pop_front` is O(1) amortized.
+    All changes are notified with range-based updates (or, see
+    `reorder`, with `rowsReordered`).
+    """
+    rowsReordered = Signal()
+
+    def __init__(self, parent: QObject | None = None):
+        super().__init__(parent)
+        self._items: list[str] = []
+        self._head = 0
+    #:
+
+    def rowCount(self, parent = QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._items) - self._head
+    #:
+
+    def data(self, index: QModelIndex, role = Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and index.isValid():
+            return self._items[self._head + index.row()]
+        return None
+    #:
+
+    def paths(self) -> list[str]:
+        """The paths of all the rows (don't change the list)."""
+        return self._items if self._head == 0 else self._items[self._head:]
+    #:
+
+    def extend(self, items: Iterable[str]):
+        items = list(items)
+        if not items:
+            return
+        first_row = self.rowCount()
+        self.beginInsertRows(QModelIndex(), first_row, first_row + len(items) - 1)
+        self._items.extend(items)
+        self.endInsertRows()
+    #:
+
+    def pop_front(self, count: int):
+        count = min(count, self.rowCount())
+        if count <= 0:
+            return
+        self.beginRemoveRows(QModelIndex(), 0, count - 1)
+        self._head += count
+        if self._head >= COMPACT_THRESHOLD and 2 * self._head > len(self._items):
+            del self._items[:self._head]
+            self._head = 0
+        self.endRemoveRows()
+    #:
+
+    def clear(self):
+        self.beginResetModel()
+        self._items = []
+        self._head = 0
+        self.endResetModel()
+    #:
+
+    def reorder(self, items: Iterable[str]):
+        """
+        Replaces the rows with `items`, the same paths in another order
+        (eg, sorted), and emits `rowsReordered`.
+
+        That's instead of `layoutChanged` (or a reset): `QListView`
+        then lays out all of its rows again, calling `index` and
+        `rowCount` (here in Python) twice per row, some 1.8 s for 500k
+        rows. Reordered rows keep their number and size, so views only
+        need to repaint (eg, connect it to `view.viewport().update`);
+        persistent indexes (eg, the selection) keep their row numbers.
+        """
+        items = list(items)
+        if len(items) != self.rowCount():
+            raise ValueError('Reordered rows must be as many as the rows')
+        self._items = items
+        self._head = 0
+        self.rowsReordered.emit()
+    #:
+#:
+
+class NamePreviewModel(QIdentityProxyModel):
+    """
+    Shows, for each row of a `FileListModel`, the name the file would
+    be renamed to with `template` (a `NameTemplate`, or None to show
+    nothing).
+
+    Names are only computed for the rows the view asks for (the visible
+    ones, with uniform item sizes), a block at a time, and cached until
+    the template or the files change. Blocks that need the disk (fields
+    read from the files, like `{mtime}` or `{hash}`) or the whole list
+    (the first block with `{dn}`) are computed in a worker thread, one
+    at a time, and show `PREVIEW_PLACEHOLDER` meanwhile, so typing
+    never waits for them. `onError` is called with the exception if
+    names can't be computed (eg, a file is gone).
+
+    A new template (or reordered files) emits `namesChanged` instead
+    of `dataChanged`: `QListView` lays out all of its rows again on any
+    `dataChanged` (some 3 s for 1M rows), while the rows don't move
+    here. Views only need to repaint (eg, connect it to
+    `view.viewport().update`).
+    """
+    namesChanged = Signal()
+
+    def __init__(
+            self,
+            sourceModel: FileListModel,
+            parent: QObject | None = None,
+            onError: Callable[[Exception], None] | None = None,
+    ):
+        super().__init__(parent)
+        self._template: NameTemplate | None = None
+        self._onError = onError
+        self._names: dict[int, str] = {}
+        # Columns that only depend on the files (see NameTemplate.preview).
+        # Replaced, not cleared, as workers may still be filling it
+        self._columns: dict = {}
+        # Bumped whenever the names change, so that blocks computed for
+        # an older template or list of files are dropped
+        self._generation = 0
+        self._pool = QThreadPool(self)
+        self._pool.setMaxThreadCount(1)
+        self._blockSignals = _PreviewBlockSignals(self)
+        self._blockSignals.blockReady.connect(self._on_block_ready)
+        self._blockSignals.blockFailed.connect(self._on_block_failed)
+        self.setSourceModel(sourceModel)
+        for signal in (
+                sourceModel.rowsInserted, 
+                sourceModel.rowsRemoved, 
+                sourceModel.modelReset,
+        ):
+            signal.connect(self._clear_cache)
+        sourceModel.rowsReordered.connect(self._update_names)
+    #:
+
+    def template(self) -> NameTemplate | None:
+        return self._template
+    #:
+
+    def set_template(self, template: NameTemplate | None):
+        if template == self._template:
+            return
+        self._template = template
+        self._names.clear()
+        self._drop_pending_blocks()
+        self.namesChanged.emit()
+    #:
+
+    def data(self, index: QModelIndex, role = Qt.ItemDataRole.DisplayRole):
+        if role != Qt.ItemDataRole.DisplayRole or not index.isValid():
+            return None
+        if self._template is None:
+            return None
+        row = index.row()
+        if (name := self._names.get(row)) is None:
+            self._compute_block(row)
+            name = self._names.get(row, '')
+        return name
+    #:
+
+    def _compute_block(self, row: int):
+        start = max(row - PREVIEW_PREFETCH, 0)
+        stop = min(start + PREVIEW_BLOCK_SIZE, self.rowCount())
+        template = self._template
+        if template.reads_files or (template.numbers_by_directory and not self._columns):
+            self._pool.start(
+                _PreviewBlock(
+                    template, self.sourceModel().paths(), start, stop,
+                    self._columns, self._generation, self._blockSignals,
+                )
+            )
+            self._store_names(start, [PREVIEW_PLACEHOLDER] * (stop - start))
+            return
+        try:
+            names = template.preview(
+                self.sourceModel().paths(), start, stop, cache = self._columns,
+            )
+        except (OSError, ValueError) as ex:
+            self._on_block_failed(self._generation, start, stop, ex)
+            return
+        self._store_names(start, names)
+    #:
+
+    def _store_names(self, start: int, names: list[str]):
+        if len(self._names) >= PREVIEW_CACHE_SIZE:
+            self._names.clear()
+        self._names.update(zip(range(start, start + len(names)), names))
+    #:
+
+    def _on_block_ready(self, generation: int, start: int, names: list[str]):
+        if generation == self._generation:
+            self._store_names(start, names)
+            self.namesChanged.emit()
+    #:
+
+    def _on_block_failed(self, generation: int, start: int, stop: int, ex: Exception):
+        if generation != self._generation:
+            return
+        # Nothing is shown until the template or the files change
+        self._store_names(start, [''] * (stop - start))
+        self.namesChanged.emit()
+        if self._onError:
+            self._onError(ex)
+    #:
+
+    def _drop_pending_blocks(self):
+        # Blocks already running can't be stopped: their names are
+        # dropped when they arrive
+        self._pool.clear()
+        self._generation += 1
+    #:
+
+    def _clear_cache(self):
+        self._names.clear()
+        self._columns = {}
+        self._drop_pending_blocks()
+    #:
+
+    def _update_names(self):
+        self._clear_cache()
+        self.namesChanged.emit()
+    #:
+#:
+
+class _PreviewBlockSignals(QObject):
+    blockReady = Signal(int, int, list)                # generation, start, names
+    blockFailed = Signal(int, int, int, object)        # generation, start, stop, error
+#:
+
+class _PreviewBlock(QRunnable):
+    """Computes the names of `files[start:stop]` in a worker thread."""
+    def __init__(
+            self,
+            template: NameTemplate,
+            files: Sequence[str],
+            start: int,
+            stop: int,
+            cache: dict,
+            generation: int,
+            signals: _PreviewBlockSignals,
+    ):
+        super().__init__()
+        self._template = template
+        self._files = files
+        self._start = start
+        self._stop = stop
+        self._cache = cache
+        self._generation = generation
+        self._signals = signals
+    #:
+
+    def run(self):
+        try:
+            names = self._template.preview(
+                self._files, self._start, self._stop, cache = self._cache,
+            )
+        except (OSError, ValueError) as ex:
+            self._signals.blockFailed.emit(self._generation, self._start, self._stop, ex)
+        else:
+            self._signals.blockReady.emit(self._generation, self._start, names)
+    #:
+#:
@@ -0,0 +1,431 @@
+# -*- coding: utf-8 -*-
+# rprename/naming.py
+
+"""
+This module provides `NameTemplate`, the naming schemes of the renamer.
+A template is the new file name, with fields in braces:
+
+    {n}             file number in the batch, starting at 1
+    {n:3}           ... zero-padded to 3 digits
+    {n:auto}        ... zero-padded to the digits of the batch total
+    {dn}            file number within its directory (same options)
+    {stem}          original name, without the suffix
+    {ext}           original suffix, with the dot (eg, '.jpg')
+    {date}          date of the batch, as %Y%m%d
+    {date:%Y-%m}    ... with any `strftime` format
+    {mtime}         modification time of the file (same options)
+    {taken}         when the photo was taken, from its EXIF data (same
+                    options; the modification time if there's none)
+    {camera}        camera model, from the EXIF data ('unknown' if none)
+    {hash}          BLAKE2b digest of the contents, 16 hex digits
+    {hash:8}        ... the first 8 hex digits (up to 64)
+
+Text fields (`stem`, `ext`, `date`, `mtime`, `taken`, `camera`, `hash`)
+can be followed by case transforms: `{stem|lower}`, `{ext|upper}`,
+`{stem|title}`. Use `{{` and `}}` for literal braces. Eg:
+
+    NameTemplate('vacation_{n:auto}{ext|lower}')
+    NameTemplate('{date:%Y-%m-%d}_{stem}_{dn:2}{ext}')
+    NameTemplate('{taken:%Y%m%d_%H%M%S}_{camera|lower}{ext|lower}')
+
+Templates are parsed once. `names` then generates the names of a
+whole batch in bulk (and `preview` those of a few rows of a batch):
+each field is computed as a column (only the fields used are computed,
+`stat` is only called for `mtime`, the EXIF data is only read for
+`taken` and `camera`, see `metadata.py`, and the contents only for
+`hash`, see `hashing.py`), and the columns are merged by a list
+comprehension with an f-string, generated from the template (like
+`collections.namedtuple` does) and cached per set of counter widths.
+
+It doesn't depend on Qt.
+"""
+
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Iterable, NamedTuple, Sequence
+
+
+__all__ = [
+    'NameTemplate',
+    'TemplateError',
+]
+
+
+COUNTER_FIELDS = {'n', 'dn'}
+TEXT_FIELDS = {'stem', 'ext', 'date', 'mtime', 'taken', 'camera', 'hash'}
+DATE_FIELDS = {'date', 'mtime', 'taken'}
+# Fields read from the EXIF data of the files
+METADATA_FIELDS = {'taken', 'camera'}
+# Fields read from the files themselves (not just from their paths)
+FILE_FIELDS = {'mtime', 'hash'} | METADATA_FIELDS
+UNKNOWN_CAMERA = 'unknown'
+# Hex digits of `{hash}`: default, maximum (BLAKE2b, 32 bytes)
+DEFAULT_HASH_LENGTH = 16
+MAX_HASH_LENGTH = 64
+DEFAULT_DATE_FORMAT = '%Y%m%d'
+# Case transforms, by name: all of them are `str` methods
+TRANSFORMS = ('lower', 'upper', 'title')
+
+
+class TemplateError(ValueError):
+    """The template can't be parsed."""
+#:
+
+class _Field(NamedTuple):
+    name: str
+    spec: str
+    transforms: tuple[str, ...]
+#:
+
+class NameTemplate:
+    """
+    A compiled naming template (see the module docs). Templates are
+    immutable and can be pickled.
+    """
+    def __init__(self, template: str):
+        self.source = template
+        # Literal text, and the fields between the literals:
+        # literals[0], fields[0], literals[1], ..., literals[-1]
+        self._literals: list[str] = []
+        self._fields: list[_Field] = []
+        self._parse(template)
+        # Merge functions, by the counter widths of the batch
+        self._mergers: dict[tuple, Callable[..., list[str]]] = {}
+    #:
+
+    @classmethod
+    def for_prefix(cls, prefix: str) -> 'NameTemplate':
+        """`prefix` followed by the file number and the original suffix."""
+        return cls(_escape(prefix) + '{n}{ext}')
+    #:
+
+    @property
+    def reads_files(self) -> bool:
+        """
+        Whether names are read from the files (`stat`, EXIF data or
+        contents), not just from their paths.
+        """
+        return any(field.name in FILE_FIELDS for field in self._fields)
+    #:
+
+    @property
+    def numbers_by_directory(self) -> bool:
+        """Whether files are numbered within their directories (`{dn}`)."""
+        return any(field.name == 'dn' for field in self._fields)
+    #:
+
+    def __repr__(self) -> str:
+        return f'{type(self).__name__}({self.source!r})'
+    #:
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, NameTemplate) and other.source == self.source
+    #:
+
+    def __hash__(self) -> int:
+        return hash(self.source)
+    #:
+
+    def __getstate__(self) -> dict:
+        # Merge functions can't be pickled; they are generated again
+        return {'template': self.source}
+    #:
+
+    def __setstate__(self, state: dict):
+        self.__init__(**state)
+    #:
+
+    def names(
+            self, 
+            files: Iterable[Path], 
+            now: datetime | None = None,
+            first = 1,
+    ) -> list[str]:
+        """
+        The new names of `files`, in order, numbered from `first` (eg,
+        to go on numbering from an earlier batch; `{dn}` too goes on
+        from `first` in each directory). `now` is the date of the batch
+        (default: the current date).
+        """
+        files = files if isinstance(files, list) else list(files)
+        return self._names(files, files, 0, now, {}, first)
+    #:
+
+    def preview(
+            self,
+            files: Sequence[str | os.PathLike],
+            start: int,
+            stop: int,
+            now: datetime | None = None,
+            cache: dict | None = None,
+    ) -> list[str]:
+        """
+        The names of `files[start:stop]`, as `names(files)` would
+        return them, but only computing those (eg, for the rows shown by
+        a view). `{dn}` needs all the files: its counters are kept in
+        `cache` (if given) for the next calls with the same `files`.
+        """
+        window = [Path(file) for file in files[start:stop]]
+        return self._names(files, window, start, now, cache if cache is not None else {})
+    #:
+
+    def _names(
+            self,
+            files: Sequence[str | os.PathLike],
+            window: list[Path],
+            start: int,
+            now: datetime | None,
+            cache: dict,
+            first = 1,
+    ) -> list[str]:
+        """
+        The names of `window` (`files[start:start + len(window)]`),
+        numbered from `first`.
+        """
+        now = now if now is not None else datetime.now()
+        stop = start + len(window)
+        # One column per field: a constant string (for dates) or one
+        # value per file
+        columns: list[str | Iterable] = []
+        widths = []
+        metadata = None
+        for field in self._fields:
+            if field.name == 'date':
+                columns.append(_transform(_format_date(now, field.spec, self.source), field))
+            elif field.name in COUNTER_FIELDS:
+                if field.name == 'n':
+                    column, total = range(start + first, stop + first), len(files)
+                else:
+                    if (counters := cache.get('dn')) is None:
+                        counters = cache['dn'] = _directory_counters(files)
+                    column, total = counters[0][start:stop], counters[1]
+                    if first != 1:
+                        column = [number + first - 1 for number in column]
+                # `auto` pads to the digits of the last number
+                total += first - 1
+                columns.append(column)
+                widths.append(len(str(total)) if field.spec == 'auto' else int(field.spec or 0))
+            else:
+                if field.name in METADATA_FIELDS and metadata is None:
+                    from .metadata import default_reader
+                    metadata = default_reader().read_many(window)
+                columns.append(self._text_column(field, window, metadata))
+        widths = tuple(widths)
+        if (merge := self._mergers.get(widths)) is None:
+            merge = self._mergers[widths] = self._compile_merger(widths)
+        return merge(len(window), *columns)
+    #:
+
+    def _compile_merger(self, widths: tuple[int, ...]) -> Callable[..., list[str]]:
+        """
+        Generates `merge(count, *columns)`, which returns the `count`
+        names built from the columns of the fields. Eg, for
+        'img_{n:3}{ext|lower}':
+
+            def merge(count, c0, c1):
+                return [f'{L0}{v0:03d}{v1.lower()}' for v0, v1 in zip(c0, c1)]
+
+        Literals are passed as globals, so they need no escaping.
+        """
+        namespace: dict[str, Any] = {}
+        parts = []
+        columns = []
+        counter_widths = iter(widths)
+        for i, (literal, field) in enumerate(zip(self._literals, self._fields)):
+            if literal:
+                namespace[f'L{i}'] = literal
+                parts.append(f'{{L{i}}}')
+            if field.name == 'date':
+                parts.append(f'{{c{i}}}')
+                continue
+            columns.append(i)
+            if field.name in COUNTER_FIELDS and (width := next(counter_widths)) > 1:
+                parts.append(f'{{v{i}:0{width}d}}')
+            else:
+                transforms = ''.join(f'.{transform}()' for transform in field.transforms)
+                parts.append(f'{{v{i}{transforms}}}')
+        if self._literals[-1]:
+            namespace['L_END'] = self._literals[-1]
+            parts.append('{L_END}')
+        name = "f'" + ''.join(parts) + "'"
+        params = ''.join(f', c{i}' for i in range(len(self._fields)))
+        if not columns:
+            body = f'[{name}] * count'
+        elif len(columns) == 1:
+            body = f'[{name} for v{columns[0]} in c{columns[0]}]'
+        else:
+            values = ', '.join(f'v{i}' for i in columns)
+            zipped = ', '.join(f'c{i}' for i in columns)
+            body = f'[{name} for {values} in zip({zipped})]'
+        source = f'def merge(count{params}):\n    return {body}\n'
+        exec(source, namespace)
+        return namespace['merge']
+    #:
+
+    def _text_column(
+            self,
+            field: _Field,
+            files: list[Path],
+            metadata: list | None,
+    ) -> Iterable[str]:
+        # Transforms are applied by the merge function
+        if field.name == 'stem':
+            return [file.stem for file in files]
+        if field.name == 'ext':
+            return [file.suffix for file in files]
+        if field.name == 'camera':
+            return [item.camera or UNKNOWN_CAMERA for item in metadata]
+        if field.name == 'taken':
+            return _taken_column(metadata, field.spec, self.source)
+        if field.name == 'hash':
+            from .hashing import default_hasher
+            length = int(field.spec)
+            return [digest.hex()[:length] for digest in default_hasher().digests(files)]
+        return _mtime_column(files, field.spec, self.source)
+    #:
+
+    def _parse(self, template: str):
+        literal: list[str] = []
+        i = 0
+        while i < len(template):
+            char = template[i]
+            if char in '{}' and template[i + 1 : i + 2] == char:
+                literal.append(char)
+                i += 2
+                continue
+            if char == '}':
+                raise TemplateError(f"Single '}}' in template '{template}' (use '}}}}')")
+            if char != '{':
+                literal.append(char)
+                i += 1
+                continue
+            end = template.find('}', i)
+            if end < 0:
+                raise TemplateError(f"Unclosed '{{' in template '{template}'")
+            self._literals.append(''.join(literal))
+            literal = []
+            self._fields.append(_parse_field(template[i + 1 : end], template))
+            i = end + 1
+        self._literals.append(''.join(literal))
+
+        for text in self._literals:
+            _check_no_separators(text, template)
+        if not any(self._literals) and not self._fields:
+            raise TemplateError('Empty template')
+        if not any(self._literals) and all(map(_can_be_empty, self._fields)):
+            raise TemplateError(f"Template '{template}' can give empty names")
+    #:
+#:
+
+def _parse_field(text: str, template: str) -> _Field:
+    name_spec, *transforms = text.split('|')
+    name, _, spec = name_spec.partition(':')
+    name = name.strip()
+    if name in COUNTER_FIELDS:
+        if transforms:
+            raise TemplateError(f"Counter '{{{name}}}' can't be transformed in '{template}'")
+        if spec != 'auto' and not (spec == '' or spec.isdigit()):
+            raise TemplateError(
+                f"Invalid width '{spec}' for '{{{name}}}' in '{template}' "
+                f"(use a number or 'auto')"
+            )
+    elif name in TEXT_FIELDS:
+        if name in DATE_FIELDS:
+            spec = spec or DEFAULT_DATE_FORMAT
+        elif name == 'hash':
+            spec = spec or str(DEFAULT_HASH_LENGTH)
+            if not (spec.isdigit() and 1 <= int(spec) <= MAX_HASH_LENGTH):
+                raise TemplateError(
+                    f"Invalid length '{spec}' for '{{hash}}' in '{template}' "
+                    f"(use 1 to {MAX_HASH_LENGTH} hex digits)"
+                )
+        elif spec:
+            raise TemplateError(f"'{{{name}}}' takes no format in '{template}'")
+    else:
+        raise TemplateError(f"Unknown field '{{{name}}}' in '{template}'")
+    for transform in transforms:
+        if transform not in TRANSFORMS:
+            raise TemplateError(
+                f"Unknown transform '{transform}' in '{template}' "
+                f"(use {', '.join(TRANSFORMS)})"
+            )
+    return _Field(name, spec, tuple(transforms))
+#:
+
+def _can_be_empty(field: _Field) -> bool:
+    if field.name == 'ext':
+        return True
+    if field.name in DATE_FIELDS:
+        # Eg, '%Z' (of dates with no time zone)
+        return datetime(2000, 1, 1).strftime(field.spec) == ''
+    return False
+#:
+
+def _check_no_separators(text: str, template: str):
+    separators = {'/', os.sep} | ({os.altsep} if os.altsep else set())
+    if any(separator in text for separator in separators):
+        raise TemplateError(f"Template '{template}' contains a path separator")
+#:
+
+def _format_date(date: datetime, date_format: str, template: str) -> str:
+    # Some formats (eg, '%D') produce separators
+    text = date.strftime(date_format)
+    _check_no_separators(text, template)
+    return text
+#:
+
+def _escape(text: str) -> str:
+    return text.replace('{', '{{').replace('}', '}}')
+#:
+
+def _transform(text: str, field: _Field) -> str:
+    for transform in field.transforms:
+        text = getattr(text, transform)()
+    return text
+#:
+
+def _directory_counters(files: Iterable[str | os.PathLike]) -> tuple[list[int], int]:
+    """
+    The number of each file within its directory, and the size of the
+    largest directory.
+    """
+    # os.path.dirname is much faster than Path.parent
+    dirname = os.path.dirname
+    counts: dict[str, int] = {}
+    column = []
+    for file in files:
+        dir_path = dirname(file)
+        count = counts.get(dir_path, 0) + 1
+        counts[dir_path] = count
+        column.append(count)
+    return column, max(counts.values(), default = 0)
+#:
+
+def _mtime_column(files: list[Path], date_format: str, template: str) -> list[str]:
+    # Files of a batch often share modification times (to the second),
+    # so each second is formatted only once
+    formatted: dict[int, str] = {}
+    column = []
+    for file in files:
+        seconds = int(os.stat(file).st_mtime)
+        if (text := formatted.get(seconds)) is None:
+            text = formatted[seconds] = _format_date(
+                datetime.fromtimestamp(seconds), date_format, template,
+            )
+        column.append(text)
+    return column
+#:
+
+def _taken_column(metadata: list, date_format: str, template: str) -> list[str]:
+    # Like `_mtime_column`, each capture time is formatted only once
+    formatted: dict[datetime | int, str] = {}
+    column = []
+    for item in metadata:
+        key = item.taken if item.taken is not None else int(item.mtime)
+        if (text := formatted.get(key)) is None:
+            taken = key if item.taken is not None else datetime.fromtimestamp(key)
+            text = formatted[key] = _format_date(taken, date_format, template)
+        column.append(text)
+    return column
+#:
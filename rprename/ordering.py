@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# rprename/ordering.py
+
+"""
+This module provides `FileOrdering`, which sorts the files of a batch
+(and so chooses the order in which they are numbered):
+
+    loaded      in the order they were loaded
+    name        natural order of the paths ('img2' before 'img10'),
+                ignoring case
+    mtime       modification time, oldest first
+    size        size, smallest first
+    taken       when the photos were taken (EXIF data, see
+                `metadata.py`), or their modification time
+
+Sort keys are computed once per file and cached: sizes and times with
+one `os.scandir` pass per directory (not one `os.stat` call per file
+on Windows, where `scandir` already has them), EXIF dates with the
+shared metadata reader. Switching orderings after that only sorts in
+memory.
+It doesn't depend on Qt.
+"""
+
+import os
+import re
+from typing import Iterable
+
+
+__all__ = [
+    'ORDERINGS',
+    'FileOrdering',
+]
+
+
+ORDERINGS = ('loaded', 'name', 'mtime', 'size', 'taken')
+
+# Files that can't be stat'ed (eg, gone) sort first by size and time
+MISSING_STAT = -1
+
+_DIGITS = re.compile(r'\d+')
+
+
+class FileOrdering:
+    """
+    Sort keys of files (paths, as strings) and sorting by them. Files
+    are remembered in the order `add` first sees them (for 'loaded').
+    """
+    def __init__(self):
+        self._load_order: dict[str, int] = {}
+        self._sizes: dict[str, int] = {}
+        self._mtimes: dict[str, int] = {}
+        self._taken: dict[str, float] = {}
+        self._natural: dict[str, str] = {}
+    #:
+
+    def add(self, files: Iterable[str]):
+        load_order = self._load_order
+        for file in files:
+            load_order.setdefault(file, len(load_order))
+    #:
+
+    def clear(self):
+        self.__init__()
+    #:
+
+    def sort(self, files: list[str], ordering: str) -> list[str]:
+        """
+        `files` sorted by `ordering` (one of ORDERINGS). The sort is
+        stable, so files with the same key keep their relative order.
+        Keys missing from the cache are computed first (which, except
+        for 'loaded' and 'name', reads from the disk).
+        """
+        if ordering == 'loaded':
+            self.add(files)
+            return sorted(files, key = self._load_order.__getitem__)
+        if ordering == 'name':
+            natural = self._natural
+            for file in files:
+                if file not in natural:
+                    natural[file] = _natural_key(file)
+            return sorted(files, key = natural.__getitem__)
+        if ordering in ('mtime', 'size'):
+            self._stat_missing(files)
+            keys = self._mtimes if ordering == 'mtime' else self._sizes
+            return sorted(files, key = keys.__getitem__)
+        if ordering == 'taken':
+            self._read_taken_missing(files)
+            return sorted(files, key = self._taken.__getitem__)
+        raise ValueError(f"Unknown ordering '{ordering}' (use {', '.join(ORDERINGS)})")
+    #:
+
+    def _stat_missing(self, files: list[str]):
+        """
+        Stats the files without cached sizes, with one `os.scandir`
+        pass per directory.
+        """
+        sizes, mtimes = self._sizes, self._mtimes
+        by_dir: dict[str, dict[str, str]] = {}
+        for file in files:
+            if file not in sizes:
+                dir_path, name = os.path.split(file)
+                by_dir.setdefault(dir_path, {})[name] = file
+        for dir_path, names in by_dir.items():
+            try:
+                with os.scandir(dir_path or '.') as entries:
+                    for entry in entries:
+                        if (file := names.pop(entry.name, None)) is None:
+                            continue
+                        try:
+                            stat = entry.stat()
+                        except OSError:
+                            sizes[file] = mtimes[file] = MISSING_STAT
+                            continue
+                        sizes[file] = stat.st_size
+                        mtimes[file] = stat.st_mtime_ns
+            except OSError:
+                pass
+            # Not listed: gone, or in a directory that can't be read
+            for file in names.values():
+                sizes[file] = mtimes[file] = MISSING_STAT
+    #:
+
+    def _read_taken_missing(self, files: list[str]):
+        from pathlib import Path
+        from .metadata import default_reader
+
+        missing = [file for file in files if file not in self._taken]
+        if not missing:
+            return
+        metadata = default_reader().read_many([Path(file) for file in missing])
+        for file, item in zip(missing, metadata):
+            self._taken[file] = (
+                item.taken.timestamp() if item.taken is not None else item.mtime
+            )
+    #:
+#:
+
+def _natural_key(path: str) -> str:
+    # Each number is prefixed with its number of digits ('img10' ->
+    # 'img0210'), so that plain string comparisons (much faster than
+    # comparing lists of texts and ints) sort numbers by value
+    return _DIGITS.sub(_length_prefixed, path.casefold())
+#:
+
+def _length_prefixed(match: re.Match) -> str:
+    digits = match.group().lstrip('0') or '0'
+    return f'{len(digits):02d}{digits}'
+#:
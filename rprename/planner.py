@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# rprename/planner.py
+
+"""
+This module provides the rename planner. Given the full old -> new
+mapping of a batch, the planner checks it against an in-memory index
+of the target directories and turns it into an ordered plan that can
+be executed in one pass:
+
+    - two files renamed to the same name, or a file renamed to the name
+      of an existing file that is not part of the batch, are reported
+      as conflicts (`PlanError`), before anything is renamed, or, with
+      `unique_names`, the files get the first free `<stem>_2<suffix>`,
+      `<stem>_3<suffix>`, ... instead (claimed in the index, so the
+      whole batch is resolved without looking at the disk again);
+    - a file renamed to the current name of another file of the batch
+      is renamed only after that other file is out of the way
+      (eg, for `a -> b, b -> c`, `b -> c` goes first);
+    - cycles (eg, `a -> b, b -> c, c -> a`) are broken by moving one of
+      the files to a temporary name first.
+
+The plan is split into phases. Steps in the same phase don't depend
+on each other and may run concurrently, but a phase must only start
+when the previous one is complete. Running all the steps (`plan.steps`)
+sequentially is always safe.
+"""
+
+from pathlib import Path
+from typing import Iterable, Iterator, NamedTuple
+
+from .fsutils import DirectoryIndex
+
+
+__all__ = [
+    'PlanStep',
+    'RenamePlan',
+    'PlanError',
+    'plan_renames',
+]
+
+
+class PlanStep(NamedTuple):
+    src: Path
+    dst: Path
+    final: bool = True      # False for moves to a temporary name
+#:
+
+class RenamePlan:
+    def __init__(self, phases: list[list[PlanStep]]):
+        self.phases = phases
+    #:
+
+    @property
+    def steps(self) -> Iterator[PlanStep]:
+        for phase in self.phases:
+            yield from phase
+    #:
+
+    def __len__(self) -> int:
+        """Number of files renamed by the plan (temporary moves excluded)."""
+        return sum(step.final for phase in self.phases for step in phase)
+    #:
+#:
+
+class PlanError(Exception):
+    """
+    The batch can't be renamed without overwriting files. The list of
+    problems found is in `conflicts`.
+    """
+    def __init__(self, conflicts: list[str]):
+        super().__init__(
+            f'{len(conflicts)} rename conflict(s): ' + '; '.join(conflicts[:5])
+            + ('; ...' if len(conflicts) > 5 else '')
+        )
+        self.conflicts = conflicts
+    #:
+#:
+
+TEMP_NAME_PREFIX = '.rprename-tmp-'
+
+def plan_renames(
+        renames: Iterable[tuple[Path, Path]],
+        index: DirectoryIndex | None = None,
+        unique_names = False,
+) -> RenamePlan:
+    """
+    Builds a `RenamePlan` for the `(src, dst)` pairs in `renames`.
+    Raises `PlanError` if the batch has conflicts (with `unique_names`,
+    only if a file appears more than once).
+    """
+    renames = list(renames)
+    index = index if index is not None else DirectoryIndex()
+    if unique_names:
+        renames = _resolve_conflicts(renames, index)
+    else:
+        _check_conflicts(renames, index)
+
+    # blockers[i] is the step that must move out of the way before step
+    # i runs (the one whose source is the target of step i). Since
+    # targets are unique, every step blocks at most one other step, so
+    # dependencies form simple chains and cycles.
+    sources = {src: i for i, (src, _) in enumerate(renames)}
+    steps = [PlanStep(src, dst) for src, dst in renames]
+    blockers: list[int | None] = []
+    for i, (_, dst) in enumerate(renames):
+        j = sources.get(dst)
+        blockers.append(j if j != i else None)
+
+    _break_cycles(steps, blockers, index)
+
+    # The phase of a step is the length of its chain of blockers
+    phase_of: list[int | None] = [None] * len(steps)
+    for i in range(len(steps)):
+        chain = []
+        j: int | None = i
+        while j is not None and phase_of[j] is None:
+            chain.append(j)
+            j = blockers[j]
+        phase = -1 if j is None else phase_of[j]
+        for j in reversed(chain):
+            phase += 1                      # type: ignore
+            phase_of[j] = phase
+
+    phases: list[list[PlanStep]] = [[] for _ in range(max(phase_of, default = -1) + 1)]  # type: ignore
+    for step, phase in zip(steps, phase_of):
+        phases[phase].append(step)          # type: ignore
+    return RenamePlan(phases)
+#:
+
+def _check_conflicts(renames: list[tuple[Path, Path]], index: DirectoryIndex):
+    conflicts = []
+    sources: set[Path] = set()
+    targets: dict[Path, Path] = {}
+    for src, _ in renames:
+        if src in sources:
+            conflicts.append(f"'{src}' appears more than once")
+        sources.add(src)
+    for src, dst in renames:
+        if (other_src := targets.get(dst)) is not None:
+            conflicts.append(f"'{other_src}' and '{src}' would both be renamed to '{dst}'")
+            continue
+        targets[dst] = src
+        if dst not in sources and index.exists(dst):
+            conflicts.append(f"'{dst}' already exists")
+    if conflicts:
+        raise PlanError(conflicts)
+#:
+
+def _resolve_conflicts(
+        renames: list[tuple[Path, Path]],
+        index: DirectoryIndex,
+) -> list[tuple[Path, Path]]:
+    """
+    `renames` with the targets that would overwrite files (or be taken
+    by earlier files of the batch) replaced by unique paths. Every
+    target is claimed in the index.
+    """
+    repeated = []
+    sources: set[Path] = set()
+    for src, _ in renames:
+        if src in sources:
+            repeated.append(f"'{src}' appears more than once")
+        sources.add(src)
+    if repeated:
+        raise PlanError(repeated)
+    targets: set[Path] = set()
+    resolved = []
+    for src, dst in renames:
+        if dst in targets or (dst not in sources and index.exists(dst)):
+            dst = index.unique_path(dst)
+        else:
+            index.names(dst.parent).add(dst.name)
+        targets.add(dst)
+        resolved.append((src, dst))
+    return resolved
+#:
+
+def _break_cycles(
+        steps: list[PlanStep],
+        blockers: list[int | None],
+        index: DirectoryIndex,
+):
+    """
+    For each cycle, moves the source of one of its steps to a temporary
+    name: a new (non final) step with no blockers is added, and the
+    original step now renames from the temporary name. `steps` and
+    `blockers` are updated in place.
+    """
+    NEW, VISITING, DONE = 0, 1, 2
+    state = [NEW] * len(steps)
+    for start in range(len(steps)):
+        path = []
+        i = start
+        while i is not None and state[i] == NEW:
+            state[i] = VISITING
+            path.append(i)
+            i = blockers[i]
+        if i is not None and state[i] == VISITING:
+            cycle = path[path.index(i):]
+            k = min(cycle)
+            # The step that was waiting for step k to move away
+            dependent = next(m for m in cycle if blockers[m] == k)
+            temp_path = _temp_path_for(steps[k].src, index)
+            steps.append(PlanStep(steps[k].src, temp_path, final = False))
+            blockers.append(None)
+            state.append(DONE)
+            blockers[dependent] = len(steps) - 1
+            steps[k] = PlanStep(temp_path, steps[k].dst)
+        for j in path:
+            state[j] = DONE
+#:
+
+def _temp_path_for(path: Path, index: DirectoryIndex) -> Path:
+    names = index.names(path.parent)
+    n = 1
+    while (name := f'{TEMP_NAME_PREFIX}{n}{path.suffix}') in names:
+        n += 1
+    names.add(name)     # claim it, so no other cycle uses it
+    return path.parent / name
+#:
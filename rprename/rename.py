@@ -4,16 +4,27 @@
 """
 This module provides the Renamer and ThreadedRenamer classes to rename 
 multiple files.
+
+Renamers are Qt front-ends for a `RenameEngine` (see `engine.py`), which
+computes the new names and does the actual renaming.
 """
 
-import time
 import asyncio
+import time
+from collections import deque
+from math import ceil
 from pathlib import Path
 from typing import Any, Callable, Iterable
 
-from PySide6.QtCore import QObject, Signal, QThread
+from PySide6.QtCore import QObject, QRunnable, QThread, QThreadPool, QTimer, Signal
 import aiofiles.os
 
+from .engine import ProcessPoolRun, RenameCancelled, RenameEngine, RunControl
+from .journal import RenameJournal
+from .metrics import MetricsSnapshot, RenameMetrics
+from .naming import NameTemplate
+from .planner import PlanStep, RenamePlan
+from .throttle import Throttle
 from .utils import ensure_iterable
 
 
@@ -21,49 +32,226 @@ type QtSlot = Callable[..., Any]
 type QtSlots = QtSlot | Iterable[QtSlot]
 
 
+# Default signal batching: flush at most every BATCH_SIZE files or 
+# every BATCH_INTERVAL milliseconds, whichever comes first
+BATCH_SIZE = 500
+BATCH_INTERVAL = 50
+
+# Minimum interval between `metricsUpdated` signals, in milliseconds
+METRICS_INTERVAL = 250
+
 # WARNING: This is an ABC. Don't instantiate this class
 class Renamer(QObject):
+    """
+    Base class for the renamers, which rename `files` to `prefix` 
+    followed by a number or, given a `naming.NameTemplate`, to the 
+    names it generates. Renamed files are reported in batches:
+    `renamedFiles` carries the list of new paths renamed since the last
+    batch, and `progressed` the number of files renamed so far. A batch
+    is flushed every `batchSize` files or every `batchInterval` ms, so
+    the receiving (GUI) thread isn't flooded with events.
+    With `perFileSignals`, `progressed` and `renamedFile` are emitted 
+    once per file, like in the first versions of the renamers.
+    With a `journalDir`, each batch is written to a rename journal (see
+    `journal.py`) in that directory before renaming, so that it can be
+    resumed (eg, with `python -m rprename resume`) if interrupted.
+    With `dirFds`, the engine renames relative to cached directory fds,
+    with a `targetDir` the files are also moved to that directory, with
+    `uniqueNames` taken names get numbered variants, and files are
+    numbered from `firstNumber` (see `RenameEngine`).
+    Live measures of the batch (rate, ETA, latencies, errors; see
+    `metrics.py`) can be read at any time with `metrics()`, and are
+    published by `metricsUpdated` at most every `metricsInterval` ms
+    (when files are reported) and once more when the batch finishes.
+    Renaming can be paused, resumed and cancelled (see `cancel`) from
+    the thread where the renamer lives or from any other. `finished` is
+    emitted in any case, with the number of files renamed.
+    """
     # Define custom signals
     progressed = Signal(int)
     renamedFile = Signal(Path)
-    finished = Signal()
+    renamedFiles = Signal(list)
+    metricsUpdated = Signal(object)     # MetricsSnapshot
+    finished = Signal(int)              # number of files renamed
 
     def __init__(
             self, 
             files: Iterable[Path], 
-            prefix: str,
+            prefix: str | NameTemplate,
+            throttle: Throttle | None = None,
             deleteLaterOnFinished = True,
+            batchSize = BATCH_SIZE,
+            batchInterval = BATCH_INTERVAL,
+            perFileSignals = False,
+            journalDir: Path | None = None,
+            dirFds = False,
+            targetDir: Path | None = None,
+            uniqueNames = False,
+            firstNumber = 1,
+            metricsInterval = METRICS_INTERVAL,
             onProgressed: QtSlots = tuple(),
             onRenamedFile: QtSlots = tuple(),
+            onRenamedFiles: QtSlots = tuple(),
+            onMetricsUpdated: QtSlots = tuple(),
             onFinished: QtSlots = tuple(),
     ):
         super().__init__()
         self._files = files
-        self._prefix = prefix
+        self._metrics = RenameMetrics()
+        self._metrics_interval = metricsInterval / 1000
+        self._last_metrics_update = 0.0
+        self._engine = RenameEngine(
+            prefix, throttle, dirFds, targetDir, metrics = self._metrics,
+            unique_names = uniqueNames, first_number = firstNumber,
+        )
+        self._renamed_count = 0
+        self._per_file_signals = perFileSignals
+        self._batch_size = batchSize
+        self._batch_interval = batchInterval
+        self._batcher = _Batcher(batchSize, batchInterval, self._emit_batch)
+        self._journal_dir = journalDir
+        self._journal: RenameJournal | None = None
+        self._control = RunControl()
 
         for slot in ensure_iterable(onProgressed):
             self.progressed.connect(slot)
         for slot in ensure_iterable(onRenamedFile):
             self.renamedFile.connect(slot)
+        for slot in ensure_iterable(onRenamedFiles):
+            self.renamedFiles.connect(slot)
+        for slot in ensure_iterable(onMetricsUpdated):
+            self.metricsUpdated.connect(slot)
         for slot in ensure_iterable(onFinished):
             self.finished.connect(slot)
 
         if deleteLaterOnFinished:
             self.finished.connect(self.deleteLater)
     #:
+
+    def metrics(self) -> MetricsSnapshot:
+        return self._metrics.snapshot()
+    #:
+
+    def cancel(self):
+        """
+        Stops renaming as soon as the renames in progress are done
+        (they are still reported). Throttle waits are cut short, so it
+        takes effect within a few milliseconds.
+        """
+        self._control.cancel()
+    #:
+
+    def pause(self):
+        """No new renames are started until `resume` is called."""
+        self._control.pause()
+    #:
+
+    def resume(self):
+        self._control.resume()
+    #:
+
+    def is_paused(self) -> bool:
+        return self._control.paused
+    #:
+
+    def _plan(self) -> RenamePlan:
+        plan = self._engine.plan(self._files)
+        self._metrics.start(len(plan))
+        if self._journal_dir is not None:
+            self._journal = RenameJournal.create(plan.steps, self._journal_dir)
+        return plan
+    #:
+
+    def _report_renamed(self, new_file: Path):
+        if self._journal is not None:
+            self._journal.record_done(new_file)
+        self._renamed_count += 1
+        if self._per_file_signals:
+            self.progressed.emit(self._renamed_count)
+            self.renamedFile.emit(new_file)
+        self._batcher.add(new_file)
+    #:
+
+    def _emit_batch(self, new_files: list[Path]):
+        self._metrics.record_completed(len(new_files))
+        self.renamedFiles.emit(new_files)
+        if not self._per_file_signals:
+            self.progressed.emit(self._renamed_count)
+        if time.monotonic() - self._last_metrics_update >= self._metrics_interval:
+            self._emit_metrics()
+    #:
+
+    def _emit_metrics(self):
+        self._last_metrics_update = time.monotonic()
+        self.metricsUpdated.emit(self._metrics.snapshot())
+    #:
+
+    def _finish(self, completed = True):
+        self._cleanup(completed)
+        self._emit_metrics()
+        self.finished.emit(self._renamed_count)
+    #:
+
+    def _cleanup(self, completed: bool):
+        # On every way out (errors too), the files renamed but not yet
+        # reported go out before the journal is closed
+        self._batcher.flush()
+        self._engine.close()
+        if self._journal is not None:
+            # A cancelled batch isn't resumed, unless some of its files
+            # were left with temporary names
+            if self._control.cancelled and not self._journal.temp_files_left():
+                completed = True
+            self._journal.close(completed)
+    #:
+#:
+
+class _Batcher:
+    """
+    Collects items and passes them to `flush` in lists, every `size`
+    items or every `interval` milliseconds, whichever comes first.
+    """
+    def __init__(self, size: int, interval: float, flush: Callable[[list], Any]):
+        self._size = max(size, 1)
+        self._interval = interval / 1000
+        self._flush = flush
+        self._items = []
+        self._last_flush = time.monotonic()
+    #:
+
+    def add(self, item):
+        self._items.append(item)
+        if (
+                len(self._items) >= self._size
+                or time.monotonic() - self._last_flush >= self._interval
+        ):
+            self.flush()
+    #:
+
+    def flush(self):
+        if self._items:
+            items, self._items = self._items, []
+            self._flush(items)
+        self._last_flush = time.monotonic()
+    #:
 #:
 
 class SyncRenamer(Renamer):
     def rename_files(self):
-        for file_number, file in enumerate(self._files, 1):
-            new_file = file.parent.joinpath(
-                f'{self._prefix}{file_number}{file.suffix}'
-            )
-            file.rename(new_file)
-            time.sleep(1.1)   # Let's slow down a bit (comment this for the process to go faster)
-            self.progressed.emit(file_number)
-            self.renamedFile.emit(new_file)
-        self.finished.emit()
+        plan = self._plan()
+        completed = False
+        try:
+            self._engine.run(plan.steps, self._on_renamed, self._control)
+            completed = True
+        except RenameCancelled:
+            pass
+        finally:
+            # On errors too, with the files renamed until then
+            self._finish(completed)
+    #:
+
+    def _on_renamed(self, _: int, new_file: Path):
+        self._report_renamed(new_file)
     #:
 #:
 
@@ -84,16 +272,291 @@ class ThreadedRenamer(SyncRenamer):
     #:
 #:
 
+# Number of chunks per pool thread. More than one chunk per thread 
+# evens out the load when some chunks rename faster than others.
+CHUNKS_PER_POOL_THREAD = 4
+
+class PooledRenamer(Renamer):
+    """
+    Splits the files into chunks and renames the chunks in parallel
+    with the (long-lived and reusable) threads of a `QThreadPool`. By
+    default the global thread pool is used, so several batches don't
+    pay the thread setup and teardown costs. Each phase of the plan
+    (see `planner.py`) is only started when the previous one is done.
+
+    Workers report back through queued signals (batched like the
+    renamer's own signals), so `progressed`, `renamedFiles` and 
+    `finished` are still emitted from the thread where the renamer 
+    lives. Files from different chunks complete in no particular order.
+    """
+    def __init__(
+            self,
+            *args,
+            pool: QThreadPool | None = None,
+            chunkSize = 0,
+            start = False,
+            **kargs,
+    ):
+        super().__init__(*args, **kargs)
+        self._pool = pool if pool is not None else QThreadPool.globalInstance()
+        self._chunk_size = chunkSize
+        self._phases: deque[list[PlanStep]] = deque()
+        self._pending_chunks = 0
+        self._chunk_failed = False
+        self._chunk_signals = _ChunkSignals(self)
+        self._chunk_signals.renamedFiles.connect(self._on_files_renamed)
+        self._chunk_signals.chunkFailed.connect(self._on_chunk_failed)
+        self._chunk_signals.chunkFinished.connect(self._on_chunk_finished)
+        if start:
+            self.start()
+    #:
+
+    def start(self):
+        self._phases = deque(self._plan().phases)
+        self._start_next_phase()
+    #:
+
+    def _start_next_phase(self):
+        if not self._phases or self._chunk_failed or self._control.cancelled:
+            self._finish(completed = not (self._chunk_failed or self._control.cancelled))
+            return
+        steps = self._phases.popleft()
+        chunk_size = self._chunk_size or ceil(
+            len(steps) / (self._pool.maxThreadCount() * CHUNKS_PER_POOL_THREAD)
+        )
+        chunks = [
+            steps[i : i + chunk_size] 
+            for i in range(0, len(steps), chunk_size)
+        ]
+        self._pending_chunks = len(chunks)
+        for chunk in chunks:
+            self._pool.start(
+                _RenameChunk(
+                    chunk, 
+                    self._engine, 
+                    self._control,
+                    self._chunk_signals,
+                    _Batcher(
+                        self._batch_size, 
+                        self._batch_interval, 
+                        self._chunk_signals.renamedFiles.emit,
+                    ),
+                )
+            )
+    #:
+
+    def _on_files_renamed(self, new_files: list[Path]):
+        for new_file in new_files:
+            self._report_renamed(new_file)
+    #:
+
+    def _on_chunk_failed(self):
+        # Don't start the next phase, it might depend on this chunk
+        self._chunk_failed = True
+    #:
+
+    def _on_chunk_finished(self):
+        self._pending_chunks -= 1
+        if self._pending_chunks == 0:
+            self._start_next_phase()
+    #:
+#:
+
+class _ChunkSignals(QObject):
+    renamedFiles = Signal(list)
+    chunkFailed = Signal()
+    chunkFinished = Signal()
+#:
+
+class _RenameChunk(QRunnable):
+    def __init__(
+            self,
+            steps: list[PlanStep],
+            engine: RenameEngine,
+            control: RunControl,
+            signals: _ChunkSignals,
+            batcher: _Batcher,
+    ):
+        super().__init__()
+        self._steps = steps
+        self._engine = engine
+        self._control = control
+        self._signals = signals
+        self._batcher = batcher
+    #:
+
+    def run(self):
+        control = self._control
+        try:
+            for file, new_file, final in self._steps:
+                control.checkpoint()
+                self._engine.rename(file, new_file, control)
+                if final:
+                    self._batcher.add(new_file)
+        except RenameCancelled:
+            # The renamer checks the control when the chunks are done
+            pass
+        except BaseException:
+            self._signals.chunkFailed.emit()
+            raise
+        finally:
+            # The renamer must finish even if this chunk failed midway
+            self._batcher.flush()
+            self._signals.chunkFinished.emit()
+    #:
+#:
+
+class ProcessRenamer(Renamer):
+    """
+    Renames the files with a pool of processes (see 
+    `engine.ProcessPoolRun`). The workers don't send messages per file:
+    the renamer polls their shared progress counters every
+    `pollInterval` milliseconds and emits the signals from there.
+    Like with `PooledRenamer`, files complete in no particular order.
+    The workers see `pause`, `resume` and `cancel` through shared
+    memory, but `finished` may take up to `pollInterval` ms to follow.
+    """
+    def __init__(
+            self,
+            *args,
+            maxWorkers: int | None = None,
+            pollInterval = 100,
+            start = False,
+            **kargs,
+    ):
+        super().__init__(*args, **kargs)
+        import multiprocessing
+        # Backed by shared memory, so the workers see the changes
+        self._control = RunControl(
+            multiprocessing.get_context('spawn').RawValue('b', RunControl.RUNNING)
+        )
+        self._max_workers = maxWorkers
+        self._run: ProcessPoolRun | None = None
+        self._poll_timer = QTimer(self)
+        self._poll_timer.setInterval(pollInterval)
+        self._poll_timer.timeout.connect(self._poll)
+        if start:
+            self.start()
+    #:
+
+    def start(self):
+        self._run = ProcessPoolRun(
+            self._engine, 
+            self._plan().steps, 
+            max_workers = self._max_workers,
+            control = self._control,
+        )
+        self._run.start()
+        self._poll_timer.start()
+    #:
+
+    def _poll(self):
+        assert self._run is not None
+        # done() must be checked before collecting, otherwise we could 
+        # miss the files renamed between collecting and checking
+        done = self._run.done()
+        for new_file in self._run.collect_renamed():
+            self._report_renamed(new_file)
+        if done:
+            self._poll_timer.stop()
+            completed = False
+            try:
+                self._run.result()
+                completed = True
+            except RenameCancelled:
+                pass
+            except BaseException:
+                # Renames in worker processes aren't measured here
+                self._metrics.record_error()
+                raise
+            finally:
+                self._finish(completed)
+    #:
+#:
+
 class AsyncRenamer(Renamer):
+    """
+    Renames files with `aiofiles`, keeping up to `concurrency` renames in
+    flight at once, within each phase of the plan (see `planner.py`).
+    Completions are reported in plan order (which is the original file
+    order unless some files had to wait for others): a file is reported
+    only when all the previous files have also been renamed.
+    """
+    def __init__(self, *args, concurrency = 1, **kargs):
+        super().__init__(*args, **kargs)
+        if concurrency < 1:
+            raise ValueError(f'Invalid concurrency level: {concurrency}')
+        self._concurrency = concurrency
+        # Runs in the default executor, like the aiofiles.os functions
+        self._unthrottled_rename = aiofiles.os.wrap(self._engine.unthrottled_rename)
+    #:
+
     async def rename_files(self):
-        for file_number, file in enumerate(self._files, 1):
-            new_file = file.parent.joinpath(
-                f'{self._prefix}{file_number}{file.suffix}'
+        # Planning may read the files (eg, for `{hash}`), and creating
+        # the journal fsyncs: that's done in the default executor, so
+        # the event loop (the GUI) isn't blocked meanwhile
+        plan = await asyncio.to_thread(self._plan)
+        completed = False
+        try:
+            for phase in plan.phases:
+                await self._run_phase(phase)
+            completed = True
+        except RenameCancelled:
+            pass
+        finally:
+            # On errors too, with the files renamed until then
+            self._finish(completed)
+    #:
+
+    async def _run_phase(self, steps: list[PlanStep]):
+        # Sliding window with the renames in flight, oldest first
+        in_flight: deque[tuple[PlanStep, asyncio.Task]] = deque()
+        try:
+            for step in steps:
+                await self._control.async_checkpoint()
+                task = asyncio.ensure_future(self._rename_file(step.src, step.dst))
+                in_flight.append((step, task))
+                if len(in_flight) >= self._concurrency:
+                    await self._complete_oldest(in_flight)
+            while in_flight:
+                await self._complete_oldest(in_flight)
+        except RenameCancelled:
+            # The renames in flight are done (and reported) in order, so
+            # the renamed files are exactly those reported
+            while in_flight:
+                await self._complete_oldest(in_flight)
+            raise
+        except BaseException:
+            # Renames already handed to the executor can't be stopped, so
+            # we wait for them, and report those that succeeded, before
+            # propagating the error
+            results = await asyncio.gather(
+                *(task for _, task in in_flight), return_exceptions = True,
             )
-            await aiofiles.os.rename(file, new_file)
-            await asyncio.sleep(1.1)   # Let's slow down a bit (comment this for the process to go faster)
-            self.progressed.emit(file_number)
-            self.renamedFile.emit(new_file)
-        self.finished.emit()
+            for (step, _), result in zip(in_flight, results):
+                if step.final and not isinstance(result, BaseException):
+                    self._report_renamed(step.dst)
+            raise
     #:
-#:
\ No newline at end of file
+
+    async def _rename_file(self, file: Path, new_file: Path):
+        throttle = self._engine.throttle
+        sleep = self._control.async_sleep
+        await throttle.async_acquire(sleep)
+        try:
+            await self._unthrottled_rename(file, new_file)
+        finally:
+            await throttle.async_release(sleep)
+    #:
+
+    async def _complete_oldest(
+            self,
+            in_flight: deque[tuple[PlanStep, asyncio.Task]],
+    ):
+        step, task = in_flight[0]
+        await task
+        in_flight.popleft()
+        if step.final:
+            self._report_renamed(step.dst)
+    #:
+#:
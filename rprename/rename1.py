@@ -12,6 +12,7 @@ from typing import Any, Callable, Iterable
 
 from PySide6.QtCore import QObject, Signal, QThread
 
+from .naming import NameTemplate
 from .utils import ensure_iterable
 
 
@@ -50,10 +51,10 @@ class Renamer(QObject):
     #:
 
     def rename_files(self):
-        for file_number, file in enumerate(self._files, 1):
-            new_file = file.parent.joinpath(
-                f'{self._prefix}{file_number}{file.suffix}'
-            )
+        files = list(self._files)
+        new_names = NameTemplate.for_prefix(self._prefix).names(files)
+        for file_number, (file, new_name) in enumerate(zip(files, new_names), 1):
+            new_file = file.parent.joinpath(new_name)
             file.rename(new_file)
             time.sleep(1.1)   # Let's slow down a bit (comment this for the process to go faster)
             self.progressed.emit(file_number)
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# rprename/throttle.py
+
+"""
+This module provides the throttle policies used by the renamers to pace
+rename operations. Policies don't depend on Qt, so any rename engine
+(sync, threaded or async) can honour them.
+
+Every policy is used in the same way: call `acquire` (or `await
+async_acquire`) before starting a rename and `release` (or `await
+async_release`) after it's done. Policies wait by calling the `sleep`
+function given to these methods (`time.sleep` or `asyncio.sleep` by
+default), so that a cancelled run doesn't have to wait for them (see
+`engine.RunControl.sleep`).
+
+Policies can be pickled. The copy starts with fresh state, so each 
+worker process of a process pool paces itself independently.
+
+`asyncio` is only imported by the async methods, to keep it out of the 
+startup path of the command-line interface.
+"""
+
+import threading
+import time
+from typing import Awaitable, Callable
+
+
+__all__ = [
+    'Throttle',
+    'Unthrottled',
+    'FixedDelay',
+    'TokenBucket',
+    'MaxInFlight',
+]
+
+
+type Sleep = Callable[[float], None]
+type AsyncSleep = Callable[[float], Awaitable[None]]
+
+
+class Throttle:
+    """
+    Base throttle policy. Doesn't throttle at all, so it's also the
+    policy to use when we want the renamers to run at disk speed.
+    """
+    def acquire(self, sleep: Sleep = time.sleep):
+        pass
+    #:
+
+    def release(self, sleep: Sleep = time.sleep):
+        pass
+    #:
+
+    async def async_acquire(self, sleep: AsyncSleep | None = None):
+        pass
+    #:
+
+    async def async_release(self, sleep: AsyncSleep | None = None):
+        pass
+    #:
+#:
+
+class Unthrottled(Throttle):
+    pass
+#:
+
+class FixedDelay(Throttle):
+    """
+    Waits `delay` seconds after each rename. Useful for demos, when we
+    want to see the files moving from one list to the other.
+    `FixedDelay(1.1)` reproduces the original behaviour of the renamers.
+    """
+    def __init__(self, delay: float):
+        if delay < 0:
+            raise ValueError(f'Invalid delay: {delay}')
+        self.delay = delay
+    #:
+
+    def release(self, sleep: Sleep = time.sleep):
+        sleep(self.delay)
+    #:
+
+    async def async_release(self, sleep: AsyncSleep | None = None):
+        import asyncio
+        await (sleep or asyncio.sleep)(self.delay)
+    #:
+#:
+
+class TokenBucket(Throttle):
+    """
+    Limits renames to `rate` operations per second, allowing bursts of
+    up to `burst` operations. The bucket starts full.
+    Tokens are reserved under a lock, so the same bucket can be shared
+    by several threads (and by several coroutines).
+    """
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError(f'Invalid rate: {rate}')
+        if burst < 1:
+            raise ValueError(f'Invalid burst: {burst}')
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+    #:
+
+    def _reserve(self) -> float:
+        """
+        Takes one token from the bucket and returns how long (in
+        seconds) the caller must wait before using it. The token count
+        goes negative when callers have to wait, so that concurrent
+        callers queue up instead of all waking up at the same time.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst,
+                self._tokens + (now - self._last) * self.rate
+            )
+            self._last = now
+            self._tokens -= 1
+            return -self._tokens / self.rate if self._tokens < 0 else 0.0
+    #:
+
+    def __getstate__(self):
+        return {'rate': self.rate, 'burst': self.burst}
+    #:
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+    #:
+
+    def acquire(self, sleep: Sleep = time.sleep):
+        if (delay := self._reserve()) > 0:
+            sleep(delay)
+    #:
+
+    async def async_acquire(self, sleep: AsyncSleep | None = None):
+        import asyncio
+        if (delay := self._reserve()) > 0:
+            await (sleep or asyncio.sleep)(delay)
+    #:
+#:
+
+class MaxInFlight(Throttle):
+    """
+    Allows at most `limit` renames to be in progress at the same time.
+    Only makes a difference with renamers that issue renames
+    concurrently (eg, a pooled or concurrent async renamer).
+    """
+    def __init__(self, limit: int):
+        if limit < 1:
+            raise ValueError(f'Invalid limit: {limit}')
+        self.limit = limit
+        self._semaphore = threading.BoundedSemaphore(limit)
+        self._async_semaphore = None
+    #:
+
+    def __getstate__(self):
+        return {'limit': self.limit}
+    #:
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+    #:
+
+    def acquire(self, sleep: Sleep = time.sleep):
+        self._semaphore.acquire()
+    #:
+
+    def release(self, sleep: Sleep = time.sleep):
+        self._semaphore.release()
+    #:
+
+    async def async_acquire(self, sleep: AsyncSleep | None = None):
+        import asyncio
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.limit)
+        await self._async_semaphore.acquire()
+    #:
+
+    async def async_release(self, sleep: AsyncSleep | None = None):
+        self._async_semaphore.release()     # type: ignore
+    #:
+#:
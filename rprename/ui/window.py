@@ -15,9 +15,10 @@ from PySide6.QtGui import (QBrush, QColor, QConicalGradient, QCursor,
     QFont, QFontDatabase, QGradient, QIcon,
     QImage, QKeySequence, QLinearGradient, QPainter,
     QPalette, QPixmap, QRadialGradient, QTransform)
-from PySide6.QtWidgets import (QApplication, QGridLayout, QLabel, QLineEdit,
-    QListWidget, QListWidgetItem, QProgressBar, QPushButton,
-    QSizePolicy, QSplitter, QVBoxLayout, QWidget)
+from PySide6.QtWidgets import (QApplication, QCheckBox, QComboBox, QGridLayout,
+    QHBoxLayout, QLabel, QLineEdit, QListView,
+    QProgressBar, QPushButton, QSizePolicy, QSpacerItem,
+    QSplitter, QVBoxLayout, QWidget)
 
 class Ui_Window(object):
     def setupUi(self, Window):
@@ -31,14 +32,26 @@ class Ui_Window(object):
         self.label.setMinimumSize(QSize(0, 20))
         self.label.setMaximumSize(QSize(16777215, 20))
 
-        self.gridLayout.addWidget(self.label, 0, 0, 1, 3)
+        self.gridLayout.addWidget(self.label, 0, 0, 1, 2)
+
+        self.recursiveCheckBox = QCheckBox(Window)
+        self.recursiveCheckBox.setObjectName(u"recursiveCheckBox")
+
+        self.gridLayout.addWidget(self.recursiveCheckBox, 0, 2, 1, 1)
 
         self.dirEdit = QLineEdit(Window)
         self.dirEdit.setObjectName(u"dirEdit")
         self.dirEdit.setMinimumSize(QSize(0, 30))
         self.dirEdit.setMaximumSize(QSize(16777215, 30))
 
-        self.gridLayout.addWidget(self.dirEdit, 1, 0, 1, 2)
+        self.gridLayout.addWidget(self.dirEdit, 1, 0, 1, 1)
+
+        self.loadDirButton = QPushButton(Window)
+        self.loadDirButton.setObjectName(u"loadDirButton")
+        self.loadDirButton.setMinimumSize(QSize(0, 35))
+        self.loadDirButton.setMaximumSize(QSize(16777215, 35))
+
+        self.gridLayout.addWidget(self.loadDirButton, 1, 1, 1, 1)
 
         self.loadFilesButton = QPushButton(Window)
         self.loadFilesButton.setObjectName(u"loadFilesButton")
@@ -63,12 +76,31 @@ class Ui_Window(object):
 
         self.verticalLayout.addWidget(self.label_2)
 
-        self.srcFileList = QListWidget(self.layoutWidget)
+        self.srcFileList = QListView(self.layoutWidget)
         self.srcFileList.setObjectName(u"srcFileList")
+        self.srcFileList.setUniformItemSizes(True)
 
         self.verticalLayout.addWidget(self.srcFileList)
 
         self.splitter.addWidget(self.layoutWidget)
+        self.previewLayoutWidget = QWidget(self.splitter)
+        self.previewLayoutWidget.setObjectName(u"previewLayoutWidget")
+        self.verticalLayout_3 = QVBoxLayout(self.previewLayoutWidget)
+        self.verticalLayout_3.setObjectName(u"verticalLayout_3")
+        self.verticalLayout_3.setContentsMargins(0, 0, 0, 0)
+        self.previewLabel = QLabel(self.previewLayoutWidget)
+        self.previewLabel.setObjectName(u"previewLabel")
+        self.previewLabel.setFont(font)
+
+        self.verticalLayout_3.addWidget(self.previewLabel)
+
+        self.previewFileList = QListView(self.previewLayoutWidget)
+        self.previewFileList.setObjectName(u"previewFileList")
+        self.previewFileList.setUniformItemSizes(True)
+
+        self.verticalLayout_3.addWidget(self.previewFileList)
+
+        self.splitter.addWidget(self.previewLayoutWidget)
         self.layoutWidget1 = QWidget(self.splitter)
         self.layoutWidget1.setObjectName(u"layoutWidget1")
         self.verticalLayout_2 = QVBoxLayout(self.layoutWidget1)
@@ -80,8 +112,9 @@ class Ui_Window(object):
 
         self.verticalLayout_2.addWidget(self.label_3)
 
-        self.dstFileList = QListWidget(self.layoutWidget1)
+        self.dstFileList = QListView(self.layoutWidget1)
         self.dstFileList.setObjectName(u"dstFileList")
+        self.dstFileList.setUniformItemSizes(True)
 
         self.verticalLayout_2.addWidget(self.dstFileList)
 
@@ -94,7 +127,17 @@ class Ui_Window(object):
         self.label_4.setMinimumSize(QSize(0, 20))
         self.label_4.setMaximumSize(QSize(16777215, 20))
 
-        self.gridLayout.addWidget(self.label_4, 3, 0, 1, 3)
+        self.gridLayout.addWidget(self.label_4, 3, 0, 1, 2)
+
+        self.orderComboBox = QComboBox(Window)
+        self.orderComboBox.addItem("")
+        self.orderComboBox.addItem("")
+        self.orderComboBox.addItem("")
+        self.orderComboBox.addItem("")
+        self.orderComboBox.addItem("")
+        self.orderComboBox.setObjectName(u"orderComboBox")
+
+        self.gridLayout.addWidget(self.orderComboBox, 3, 2, 1, 1)
 
         self.prefixEdit = QLineEdit(Window)
         self.prefixEdit.setObjectName(u"prefixEdit")
@@ -121,7 +164,40 @@ class Ui_Window(object):
         self.progressBar.setObjectName(u"progressBar")
         self.progressBar.setValue(0)
 
-        self.gridLayout.addWidget(self.progressBar, 5, 0, 1, 3)
+        self.gridLayout.addWidget(self.progressBar, 5, 0, 1, 2)
+
+        self.rateLabel = QLabel(Window)
+        self.rateLabel.setObjectName(u"rateLabel")
+
+        self.gridLayout.addWidget(self.rateLabel, 5, 2, 1, 1)
+
+        self.renameControlsLayout = QHBoxLayout()
+        self.renameControlsLayout.setObjectName(u"renameControlsLayout")
+        self.renameControlsSpacer = QSpacerItem(40, 20, QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Minimum)
+
+        self.renameControlsLayout.addItem(self.renameControlsSpacer)
+
+        self.watchButton = QPushButton(Window)
+        self.watchButton.setObjectName(u"watchButton")
+        self.watchButton.setEnabled(False)
+        self.watchButton.setCheckable(True)
+
+        self.renameControlsLayout.addWidget(self.watchButton)
+
+        self.pauseButton = QPushButton(Window)
+        self.pauseButton.setObjectName(u"pauseButton")
+        self.pauseButton.setEnabled(False)
+
+        self.renameControlsLayout.addWidget(self.pauseButton)
+
+        self.cancelButton = QPushButton(Window)
+        self.cancelButton.setObjectName(u"cancelButton")
+        self.cancelButton.setEnabled(False)
+
+        self.renameControlsLayout.addWidget(self.cancelButton)
+
+
+        self.gridLayout.addLayout(self.renameControlsLayout, 6, 0, 1, 3)
 
 
         self.retranslateUi(Window)
@@ -132,16 +208,44 @@ class Ui_Window(object):
     def retranslateUi(self, Window):
         Window.setWindowTitle(QCoreApplication.translate("Window", u"RP Renamer", None))
         self.label.setText(QCoreApplication.translate("Window", u"Last Source Directory:", None))
+        self.recursiveCheckBox.setText(QCoreApplication.translate("Window", u"Include Subdirectories", None))
+        self.loadDirButton.setText(QCoreApplication.translate("Window", u"Load &Directory", None))
         self.loadFilesButton.setText(QCoreApplication.translate("Window", u"Load Files", None))
 #if QT_CONFIG(shortcut)
         self.loadFilesButton.setShortcut(QCoreApplication.translate("Window", u"L", None))
 #endif // QT_CONFIG(shortcut)
         self.label_2.setText(QCoreApplication.translate("Window", u"Files To Rename", None))
+        self.previewLabel.setText(QCoreApplication.translate("Window", u"New Names", None))
+#if QT_CONFIG(tooltip)
+        self.previewFileList.setToolTip(QCoreApplication.translate("Window", u"The names the files will get with the prefix or template being typed", None))
+#endif // QT_CONFIG(tooltip)
         self.label_3.setText(QCoreApplication.translate("Window", u"Renamed Files", None))
         self.label_4.setText(QCoreApplication.translate("Window", u"Filename Prefix:", None))
+        self.orderComboBox.setItemText(0, QCoreApplication.translate("Window", u"Number As Loaded", None))
+        self.orderComboBox.setItemText(1, QCoreApplication.translate("Window", u"Number By Name", None))
+        self.orderComboBox.setItemText(2, QCoreApplication.translate("Window", u"Number By Date Modified", None))
+        self.orderComboBox.setItemText(3, QCoreApplication.translate("Window", u"Number By Size", None))
+        self.orderComboBox.setItemText(4, QCoreApplication.translate("Window", u"Number By Date Taken", None))
+
+#if QT_CONFIG(tooltip)
+        self.orderComboBox.setToolTip(QCoreApplication.translate("Window", u"The order in which the files are numbered", None))
+#endif // QT_CONFIG(tooltip)
+#if QT_CONFIG(tooltip)
+        self.prefixEdit.setToolTip(QCoreApplication.translate("Window", u"A prefix (eg, vacation_) or a template with fields in braces (eg, {date}_{stem|lower}_{n:auto}{ext})", None))
+#endif // QT_CONFIG(tooltip)
         self.prefixEdit.setText("")
         self.prefixEdit.setPlaceholderText(QCoreApplication.translate("Window", u"Rename your files to...", None))
         self.extensionLabel.setText(QCoreApplication.translate("Window", u"*.jpg", None))
         self.renameFilesButton.setText(QCoreApplication.translate("Window", u"&Rename", None))
+#if QT_CONFIG(tooltip)
+        self.rateLabel.setToolTip(QCoreApplication.translate("Window", u"Files renamed per second (over the last seconds) and estimated time left", None))
+#endif // QT_CONFIG(tooltip)
+        self.rateLabel.setText("")
+#if QT_CONFIG(tooltip)
+        self.watchButton.setToolTip(QCoreApplication.translate("Window", u"Rename the files loaded and then, as they arrive, the new files in the directory, with the same prefix or template", None))
+#endif // QT_CONFIG(tooltip)
+        self.watchButton.setText(QCoreApplication.translate("Window", u"&Watch", None))
+        self.pauseButton.setText(QCoreApplication.translate("Window", u"&Pause", None))
+        self.cancelButton.setText(QCoreApplication.translate("Window", u"&Cancel", None))
     # retranslateUi
 
@@ -8,7 +8,9 @@ import pathlib
 import subprocess
 import sys
 import json
+import hashlib
 import importlib
+import importlib.util
 from subprocess import run as run_proc
 import shutil, tempfile
 from typing import Iterable
@@ -18,6 +20,8 @@ from PySide6.QtWidgets import QWidget, QMessageBox
 from PySide6.QtWidgets import QTableWidgetItem
 from PySide6.QtCore import QStandardPaths
 
+from .fsutils import DirectoryIndex, PathValidator
+
 all = [
     'msg_box', 'show_info', 'show_error',
     'add_table_widget_row', 'add_table_widget_rows',
@@ -26,6 +30,8 @@ all = [
     'connectev',
     'compile_ui_if_needed',
     'compile_ui_if_needed_or_exit',
+    'load_ui_module_cached',
+    'load_ui_module_cached_or_exit',
 
     'is_iterable',
     'ensure_iterable',
@@ -161,6 +167,130 @@ class UICompilationError(Exception):
     """
 #:
 
+def load_ui_module_cached_or_exit(*load_args, **load_kargs):
+    try: 
+        return load_ui_module_cached(*load_args, **load_kargs)
+    except Exception as ex:
+        print(f"ERROR: {ex}", file=sys.stderr)
+        sys.exit(UI_COMPILATION_FAILURE_ERROR_CODE)
+#:
+
+def load_ui_module_cached(
+        ui_file_path: str | os.PathLike,
+        cache_dir: str | os.PathLike | None = None,
+        fallback_module_name: str | None = None,
+):
+    """
+    Imports the Python module generated from the Qt Designer '.ui' file
+    given by C{ui_file_path}, compiling it with C{UIC_COMPILER} only if
+    there's no compiled version in the cache.
+
+    Compiled modules are stored in C{cache_dir} (by default, the 
+    'rprename/ui' subdirectory of the generic user cache location, eg
+    '~/.cache' in Linux) and are
+    keyed on the SHA-256 of the contents of the '.ui' file and on the
+    version of PySide6 (which ships the uic compiler). Unlike the
+    mtime check in C{compile_ui_if_needed}, this survives git checkouts
+    and never overwrites files in the source tree.
+
+    To avoid reading and hashing the '.ui' file on every launch, the
+    compiled module is also linked under a name derived from the file
+    size and mtime. A warm start costs a single C{stat} of the '.ui'
+    file plus the import.
+
+    If compilation fails and C{fallback_module_name} is given, that
+    module is imported instead (eg, a previously generated module 
+    shipped with the sources).
+
+    @throws ValueError, UICompilationError
+    @returns The imported C{module} object.
+    """
+    import PySide6
+
+    ui_file_path = pathlib.Path(ui_file_path)
+    if ui_file_path.suffix != '.ui':
+        raise ValueError(f"UI file path ('{ui_file_path}') must end in '.ui'!")
+    try:
+        ui_stat = ui_file_path.stat()
+    except OSError as ex:
+        raise ValueError(f"Can't find UI file {ui_file_path}") from ex
+
+    if cache_dir is None:
+        # CacheLocation depends on the application name, which may not be 
+        # set yet (or may be the name of a script), so we use the generic one
+        cache_dir = pathlib.Path(get_standard_location('generic_cache'), 'rprename', 'ui')   # type: ignore
+    cache_dir = pathlib.Path(cache_dir)
+    uic_version = PySide6.__version__.replace('.', '_')
+    stem = ui_file_path.stem
+
+    # Warm start: the stat signature of the '.ui' file is enough
+    stat_module_path = cache_dir / (
+        f'{stem}_s{ui_stat.st_size}_{ui_stat.st_mtime_ns}_uic{uic_version}.py'
+    )
+    try:
+        return _import_module_from(stat_module_path)
+    except FileNotFoundError:
+        pass
+
+    # The '.ui' file was touched (or it's the first time): use the 
+    # contents hash, and only compile if the contents changed
+    ui_hash = hashlib.sha256(ui_file_path.read_bytes()).hexdigest()[:32]
+    module_path = cache_dir / f'{stem}_h{ui_hash}_uic{uic_version}.py'
+    try:
+        if not module_path.exists():
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            print(f"[+] Compiling '{ui_file_path}' to '{module_path}'.", file=sys.stderr)
+            temp_module_path = module_path.with_suffix(f'.{os.getpid()}.tmp')
+            proc = run_proc(
+                [UIC_COMPILER, '-o', str(temp_module_path), str(ui_file_path)],
+                capture_output=True,
+                text=True,
+            )
+            if proc.returncode != 0:
+                temp_module_path.unlink(missing_ok=True)
+                raise UICompilationError(proc.stderr.strip() or f'{UIC_COMPILER} failed')
+            os.replace(temp_module_path, module_path)
+        for old_stat_module_path in cache_dir.glob(f'{stem}_s*.py'):
+            old_stat_module_path.unlink(missing_ok=True)
+        _link_or_copy(module_path, stat_module_path)
+        return _import_module_from(module_path)
+    except Exception as ex:
+        if fallback_module_name:
+            print(
+                f"[!] Couldn't compile '{ui_file_path}' ({ex}). "
+                f"Using '{fallback_module_name}'.",
+                file=sys.stderr,
+            )
+            return importlib.import_module(fallback_module_name)
+        if isinstance(ex, UICompilationError):
+            raise
+        raise UICompilationError(f"Compilation error: {ex}") from ex
+#:
+
+def _import_module_from(module_path: pathlib.Path):
+    """
+    Imports the module in C{module_path} under a name derived from the
+    file name. Raises C{FileNotFoundError} if the file doesn't exist.
+    """
+    module_name = f'_uic_cache_{module_path.stem}'
+    if module := sys.modules.get(module_name):
+        return module
+    spec = importlib.util.spec_from_file_location(module_name, module_path)
+    module = importlib.util.module_from_spec(spec)   # type: ignore
+    spec.loader.exec_module(module)                  # type: ignore
+    sys.modules[module_name] = module
+    return module
+#:
+
+def _link_or_copy(src: pathlib.Path, dst: pathlib.Path):
+    try:
+        os.link(src, dst)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copy(src, dst)
+#:
+
 def add_table_widget_row(
         table, 
         row_num, 
@@ -231,6 +361,8 @@ def get_standard_location(name: str, first_location_only=True) -> str | list[str
         'movies': QStandardPaths.MoviesLocation,                # type: ignore
         'pictures': QStandardPaths.PicturesLocation,            # type: ignore
         'config': QStandardPaths.ConfigLocation,                # type: ignore
+        'cache': QStandardPaths.CacheLocation,                  # type: ignore
+        'generic_cache': QStandardPaths.GenericCacheLocation,   # type: ignore
     }
     paths = QStandardPaths.standardLocations(locs[name]) 
     return paths[0] if first_location_only else paths
@@ -353,7 +485,7 @@ def ensure_iterable(obj_or_objs) -> Iterable:
 ##
 #######################################################################
 
-def gen_unique_path_from(path_: str) -> str:
+def gen_unique_path_from(path_: str, index: DirectoryIndex | None = None) -> str:
     """
     Generates a unique file path from C{path_} if the given {path_}
     exists. Otherwise, just returns that path.
@@ -366,16 +498,25 @@ def gen_unique_path_from(path_: str) -> str:
     abc
     >>> gen_unique_path_from('abc')   # assuming 'abc' and 'abc_2' both
     abc_3                             # exist
+
+    The directory is listed once into C{index} (a
+    C{fsutils.DirectoryIndex}), and the returned name is claimed there.
+    Passing the same C{index} to generate many paths (eg, for a whole
+    batch) makes no further system calls.
     """
     if not path_:
         raise ValueError('Empty path')
-    path_ext = pathlib.Path(path_).suffix
-    path_and_name = path_.partition(path_ext)[0] if path_ext else path_
-    i = 2
-    while os.path.exists(path_):
-        path_ = f'{path_and_name}_{i}{path_ext}'
-        i += 1
-    return path_
+    index = index if index is not None else DirectoryIndex()
+    try:
+        unique_path = index.unique_path(pathlib.Path(path_))
+    except OSError:
+        # Like os.path.exists, a directory that can't be listed (eg,
+        # missing) has no files
+        return path_
+    # Keeps the directory as given (eg, './abc' gives './abc_2'), but
+    # it's the parent of 'abc/' that was looked at, not 'abc' itself
+    dir_path = os.path.dirname(path_.rstrip(os.sep + (os.altsep or '')))
+    return os.path.join(dir_path, unique_path.name)
 #:
 
 def overwrite_if_needed_or_exit(dest_file_path: str, error_code=3):
@@ -432,19 +573,12 @@ def valid_path_for_file(
         - has write permissions, if parameter `check_w` is `True`
         - has read permissions, if parameter `check_r` is `True`
         - doesn't exist if the `unique` is True.
+    To check many paths, use `fsutils.PathValidator`, which this 
+    function calls: it `lstat`s each path once and looks at each parent
+    directory only once.
     """
-    try:
-        path = pathlib.Path(file_path)
-        return (
-                not is_special_entry(path)
-            and not path.is_dir()
-            and path.parent.exists()
-            and (not unique or not path.exists())
-            and (not check_w or is_writable(path))
-            and (not check_r or is_readable(path))
-        )
-    except:
-        return False
+    validator = PathValidator(unique, check_w, check_r)
+    return validator.check(pathlib.Path(file_path)).valid
 #:
 
 def is_special_entry(path: pathlib.Path | str) -> bool:
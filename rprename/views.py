@@ -5,25 +5,44 @@
 This module provides the RP Renamer main window.
 """
 
-from collections import deque
+import asyncio
+import os
+import re
+import sqlite3
 from pathlib import Path
 
 import qasync
-from PySide6.QtWidgets import QFileDialog, QWidget
+from PySide6.QtCore import QTimer
+from PySide6.QtWidgets import QFileDialog, QMessageBox, QWidget
 
-from .ui.window import Ui_Window
+from .filequeue import FileQueue
+from .hashing import find_duplicates
+from .journal import default_journal_dir
+from .loader import extension_matcher, scan_directory
+from .metrics import MetricsSnapshot
+from .models import FileListModel, NamePreviewModel
+from .naming import NameTemplate, TemplateError
+from .ordering import ORDERINGS, FileOrdering
+from .planner import PlanError
 from .rename import AsyncRenamer
+from .throttle import Unthrottled
+from .watch import FolderWatcher
 
 # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 # ADDED: added the following lines to avoid having to compile the 'ui'
-# file manually each time we change it in the designer.
+# file manually each time we change it in the designer. The compiled 
+# module is cached (keyed on the contents of the 'ui' file), and the
+# module in the source tree is only used if compilation fails.
 
-from .utils import compile_ui_if_needed_or_exit
+from .utils import load_ui_module_cached_or_exit, show_error
 
-UI_FILE_PATH = f'rprename/ui/window.ui'
-UI_CLASS_FILE_PATH = f'rprename/ui/window.py'
+UI_FILE_PATH = Path(__file__).parent / 'ui' / 'window.ui'
+UI_FALLBACK_MODULE = f'{__package__}.ui.window'
 
-compile_ui_if_needed_or_exit(UI_FILE_PATH, UI_CLASS_FILE_PATH)
+Ui_Window = load_ui_module_cached_or_exit(
+    UI_FILE_PATH, 
+    fallback_module_name = UI_FALLBACK_MODULE,
+).Ui_Window
 
 # ++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
@@ -38,6 +57,42 @@ FILTERS = ';;'.join(
     )
 )
 
+# Matches the file names with any of the extensions in FILTERS
+FILTERS_MATCHER = extension_matcher(re.findall(r'\*(\.\w+)', FILTERS))
+
+# Use, eg, FixedDelay(1.1) to slow down the renamer and watch the files
+# moving from one list to the other
+RENAME_THROTTLE = Unthrottled()
+
+# Number of renames kept in flight by the AsyncRenamer
+RENAME_CONCURRENCY = 8
+
+# Rename relative to cached directory fds (see engine.RenameEngine)
+RENAME_WITH_DIR_FDS = False
+
+# Rename batches are journaled here, so that an interrupted batch can
+# be resumed with `python -m rprename resume`. Use None to disable.
+RENAME_JOURNAL_DIR = default_journal_dir()
+
+# Look for files with the same contents (see hashing.py) before
+# renaming, and ask whether to rename them anyway
+RENAME_CHECK_DUPLICATES = True
+
+# Duplicate files listed (at most) when asking
+DUPLICATES_SHOWN = 5
+
+# The new names are previewed once no key has been typed for
+# PREVIEW_DELAY ms (see models.NamePreviewModel)
+PREVIEW_DELAY = 150
+
+# While watching a directory (see watch.py), new files are renamed once
+# their size didn't change for WATCH_STABLE_INTERVAL ms
+WATCH_STABLE_INTERVAL = 2000
+
+# The rate label is also refreshed every RATE_REFRESH_INTERVAL ms, so
+# that it shows when renaming stalls (no files, no metricsUpdated)
+RATE_REFRESH_INTERVAL = 1000
+
 class Window(QWidget, Ui_Window):
     def __init__(self):
         super().__init__()
@@ -48,16 +103,48 @@ class Window(QWidget, Ui_Window):
 
     def _setupUI(self):
         self.setupUi(self)
+        self._srcFilesModel = FileListModel(self)
+        self._dstFilesModel = FileListModel(self)
+        self.srcFileList.setModel(self._srcFilesModel)
+        self.dstFileList.setModel(self._dstFilesModel)
+        self._previewModel = NamePreviewModel(
+            self._srcFilesModel, self, onError = self._show_preview_error,
+        )
+        self.previewFileList.setModel(self._previewModel)
+        self._previewModel.namesChanged.connect(self.previewFileList.viewport().update)
+        self._srcFilesModel.rowsReordered.connect(self.srcFileList.viewport().update)
+        self._previewTimer = QTimer(self)
+        self._previewTimer.setSingleShot(True)
+        self._previewTimer.setInterval(PREVIEW_DELAY)
+        self._previewTimer.timeout.connect(self._update_preview)
+        self._rateTimer = QTimer(self)
+        self._rateTimer.setInterval(RATE_REFRESH_INTERVAL)
+        self._rateTimer.timeout.connect(
+            lambda: self._update_rate_label(self._renamer.metrics())
+        )
+        self._watcher: FolderWatcher | None = None
+        self._watch_renaming = False
     #:
 
     def _connect_signals_slots(self):
         self.loadFilesButton.clicked.connect(self.load_files)
+        self.loadDirButton.clicked.connect(self.load_directory)
         self.renameFilesButton.clicked.connect(self.rename_files)
+        self.pauseButton.clicked.connect(self._toggle_pause)
+        self.watchButton.toggled.connect(self._toggle_watch)
+        self.orderComboBox.currentIndexChanged.connect(self.sort_files)
+        self.cancelButton.clicked.connect(self._cancel_rename)
         self.prefixEdit.textChanged.connect(self._update_state_when_ready)
+        self.prefixEdit.textChanged.connect(self._previewTimer.start)
+        # The preview scrolls along with the files to rename
+        srcScrollBar = self.srcFileList.verticalScrollBar()
+        previewScrollBar = self.previewFileList.verticalScrollBar()
+        srcScrollBar.valueChanged.connect(previewScrollBar.setValue)
+        previewScrollBar.valueChanged.connect(srcScrollBar.setValue)
     #:
 
     def load_files(self):
-        self.dstFileList.clear()
+        self._dstFilesModel.clear()
         init_dir = self.dirEdit.text() if self.dirEdit.text() else str(Path.home) 
         files, filter_ = QFileDialog.getOpenFileNames(
             self, "Choose Files to Rename", init_dir, filter=FILTERS
@@ -68,69 +155,454 @@ class Window(QWidget, Ui_Window):
             self.extensionLabel.setText(file_extension)
             src_dir_name = str(Path(files[0]).parent)
             self.dirEdit.setText(src_dir_name)
-            for file in files:
-                file_path = Path(file)
-                if file_path not in self._files:   # let's avoid file duplication...
-                    self._files.append(file_path)
-                    self.srcFileList.addItem(file)
-            self._initial_file_count = len(self._files)
+            self._add_files(files)
+            self._update_state_when_files_loaded()
+            self._sort_loaded_files()
+    #:
+
+    @qasync.asyncSlot()
+    async def load_directory(self):
+        init_dir = self.dirEdit.text() if self.dirEdit.text() else str(Path.home())
+        dir_path = QFileDialog.getExistingDirectory(
+            self, "Choose Directory to Rename", init_dir
+        )
+        if not dir_path:
+            return
+
+        self._dstFilesModel.clear()
+        self.extensionLabel.setText('*.*')
+        self.dirEdit.setText(dir_path)
+        self._update_state_while_loading()
+
+        # The directory is walked in the default executor, and the chunks
+        # of files are added to the views as they arrive
+        loop = asyncio.get_running_loop()
+        chunks: asyncio.Queue[list[str] | None] = asyncio.Queue()
+        recursive = self.recursiveCheckBox.isChecked()
+        def scan():
+            try:
+                for chunk in scan_directory(dir_path, FILTERS_MATCHER, recursive):
+                    loop.call_soon_threadsafe(chunks.put_nowait, chunk)
+            finally:
+                loop.call_soon_threadsafe(chunks.put_nowait, None)
+        #:
+        scanning = loop.run_in_executor(None, scan)
+        try:
+            while (chunk := await chunks.get()) is not None:
+                self._add_files(chunk)
+                # get() doesn't yield while there are chunks in the queue,
+                # so we yield here to let Qt repaint the views
+                await asyncio.sleep(0)
+            await scanning
+        except OSError as ex:
+            show_error(f"Can't read directory {dir_path}: {ex}", self)
+        finally:
+            self.loadFilesButton.setEnabled(True)
+            self.loadDirButton.setEnabled(True)
+            # Even with no files to rename, the directory can be watched
             self._update_state_when_files_loaded()
+            if self._files:
+                self._sort_loaded_files()
+    #:
+
+    def _add_files(self, files: list[str]):
+        # FileQueue skips the files already loaded
+        added = self._files.extend(files)
+        self._ordering.add(added)
+        self._srcFilesModel.extend(added)
+        self._initial_file_count = len(self._files)
+    #:
+
+    def _sort_loaded_files(self):
+        # New files are added at the end, whatever the order chosen
+        if ORDERINGS[self.orderComboBox.currentIndex()] != 'loaded':
+            self.sort_files()
+    #:
+
+    @qasync.asyncSlot()
+    async def sort_files(self):
+        """
+        Sorts the files to rename (ie, numbers them) in the order chosen.
+        Sort keys are cached, so only the first sort by size, time or
+        EXIF date reads from the disk (in the default executor).
+        """
+        if not self._files:
+            return
+        ordering = ORDERINGS[self.orderComboBox.currentIndex()]
+        files = self._srcFilesModel.paths()
+        self._update_state_while_loading()
+        try:
+            files = await asyncio.to_thread(self._ordering.sort, files, ordering)
+        except OSError as ex:
+            show_error(f"Can't sort the files: {ex}", self)
+            return
+        finally:
+            self.loadFilesButton.setEnabled(True)
+            self.loadDirButton.setEnabled(True)
+            self._update_state_when_files_loaded()
+            self._update_state_when_ready()
+        self._files = FileQueue(files)
+        self._srcFilesModel.reorder(files)
     #:
 
     @qasync.asyncSlot()
     async def rename_files(self):
+        if RENAME_CHECK_DUPLICATES and not await self._confirm_duplicates():
+            return
         self._update_state_while_renaming()
-        await self._start_renamer()
+        try:
+            await self._start_renamer(self._naming())
+        except (PlanError, TemplateError) as ex:
+            # Nothing was renamed: let the user choose another prefix
+            show_error(str(ex), self)
+            self._update_state_when_rename_cancelled()
+        except OSError as ex:
+            # Like a cancel: the files that weren't renamed are kept
+            show_error(f"Can't rename all the files: {ex}", self)
+            self._update_state_when_rename_finished()
+            self.rateLabel.setText(f'Stopped after {len(self._batch_renamed)} files')
+        else:
+            self._update_state_when_rename_finished()
     #:
 
-    async def _start_renamer(self):
+    async def _confirm_duplicates(self) -> bool:
+        """
+        Looks for duplicates among the loaded files (in the default
+        executor) and, if there are any, asks whether to rename anyway.
+        The controls are enabled again in any case (renaming disables
+        them, if it goes on).
+        """
+        self._update_state_while_loading()
+        self.rateLabel.setText('Looking for duplicates...')
+        try:
+            duplicates = await asyncio.to_thread(find_duplicates, list(self._files))
+        except (OSError, sqlite3.Error) as ex:
+            # Files that are gone or can't be read are skipped, so this
+            # is something else (eg, a locked or corrupt digest cache)
+            show_error(f"Can't look for duplicates: {ex}", self)
+            return False
+        finally:
+            self._update_state_when_rename_cancelled()
+        if not duplicates:
+            return True
+        shown = '\n'.join(
+            ' = '.join(file.name for file in group)
+            for group in duplicates[:DUPLICATES_SHOWN]
+        )
+        more = '\n...' if len(duplicates) > DUPLICATES_SHOWN else ''
+        answer = QMessageBox.question(
+            self,
+            'Duplicate Files',
+            f'{len(duplicates)} group(s) of files have the same contents:\n\n'
+            f'{shown}{more}\n\nRename them anyway?',
+        )
+        return answer == QMessageBox.Yes
+    #:
+
+    def _naming(self) -> str | NameTemplate:
         prefix = self.prefixEdit.text()
+        # Text with braces is a naming template (see naming.py)
+        return NameTemplate(prefix) if '{' in prefix or '}' in prefix else prefix
+    #:
+
+    async def _start_renamer(self, naming: str | NameTemplate, **kargs):
+        self._batch_files = list(self._files)
+        self._batch_renamed: set[str] = set()
         self._renamer = AsyncRenamer(
-            files = tuple(self._files),
-            prefix = prefix,
+            files = self._batch_files,
+            prefix = naming,
+            throttle = RENAME_THROTTLE,
+            concurrency = RENAME_CONCURRENCY,
+            journalDir = RENAME_JOURNAL_DIR,
+            dirFds = RENAME_WITH_DIR_FDS,
             onProgressed = self._update_progress_bar,
-            onRenamedFile = self._update_state_when_file_renamed,
-            onFinished = self._update_state_when_no_files,
+            onRenamedFiles = self._update_state_when_files_renamed,
+            onMetricsUpdated = self._update_rate_label,
+            **kargs,
         )
-        await self._renamer.rename_files()
+        self._rateTimer.start()
+        try:
+            await self._renamer.rename_files()
+        finally:
+            self._rateTimer.stop()
+    #:
+
+    def _toggle_watch(self, checked: bool):
+        if checked:
+            self._start_watching()
+        else:
+            self._stop_watching()
+    #:
+
+    def _start_watching(self):
+        """
+        Renames the files loaded, if any, and then, as they arrive, the
+        new files in the directory (see `watch.FolderWatcher`), with the
+        prefix or template given. Files go on being numbered from one
+        batch to the next, and names already taken get numbered variants
+        instead of stopping the batch (nobody may be there to choose
+        another prefix).
+        """
+        try:
+            self._watch_naming = self._naming()
+            watcher = FolderWatcher(
+                self.dirEdit.text(), FILTERS_MATCHER, WATCH_STABLE_INTERVAL, self,
+            )
+            watcher.start()
+        except (OSError, TemplateError) as ex:
+            show_error(f"Can't watch directory: {ex}", self)
+            self.watchButton.setChecked(False)
+            return
+        watcher.filesArrived.connect(self._add_arrived_files)
+        self._watcher = watcher
+        self._watch_next_number = 1
+        self._watch_renamed_count = 0
+        self._update_state_while_watching()
+        if self._files:
+            self._start_watch_batch()
+    #:
+
+    def _stop_watching(self):
+        if self._watcher is None:
+            return
+        self._watcher.stop()
+        self._watcher.deleteLater()
+        self._watcher = None
+        # Otherwise, once the batch being renamed is done
+        if not self._watch_renaming:
+            self._update_state_when_watching_stopped()
+    #:
+
+    def _add_arrived_files(self, files: list[str]):
+        self._add_files(files)
+        if not self._watch_renaming:
+            self._start_watch_batch()
+    #:
+
+    def _start_watch_batch(self):
+        # Held right away (not when the slot runs), so that no other
+        # batch starts meanwhile
+        self._watch_renaming = True
+        self._watcher.hold()
+        self._rename_watched_files()
+    #:
+
+    @qasync.asyncSlot()
+    async def _rename_watched_files(self):
+        """
+        Renames the files in the list as one batch. The watcher is held
+        meanwhile, and the files that arrive are renamed in the next
+        batch.
+        """
+        # None renamed yet, if sorting fails
+        self._batch_renamed = set()
+        try:
+            ordering = ORDERINGS[self.orderComboBox.currentIndex()]
+            files = await asyncio.to_thread(
+                self._ordering.sort, self._srcFilesModel.paths(), ordering,
+            )
+            self._files = FileQueue(files)
+            self._srcFilesModel.reorder(files)
+            await self._start_renamer(
+                self._watch_naming,
+                uniqueNames = True,
+                firstNumber = self._watch_next_number,
+            )
+        except (OSError, PlanError, TemplateError) as ex:
+            show_error(f"Can't rename the new files: {ex}", self)
+            self.watchButton.setChecked(False)
+        else:
+            self._watch_next_number += len(self._batch_files)
+            if self._watcher is not None:
+                self._watcher.ignore([os.path.basename(file) for file in self._batch_renamed])
+        finally:
+            # After an error too, some files may have been renamed
+            self._watch_renamed_count += len(self._batch_renamed)
+            self._watch_renaming = False
+            # Files that couldn't be renamed are dropped (they would
+            # fail again), and so are the sort keys of the batch
+            self._files = FileQueue()
+            self._srcFilesModel.clear()
+            self._ordering.clear()
+            if self._watcher is not None:
+                self._watcher.release()
+                self.rateLabel.setText(
+                    f'Watching · {self._watch_renamed_count} files renamed'
+                )
+            else:
+                self._update_state_when_watching_stopped()
+    #:
+
+    def _update_preview(self):
+        prefix = self.prefixEdit.text()
+        template = None
+        if prefix.strip() and self.prefixEdit.isEnabled():
+            try:
+                template = (
+                    NameTemplate(prefix) if '{' in prefix or '}' in prefix
+                    else NameTemplate.for_prefix(prefix)
+                )
+                self.rateLabel.clear()
+            except TemplateError as ex:
+                self.rateLabel.setText(str(ex))
+        self._previewModel.set_template(template)
+    #:
+
+    def _show_preview_error(self, ex: Exception):
+        self.rateLabel.setText(f"Can't preview: {ex}")
     #:
 
     def _update_state_when_no_files(self):
-        self._files: deque[Path] = deque()
+        self._files = FileQueue()
+        self._ordering = FileOrdering()
         self._initial_file_count = 0     # len(self._files)
         self.loadFilesButton.setEnabled(True)
+        self.loadDirButton.setEnabled(True)
         self.loadFilesButton.setFocus()
+        self.orderComboBox.setEnabled(True)
         self.renameFilesButton.setEnabled(False)
+        self.watchButton.setEnabled(False)
         self.prefixEdit.clear()
         self.prefixEdit.setEnabled(False)
     #:
 
     def _update_state_when_files_loaded(self):
+        self.orderComboBox.setEnabled(True)
         self.prefixEdit.setEnabled(True)
         self.prefixEdit.setFocus()
         self.progressBar.setValue(0)
+        self.rateLabel.clear()
+    #:
+
+    def _update_state_when_rename_cancelled(self):
+        self.loadFilesButton.setEnabled(True)
+        self.loadDirButton.setEnabled(True)
+        self.pauseButton.setEnabled(False)
+        self.cancelButton.setEnabled(False)
+        self._update_state_when_files_loaded()
+        self._update_state_when_ready()
+        self._update_preview()
+    #:
+
+    def _toggle_pause(self):
+        if self._renamer.is_paused():
+            self._renamer.resume()
+            self.pauseButton.setText('&Pause')
+            self._rateTimer.start()
+        else:
+            self._renamer.pause()
+            self.pauseButton.setText('&Resume')
+            self._rateTimer.stop()
+            self.rateLabel.setText('Paused')
+    #:
+
+    def _cancel_rename(self):
+        self.pauseButton.setEnabled(False)
+        self.cancelButton.setEnabled(False)
+        self._renamer.cancel()
+    #:
+
+    def _update_state_when_rename_finished(self):
+        self.pauseButton.setEnabled(False)
+        self.pauseButton.setText('&Pause')
+        self.cancelButton.setEnabled(False)
+        if not self._files:
+            self._update_state_when_no_files()
+            return
+        # Cancelled (or stopped by an error): keep the files that weren't
+        # renamed, as they are on disk now. Files are reported in plan
+        # order, which isn't the order of the list if some had to wait
+        # for others, and files in the middle of a cycle are under a
+        # temporary name (the rename journal is kept, so `resume` can
+        # finish them).
+        remaining = [
+            file for file in self._batch_files
+            if str(file) not in self._batch_renamed and os.path.lexists(file)
+        ]
+        self._files = FileQueue()
+        self._srcFilesModel.clear()
+        self._add_files(remaining)
+        self._update_state_when_rename_cancelled()
+        self.rateLabel.setText(f'Cancelled after {len(self._batch_renamed)} files')
     #:
 
     def _update_state_when_ready(self):
-        self.renameFilesButton.setEnabled(
-            len(self.prefixEdit.text().strip()) > 0
-        )
+        has_prefix = len(self.prefixEdit.text().strip()) > 0
+        self.renameFilesButton.setEnabled(has_prefix and len(self._files) > 0)
+        self.watchButton.setEnabled(has_prefix and len(self.dirEdit.text()) > 0)
+    #:
+
+    def _update_state_while_loading(self):
+        self.loadFilesButton.setEnabled(False)
+        self.loadDirButton.setEnabled(False)
+        self.orderComboBox.setEnabled(False)
+        self.renameFilesButton.setEnabled(False)
+        self.watchButton.setEnabled(False)
+        self.prefixEdit.setEnabled(False)
+    #:
+
+    def _update_state_while_watching(self):
+        self.loadFilesButton.setEnabled(False)
+        self.loadDirButton.setEnabled(False)
+        self.orderComboBox.setEnabled(False)
+        self.renameFilesButton.setEnabled(False)
+        self.prefixEdit.setEnabled(False)
+        self.watchButton.setText('Stop &Watching')
+        self.rateLabel.setText('Watching')
+        # Numbers go on from batch to batch: no preview meanwhile
+        self._previewTimer.stop()
+        self._previewModel.set_template(None)
+    #:
+
+    def _update_state_when_watching_stopped(self):
+        self.watchButton.setText('&Watch')
+        self._update_state_when_rename_cancelled()
+        self.rateLabel.setText(f'{self._watch_renamed_count} files renamed while watching')
     #:
 
     def _update_state_while_renaming(self):
         self.loadFilesButton.setEnabled(False)
+        self.loadDirButton.setEnabled(False)
+        self.orderComboBox.setEnabled(False)
         self.renameFilesButton.setEnabled(False)
+        self.watchButton.setEnabled(False)
         self.prefixEdit.setEnabled(False)
+        self.pauseButton.setEnabled(True)
+        self.cancelButton.setEnabled(True)
+        # Numbers shift as files are renamed: no preview meanwhile
+        self._previewTimer.stop()
+        self._previewModel.set_template(None)
     #:
 
-    def _update_state_when_file_renamed(self, newFile: Path):
-        self._files.popleft()
-        self.srcFileList.takeItem(0)
-        self.dstFileList.addItem(str(newFile))
+    def _update_state_when_files_renamed(self, newFiles: list[Path]):
+        self._batch_renamed.update(map(str, newFiles))
+        self._files.pop_front(len(newFiles))
+        self._srcFilesModel.pop_front(len(newFiles))
+        self._dstFilesModel.extend(str(new_file) for new_file in newFiles)
     #:
 
     def _update_progress_bar(self, file_number: int):
         progress_percent = int((file_number / self._initial_file_count) * 100)
         self.progressBar.setValue(progress_percent)
     #:
-#:
\ No newline at end of file
+
+    def _update_rate_label(self, metrics: MetricsSnapshot):
+        if metrics.completed >= metrics.total:
+            text = f'{metrics.completed} files in {_format_duration(metrics.elapsed)}'
+        elif metrics.stalled:
+            text = 'Stalled'
+        elif metrics.eta is None:
+            text = ''
+        else:
+            text = f'{metrics.rate:,.0f} files/s · ETA {_format_duration(metrics.eta)}'
+        if metrics.errors:
+            text += f' · {metrics.errors} errors'
+        self.rateLabel.setText(text)
+    #:
+#:
+
+def _format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(round(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f'{hours}:{minutes:02}:{seconds:02}'
+#:
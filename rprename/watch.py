@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+# rprename/watch.py
+
+"""
+This module provides `FolderWatcher`, which watches a directory for new
+files (eg, an ingest folder that cameras or scanners keep writing to)
+and reports them once they are complete.
+
+The directory is watched with a `QFileSystemWatcher`, which gets change
+notifications from the kernel (inotify on Linux, kqueue on macOS,
+`ReadDirectoryChangesW` on Windows), so nothing is polled while the
+directory is quiet. A burst of notifications is coalesced into a single
+`os.scandir` of the directory. New files are only reported when they
+are stable: their size and modification time didn't change for
+`stableInterval` ms (files still being copied or downloaded keep
+changing). Files that become stable at the same time are reported
+together, as one micro-batch. Timers only run while some new file is
+not stable yet.
+"""
+
+import os
+import stat
+import time
+from typing import Callable
+
+from PySide6.QtCore import QFileSystemWatcher, QObject, QTimer, Signal
+
+
+__all__ = [
+    'FolderWatcher',
+]
+
+
+# A new file is stable once its size and modification time stay the
+# same for this many ms
+STABLE_INTERVAL = 2000
+
+# Notifications are coalesced for this many ms before listing the
+# directory (writing a big file notifies many times)
+SCAN_DELAY = 250
+
+class FolderWatcher(QObject):
+    """
+    Watches `dirPath` (not its subdirectories) for new regular files
+    whose names are accepted by `matcher` (all if no `matcher`), and
+    emits `filesArrived` with the paths (as `str`, sorted by name) of
+    the ones that became stable. Files in the directory when watching
+    starts, and hidden files (whose names start with a dot, as
+    temporary files often do), are never reported.
+
+    While held (see `hold`), changes are noted but the directory is
+    only listed after `release`. Names the owner creates itself (eg,
+    by renaming the reported files) are passed to `ignore`, so that
+    they aren't reported as new files.
+    """
+    filesArrived = Signal(list)
+
+    def __init__(
+            self,
+            dirPath: str | os.PathLike,
+            matcher: Callable[[str], bool] | None = None,
+            stableInterval = STABLE_INTERVAL,
+            parent: QObject | None = None,
+    ):
+        super().__init__(parent)
+        self.dirPath = os.fspath(dirPath)
+        self._matcher = matcher
+        # Names in the directory at the last listing, and the
+        # `(size, mtime_ns)` of the new files that aren't stable yet,
+        # with the (monotonic) time since when they have it
+        self._known: set[str] = set()
+        self._pending: dict[str, tuple[tuple[int, int], float]] = {}
+        self._stable_interval = stableInterval / 1000
+        self._held = False
+        self._changed = False
+        self._watcher = QFileSystemWatcher(self)
+        self._watcher.directoryChanged.connect(self._on_directory_changed)
+        self._scanTimer = QTimer(self)
+        self._scanTimer.setSingleShot(True)
+        self._scanTimer.setInterval(SCAN_DELAY)
+        self._scanTimer.timeout.connect(self._scan)
+        self._stableTimer = QTimer(self)
+        self._stableTimer.setSingleShot(True)
+        self._stableTimer.timeout.connect(self._check_pending)
+    #:
+
+    def start(self):
+        """
+        Starts watching. Raises `OSError` if the directory can't be
+        listed or watched.
+        """
+        with os.scandir(self.dirPath) as entries:
+            self._known = {entry.name for entry in entries}
+        if not self._watcher.addPath(self.dirPath):
+            raise OSError(f"Can't watch directory {self.dirPath}")
+    #:
+
+    def stop(self):
+        self._watcher.removePaths(self._watcher.directories())
+        self._scanTimer.stop()
+        self._stableTimer.stop()
+        self._pending.clear()
+        self._changed = False
+    #:
+
+    def hold(self):
+        self._held = True
+        self._scanTimer.stop()
+        self._stableTimer.stop()
+    #:
+
+    def release(self):
+        self._held = False
+        if self._changed:
+            self._scanTimer.start()
+        else:
+            self._schedule_check()
+    #:
+
+    def ignore(self, names: list[str]):
+        self._known.update(names)
+    #:
+
+    def _on_directory_changed(self, _: str):
+        self._changed = True
+        if not self._held and not self._scanTimer.isActive():
+            self._scanTimer.start()
+    #:
+
+    def _scan(self):
+        self._changed = False
+        try:
+            with os.scandir(self.dirPath) as entries:
+                names = {entry.name for entry in entries}
+        except OSError:
+            # Gone or unreadable: wait for the next change
+            return
+        matcher = self._matcher
+        now = time.monotonic()
+        for name in names - self._known:
+            if name.startswith('.') or (matcher is not None and not matcher(name)):
+                continue
+            if name not in self._pending:
+                signature = _signature(os.path.join(self.dirPath, name))
+                if signature is not None:
+                    self._pending[name] = (signature, now)
+        # Names that are gone are forgotten, so that a new file with
+        # the same name is noticed
+        self._known = names
+        for name in [name for name in self._pending if name not in names]:
+            del self._pending[name]
+        self._schedule_check()
+    #:
+
+    def _check_pending(self):
+        """
+        Reports the pending files whose signature didn't change for
+        `stableInterval` ms, and checks the others again later.
+        """
+        stable = []
+        now = time.monotonic()
+        for name, (signature, since) in list(self._pending.items()):
+            if now - since < self._stable_interval:
+                continue
+            path = os.path.join(self.dirPath, name)
+            if (new_signature := _signature(path)) is None:
+                del self._pending[name]
+            elif new_signature == signature:
+                del self._pending[name]
+                stable.append(path)
+            else:
+                self._pending[name] = (new_signature, now)
+        self._schedule_check()
+        if stable:
+            stable.sort()
+            self.filesArrived.emit(stable)
+    #:
+
+    def _schedule_check(self):
+        """
+        Checks the pending files again when the first of them is due (if
+        not held, and not scheduled already).
+        """
+        if not self._pending or self._held or self._stableTimer.isActive():
+            return
+        due = min(since for _, since in self._pending.values()) + self._stable_interval
+        self._stableTimer.start(max(0, round((due - time.monotonic()) * 1000)))
+    #:
+#:
+
+def _signature(path: str) -> tuple[int, int] | None:
+    """`(size, mtime_ns)` of the regular file at `path` (or `None`)."""
+    try:
+        file_stat = os.stat(path)
+    except OSError:
+        return None
+    if not stat.S_ISREG(file_stat.st_mode):
+        return None
+    return file_stat.st_size, file_stat.st_mtime_ns
+#:
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# tests/test_journal.py
+
+"""
+Tests for `rprename/journal.py`: batches interrupted at any step are
+resumed to the same result as uninterrupted ones.
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from rprename.journal import RenameJournal
+from rprename.planner import TEMP_NAME_PREFIX, plan_renames
+
+
+def make_batch(dir_path: Path) -> list[tuple[Path, Path]]:
+    """
+    A cycle (`a -> b -> c -> a`) and a chain (`d -> e -> f`). Each file
+    contains its original name.
+    """
+    for name in 'abcde':
+        (dir_path / name).write_text(name)
+    return [
+        (dir_path / src, dir_path / dst)
+        for src, dst in (('a', 'b'), ('b', 'c'), ('c', 'a'), ('d', 'e'), ('e', 'f'))
+    ]
+#:
+
+def contents(dir_path: Path) -> dict[str, str]:
+    return {path.name: path.read_text() for path in dir_path.iterdir()}
+#:
+
+def run(steps):
+    for src, dst, _ in steps:
+        os.rename(src, dst)
+#:
+
+EXPECTED = {'b': 'a', 'c': 'b', 'a': 'c', 'e': 'd', 'f': 'e'}
+
+@pytest.mark.parametrize('steps_done', range(7))
+def test_resume_after_crash(tmp_path: Path, steps_done: int):
+    files_dir = tmp_path / 'files'
+    files_dir.mkdir()
+    steps = list(plan_renames(make_batch(files_dir)).steps)
+    assert len(steps) == 6          # the cycle needs a temporary move
+    journal = RenameJournal.create(steps, tmp_path / 'journals')
+    # Killed after `steps_done` renames, before any completion record
+    # was committed
+    run(steps[:steps_done])
+    journal.close(completed = False)
+
+    resumed = RenameJournal.open(journal.path)
+    run(resumed.pending_steps())
+    resumed.close(completed = True)
+
+    assert contents(files_dir) == EXPECTED
+    assert not journal.path.exists()
+#:
+
+def test_resume_after_completed_cycle_with_records(tmp_path: Path):
+    files_dir = tmp_path / 'files'
+    files_dir.mkdir()
+    steps = list(plan_renames(make_batch(files_dir)).steps)
+    journal = RenameJournal.create(steps, tmp_path / 'journals')
+    # Only final steps are recorded, so the temporary move isn't
+    for step in steps:
+        os.rename(step.src, step.dst)
+        if step.final:
+            journal.record_done(step.dst)
+    journal.close(completed = False)
+
+    resumed = RenameJournal.open(journal.path)
+    assert list(resumed.pending_steps()) == []
+    resumed.close(completed = True)
+    assert contents(files_dir) == EXPECTED
+#:
+
+def test_temp_files_left(tmp_path: Path):
+    files_dir = tmp_path / 'files'
+    files_dir.mkdir()
+    steps = list(plan_renames(make_batch(files_dir)).steps)
+    journal = RenameJournal.create(steps, tmp_path / 'journals')
+    temp_step = next(step for step in steps if not step.final)
+    assert temp_step.dst.name.startswith(TEMP_NAME_PREFIX)
+    assert not journal.temp_files_left()
+    os.rename(temp_step.src, temp_step.dst)
+    assert journal.temp_files_left()
+    journal.close(completed = False)
+#:
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# tests/test_planner.py
+
+"""
+Tests for `rprename/planner.py`.
+"""
+
+import os
+from pathlib import Path
+
+import pytest
+
+from rprename.planner import PlanError, plan_renames
+
+
+def make_files(dir_path: Path, names: str) -> list[Path]:
+    paths = []
+    for name in names:
+        (path := dir_path / name).write_text(name)
+        paths.append(path)
+    return paths
+#:
+
+def test_chain_runs_blocked_steps_later(tmp_path: Path):
+    a, b = make_files(tmp_path, 'ab')
+    plan = plan_renames([(a, b), (b, tmp_path / 'c')])
+    assert [[step.src.name for step in phase] for phase in plan.phases] == [['b'], ['a']]
+    assert len(plan) == 2
+#:
+
+def test_cycle_is_broken_with_a_temporary_move(tmp_path: Path):
+    a, b, c = make_files(tmp_path, 'abc')
+    plan = plan_renames([(a, b), (b, c), (c, a)])
+    steps = list(plan.steps)
+    assert [step.final for step in steps].count(False) == 1
+    assert len(plan) == 3
+    for src, dst, _ in steps:
+        os.rename(src, dst)
+    assert {path.name: path.read_text() for path in tmp_path.iterdir()} == {
+        'b': 'a', 'c': 'b', 'a': 'c',
+    }
+#:
+
+def test_conflicts_are_reported(tmp_path: Path):
+    a, b, c = make_files(tmp_path, 'abc')
+    with pytest.raises(PlanError) as info:
+        plan_renames([(a, c), (b, tmp_path / 'd'), (b, tmp_path / 'e')])
+    assert len(info.value.conflicts) == 2       # 'c' exists, 'b' twice
+#:
+
+def test_unique_names_resolve_conflicts(tmp_path: Path):
+    a, b, c = make_files(tmp_path, 'abc')
+    plan = plan_renames([(a, c), (b, c)], unique_names = True)
+    assert [step.dst.name for step in plan.steps] == ['c_2', 'c_3']
+#: